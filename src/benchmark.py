@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+from instrumentacion import resource, rss_actual_mb, rss_pico_mb, reiniciar_pico_rss
+
+# --- Configuración ---
+# Suite de benchmarks sobre datos sintéticos (datos_sinteticos.py). Cada caso corre
+# en un proceso nuevo, con el directorio de trabajo en un directorio temporal que
+# replica ./data, y mide el tiempo y el pico de memoria solo de la función medida
+# (la preparación de datos del caso queda afuera). Los resultados se guardan en JSON
+# para comparar corridas.
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+IPC_PATH = os.path.join(SRC_DIR, '..', 'data', 'ipc.csv')
+BENCHMARKS_DIR = './data/benchmarks'
+BENCHMARK_YEARS = [2023]
+
+# En orden: los casos de carga de sanitizados usan lo que genera sanitize
+CASOS = [
+    'load_eph_data',
+    'sanitize_and_filter_eph',
+    'sanitize_and_filter_eph_completo',
+    'load_sanitized_eph_data',
+    'calcular_tasa_empleo_por_aglomerado',
+    'deflacionar_ingresos',
+]
+
+
+def preparar_caso(caso, years):
+    """
+    Prepara los datos del caso (sin medir) y devuelve (función a medir, función que
+    cuenta las filas de su resultado).
+    """
+    if caso == 'load_eph_data':
+        from sanitize import load_eph_data, get_data_file_name_from_zip
+        from datos_sinteticos import nombre_zip
+        zip_path = os.path.join('./data', nombre_zip(years[0], 1))
+        internal = get_data_file_name_from_zip(zip_path)
+        return (lambda: load_eph_data(zip_path, internal)), len
+
+    if caso.startswith('sanitize_and_filter_eph'):
+        from sanitize import sanitize_and_filter_eph, CHUNK_SIZE
+        chunksize = None if caso.endswith('_completo') else CHUNK_SIZE
+        return (lambda: sanitize_and_filter_eph(min(years), max(years), force=True,
+                                                chunksize=chunksize)), None
+
+    from utils import load_sanitized_eph_data
+    if caso == 'load_sanitized_eph_data':
+        return (lambda: load_sanitized_eph_data(years=years)), len
+
+    if caso == 'calcular_tasa_empleo_por_aglomerado':
+        from evolucion_media import COLUMNAS_TASAS, calcular_tasa_empleo_por_aglomerado
+        df = load_sanitized_eph_data(columns=COLUMNAS_TASAS, years=years)
+        return (lambda: calcular_tasa_empleo_por_aglomerado(None, df)), (lambda _: len(df))
+
+    if caso == 'deflacionar_ingresos':
+        from media_ingresos import COLUMNAS_INGRESOS, deflacionar_ingresos
+        df = load_sanitized_eph_data(columns=COLUMNAS_INGRESOS, years=years)
+        return (lambda: deflacionar_ingresos(df)), len
+
+    raise ValueError(f"Caso de benchmark desconocido: {caso}")
+
+
+def ejecutar_caso(caso, years):
+    """Corre un caso en este proceso y devuelve sus métricas."""
+    funcion, contar_filas = preparar_caso(caso, years)
+
+    # Pico de memoria de la función medida, con la mejor medición disponible:
+    # Linux reinicia el pico de RSS; otros Unix usan ru_maxrss (no se puede reiniciar,
+    # así que si la preparación usó más memoria el incremento queda en 0);
+    # sin 'resource' (Windows) se usa tracemalloc.
+    if reiniciar_pico_rss():
+        medicion, rss_inicial = 'vmhwm', rss_actual_mb()
+    elif resource is not None:
+        medicion, rss_inicial = 'ru_maxrss', rss_pico_mb()
+    else:
+        import tracemalloc
+        medicion = 'tracemalloc'
+        tracemalloc.start()
+
+    inicio = time.perf_counter()
+    resultado = funcion()
+    segundos = time.perf_counter() - inicio
+
+    metricas = {'caso': caso, 'segundos': round(segundos, 4), 'medicion_memoria': medicion}
+    if medicion == 'tracemalloc':
+        metricas['memoria_pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    else:
+        rss_pico = rss_pico_mb()
+        metricas['memoria_pico_mb'] = round(max(rss_pico - rss_inicial, 0), 1)
+        metricas['rss_pico_mb'] = round(rss_pico, 1)
+    metricas['filas'] = contar_filas(resultado) if contar_filas and resultado is not None else None
+    return metricas
+
+
+def correr_en_subproceso(caso, years, workdir):
+    """Corre un caso en un intérprete nuevo (pico de memoria propio) dentro de workdir."""
+    comando = [sys.executable, os.path.abspath(__file__), '--run-case', caso,
+               '--years', *map(str, years)]
+    salida = subprocess.run(comando, cwd=workdir, capture_output=True, text=True)
+    if salida.returncode != 0:
+        print(f"ERROR en el caso {caso}:\n{salida.stderr[-2000:]}")
+        return None
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def preparar_workdir(workdir, years, escala):
+    """Genera los ZIP sintéticos (si faltan) y copia el IPC en workdir/data."""
+    from datos_sinteticos import generar_trimestre, nombre_zip
+
+    data_dir = os.path.join(workdir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    shutil.copy(IPC_PATH, os.path.join(data_dir, 'ipc.csv'))
+    for year in years:
+        for trim in (1, 2, 3, 4):
+            if not os.path.exists(os.path.join(data_dir, nombre_zip(year, trim))):
+                zip_path, personas = generar_trimestre(year, trim, escala, data_dir)
+                print(f"Generado {zip_path}: {personas:,} personas")
+
+
+def comparar(resultados, anteriores_path):
+    """Imprime la relación de tiempo y memoria contra una corrida anterior."""
+    with open(anteriores_path, 'r', encoding='utf-8') as f:
+        anteriores = {r['caso']: r for r in json.load(f)['resultados']}
+    print(f"\n--- Comparación con {anteriores_path} ---")
+    for r in resultados:
+        previo = anteriores.get(r['caso'])
+        if previo is None:
+            continue
+        tiempo = r['segundos'] / previo['segundos'] if previo['segundos'] else float('nan')
+        print(f"{r['caso']:<38} tiempo x{tiempo:.2f}  memoria "
+              f"{previo['memoria_pico_mb']:.0f} -> {r['memoria_pico_mb']:.0f} MB")
+
+
+def correr_benchmarks(escala=1.0, years=BENCHMARK_YEARS, casos=CASOS, repeticiones=1,
+                      workdir=None, output=None, comparar_con=None, conservar=False):
+    """
+    Corre los casos de benchmark y guarda los resultados en JSON. Con varias
+    repeticiones se guarda la de menor tiempo de cada caso. Sin 'workdir' se usa un
+    directorio temporal que se borra al terminar, salvo con conservar=True.
+    """
+    temporal = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='eph_benchmark_')
+    print(f"--- Benchmark EPH (escala {escala}x, años {years}) en {workdir} ---")
+    resultados = []
+    try:
+        preparar_workdir(workdir, years, escala)
+        for caso in [c for c in CASOS if c in casos]:
+            corridas = [correr_en_subproceso(caso, years, workdir) for _ in range(repeticiones)]
+            corridas = [c for c in corridas if c is not None]
+            if not corridas:
+                continue
+            mejor = min(corridas, key=lambda c: c['segundos'])
+            resultados.append(mejor)
+            print(f"{caso:<38} {mejor['segundos']:>8.3f}s  {mejor['memoria_pico_mb']:>8.1f} MB  "
+                  f"filas: {mejor['filas'] if mejor['filas'] is not None else '-'}")
+    finally:
+        # Los datos sintéticos de una escala grande pueden ocupar varios GB
+        if temporal and not conservar:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif temporal:
+            print(f"Directorio de trabajo conservado en: {workdir}")
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    reporte = {
+        'metadata': {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'escala': escala,
+            'years': list(years),
+            'repeticiones': repeticiones,
+        },
+        'resultados': resultados,
+    }
+    if output is None:
+        os.makedirs(BENCHMARKS_DIR, exist_ok=True)
+        output = os.path.join(
+            BENCHMARKS_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}_x{escala:g}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, indent=2)
+    print(f"--- Resultados guardados en: {output} ---")
+
+    if comparar_con:
+        comparar(resultados, comparar_con)
+    return reporte
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmarks de tiempo y memoria del pipeline EPH con datos sintéticos.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Tamaño de cada trimestre relativo a uno nacional (1 a 50).")
+    parser.add_argument('--years', type=int, nargs='+', default=BENCHMARK_YEARS)
+    parser.add_argument('--cases', nargs='+', choices=CASOS, default=CASOS)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workdir', help="Directorio de trabajo (por defecto, uno temporal).")
+    parser.add_argument('--keep', action='store_true',
+                        help="No borra el directorio de trabajo temporal al terminar.")
+    parser.add_argument('--output', help="Archivo JSON de resultados.")
+    parser.add_argument('--compare', help="JSON de una corrida anterior para comparar.")
+    parser.add_argument('--run-case', choices=CASOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        # Modo interno: un caso por proceso, imprime las métricas en JSON
+        sys.path.insert(0, SRC_DIR)
+        metricas = ejecutar_caso(args.run_case, args.years)
+        print(json.dumps(metricas))
+    else:
+        correr_benchmarks(escala=args.scale, years=args.years, casos=args.cases,
+                          repeticiones=args.repeat, workdir=args.workdir,
+                          output=args.output, comparar_con=args.compare,
+                          conservar=args.keep)
@@ -0,0 +1,180 @@
+import pandas as pd
+import os
+import json
+import hashlib
+import tempfile
+from itertools import product
+
+from manifest import MANIFEST_PATH, load_manifest, is_file_current, sha256_file
+from utils import (START_YEAR, END_YEAR, AGLOMERADOS_INTERES, find_sanitized_files,
+                   clave_particion, load_sanitized_eph_data, periodos_fallidos)
+
+# --- Configuración ---
+# Resultados por trimestre de cada indicador. Por indicador y definición se guardan:
+#   {nombre}_{hash_definicion}.parquet  filas de resultado de todos los trimestres
+#   {nombre}_{hash_definicion}.json     {"AAAA-T": hashes de las particiones de origen}
+# Los aglomerados forman parte de la definición: cada conjunto de aglomerados tiene
+# su propia entrada y solo depende de las particiones de esos aglomerados.
+CACHE_DIR = './data/cache_indicadores'
+
+
+def hash_definicion(definicion):
+    """Hash corto y estable de la definición de un indicador (dict serializable a JSON)."""
+    texto = json.dumps(definicion, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:12]
+
+
+def hash_archivo_sanitizado(filepath, manifest):
+    """
+    SHA-256 del archivo sanitizado. Se toma del manifiesto si el archivo no cambió
+    desde que se registró; si no, se calcula.
+    """
+    key = clave_particion(filepath)
+    if is_file_current(manifest, 'sanitized', key, filepath):
+        return manifest['sanitized'][key]['sha256']
+    return sha256_file(filepath)
+
+
+def _rutas_cache(nombre, definicion):
+    base = os.path.join(CACHE_DIR, f"{nombre}_{hash_definicion(definicion)}")
+    return base + '.parquet', base + '.json'
+
+
+def _leer_cache(nombre, definicion):
+    """Devuelve (resultados, índice de hashes) del indicador; vacíos si no hay caché."""
+    datos_path, indice_path = _rutas_cache(nombre, definicion)
+    if not (os.path.exists(datos_path) and os.path.exists(indice_path)):
+        return None, {}
+    try:
+        with open(indice_path, 'r', encoding='utf-8') as f:
+            indice = json.load(f)
+        return pd.read_parquet(datos_path), indice
+    except Exception as e:
+        print(f"Advertencia: caché de {nombre} ilegible ({e}). Se recalcula.")
+        return None, {}
+
+
+def _reemplazar(path, escribir):
+    """
+    Escribe 'path' con escribir(ruta_temporal) y lo reemplaza de forma atómica. El
+    temporal tiene nombre único, así dos procesos o hilos que guardan el mismo
+    indicador no escriben sobre el mismo archivo.
+    """
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.',
+                                     suffix='.tmp', delete=False) as f:
+        tmp_path = f.name
+    try:
+        escribir(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _guardar_cache(nombre, definicion, resultados, indice):
+    """Guarda resultados e índice con escritura atómica."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    datos_path, indice_path = _rutas_cache(nombre, definicion)
+
+    def escribir_indice(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(indice, f, indent=2, sort_keys=True)
+
+    _reemplazar(datos_path, lambda tmp_path: resultados.to_parquet(tmp_path, index=False))
+    _reemplazar(indice_path, escribir_indice)
+
+
+def obtener_indicador_por_trimestre(nombre, definicion, calcular, columnas=None,
+                                    years=None, trimesters=None, bases=('personas',),
+                                    cargar=None, aglomerados=None):
+    """
+    Devuelve la serie de un indicador armada desde la caché por trimestre.
+
+    'calcular' recibe el DataFrame de uno o más trimestres (con 'columnas') y devuelve
+    filas con ANO4 y TRIMESTRE. Solo se recalculan los trimestres nuevos o en los que
+    cambió alguna partición de los 'aglomerados' (por defecto AGLOMERADOS_INTERES),
+    según su SHA-256; un cambio en 'definicion' (versión del cálculo, parámetros,
+    insumos externos) o en los aglomerados usa otra entrada de caché.
+
+    Para indicadores que usan más de una base (p. ej. personas y hogares), 'bases'
+    lista las bases cuyos archivos invalidan la caché y 'cargar' recibe los periodos
+    pendientes y los aglomerados y devuelve el DataFrame a pasar a 'calcular'.
+
+    Los trimestres con particiones que no se pudieron leer (attrs['periodos_fallidos']
+    del DataFrame cargado) se devuelven igual pero no se marcan como vigentes en la
+    caché: se vuelven a calcular en la próxima llamada. Si la carga de los pendientes
+    falla por completo, se devuelven los trimestres vigentes de la caché y los
+    pendientes quedan en attrs['periodos_fallidos'] (None si no hay ninguno vigente).
+    """
+    years = range(START_YEAR, END_YEAR + 1) if years is None else years
+    trimesters = [1, 2, 3, 4] if trimesters is None else trimesters
+    aglomerados = sorted(set(AGLOMERADOS_INTERES if aglomerados is None else aglomerados))
+    definicion = {**definicion, 'aglomerados': aglomerados}
+
+    # 1. Hash de entrada de cada trimestre disponible
+    manifest = load_manifest(MANIFEST_PATH)
+    hashes = {}
+    for year, trim in product(years, trimesters):
+        filepaths = [find_sanitized_files(year, trim, base, aglomerados) for base in bases]
+        if all(filepaths):
+            hashes[(year, trim)] = '+'.join(hash_archivo_sanitizado(f, manifest)
+                                            for archivos in filepaths for f in archivos)
+
+    if not hashes:
+        print("ADVERTENCIA: No hay trimestres sanitizados para calcular el indicador.")
+        return None
+
+    # 2. Trimestres nuevos o invalidados
+    resultados, indice = _leer_cache(nombre, definicion)
+    pendientes = [p for p, h in hashes.items() if indice.get(f"{p[0]}-{p[1]}") != h]
+
+    if pendientes:
+        print(
+            f"Indicador {nombre}: recalculando {len(pendientes)} de {len(hashes)} trimestres.")
+        if cargar is None:
+            df = load_sanitized_eph_data(columns=columnas, periodos=pendientes,
+                                         aglomerados=aglomerados)
+        else:
+            df = cargar(pendientes, aglomerados)
+        if df is None:
+            # Los trimestres pendientes siguen pendientes; se devuelven los vigentes de la caché
+            print(f"ADVERTENCIA: {nombre}: no se pudieron cargar "
+                  f"{', '.join(f'T{t}/{y}' for y, t in pendientes)}; quedan pendientes.")
+            vigentes = [p for p in hashes if p not in pendientes]
+            if resultados is None or not vigentes:
+                return None
+            periodos_resultados = pd.MultiIndex.from_arrays(
+                [resultados['ANO4'], resultados['TRIMESTRE']])
+            resultados = resultados[periodos_resultados.isin(vigentes)].reset_index(drop=True)
+            resultados.attrs['periodos_fallidos'] = sorted(pendientes)
+            return resultados
+        nuevos = calcular(df)
+
+        # Reemplazar en la caché las filas de los trimestres recalculados
+        if resultados is not None:
+            periodos_resultados = pd.MultiIndex.from_arrays(
+                [resultados['ANO4'], resultados['TRIMESTRE']])
+            resultados = resultados[~periodos_resultados.isin(pendientes)]
+            resultados = pd.concat([resultados, nuevos], ignore_index=True)
+        else:
+            resultados = nuevos
+        resultados = resultados.sort_values(
+            ['ANO4', 'TRIMESTRE'], kind='stable').reset_index(drop=True)
+
+        fallidos = periodos_fallidos(df)
+        if fallidos:
+            print(f"ADVERTENCIA: {nombre}: resultados incompletos (no se guardan en la caché) "
+                  f"para {', '.join(f'T{t}/{y}' for y, t in fallidos)}.")
+        for year, trim in pendientes:
+            if (year, trim) in fallidos:
+                indice.pop(f"{year}-{trim}", None)
+            else:
+                indice[f"{year}-{trim}"] = hashes[(year, trim)]
+        _guardar_cache(nombre, definicion, resultados, indice)
+    else:
+        print(f"Indicador {nombre}: {len(hashes)} trimestres desde la caché.")
+
+    # 3. Serie de los trimestres pedidos
+    periodos_resultados = pd.MultiIndex.from_arrays(
+        [resultados['ANO4'], resultados['TRIMESTRE']])
+    return resultados[periodos_resultados.isin(list(hashes))].reset_index(drop=True)
@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# --- Configuración ---
+# Punto de entrada único del proyecto. Cada subcomando importa sus módulos recién al
+# ejecutarse, así 'indicators' o 'sanitize' no cargan matplotlib/seaborn/geopandas ni
+# requests. Por eso aquí solo se importa la biblioteca estándar, y los valores por
+# defecto de cada módulo se respetan pasando solo los argumentos indicados.
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Módulos que importa cada subcomando (los usa también el benchmark de arranque)
+MODULOS_SUBCOMANDO = {
+    'scrape': ['scraper'],
+    'sanitize': ['sanitize'],
+    'geometries': ['geometrias'],
+    'indicators': ['evolucion_media', 'media_ingresos'],
+    'panel': ['panel'],
+    'serve': ['servicio'],
+    'report': ['motor_indicadores'],
+    'plot': ['graficos'],
+    'validate': ['test'],
+}
+# Bibliotecas de gráficos que no deben cargarse fuera de 'plot'
+MODULOS_GRAFICOS = ('matplotlib', 'seaborn', 'geopandas')
+INDICADORES_DIR = './data/indicadores'
+
+
+def _argumentos(args, *nombres):
+    """Devuelve {nombre: valor} de los argumentos indicados en la línea de comandos."""
+    return {n: getattr(args, n) for n in nombres if getattr(args, n) is not None}
+
+
+def cmd_scrape(args):
+    from scraper import scrape_and_download
+    scrape_and_download(**_argumentos(args, 'start_year', 'end_year', 'workers'))
+
+
+def cmd_sanitize(args):
+    from sanitize import sanitize_and_filter_eph
+    kwargs = _argumentos(args, 'start_year', 'end_year', 'workers', 'output_format')
+    if args.chunksize is not None:
+        kwargs['chunksize'] = args.chunksize or None
+    sanitize_and_filter_eph(force=args.force, **kwargs)
+
+
+def cmd_geometries(args):
+    from geometrias import preparar_geometrias
+    kwargs = {'tolerancia': args.tolerance} if args.tolerance is not None else {}
+    preparar_geometrias(force=args.force, **kwargs)
+
+
+def _rango_de_anios(args):
+    """range de años de --start-year/--end-year, o None si no se indicó ninguno."""
+    if args.start_year is None and args.end_year is None:
+        return None
+    from utils import START_YEAR, END_YEAR
+    return range(args.start_year or START_YEAR, (args.end_year or END_YEAR) + 1)
+
+
+def cmd_panel(args):
+    from panel import construir_panel
+    years = _rango_de_anios(args)
+    kwargs = {'years': years} if years is not None else {}
+    construir_panel(aglomerados=args.aglomerados, force=args.force, **kwargs)
+
+
+def cmd_serve(args):
+    from servicio import servir
+    years = _rango_de_anios(args)
+    kwargs = {'years': years} if years is not None else {}
+    kwargs.update(_argumentos(args, 'host', 'max_entradas', 'intervalo'))
+    if args.port is not None:
+        kwargs['puerto'] = args.port
+    servir(**kwargs)
+
+
+def cmd_report(args):
+    from motor_indicadores import (INDICADORES_INFORME, INFORME_PATH, cargar_definiciones,
+                                   informe_desde_panel)
+    definiciones = cargar_definiciones(args.definitions) if args.definitions \
+        else INDICADORES_INFORME
+    if definiciones is None:
+        sys.exit(1)
+    informe = informe_desde_panel(definiciones, years=_rango_de_anios(args),
+                                  aglomerados=args.aglomerados)
+    if informe is None:
+        sys.exit(1)
+    path = args.output or INFORME_PATH
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    informe.to_csv(path, index=False)
+    print(f"Informe de {informe['Indicador'].nunique()} indicadores guardado en: {path}")
+
+
+def cmd_indicators(args):
+    years = _rango_de_anios(args)
+    if args.panel:
+        import panel
+        from utils import AGLOMERADOS_INTERES
+        datos = panel.abrir_panel()
+        if datos is None:
+            sys.exit(1)
+        datos = datos.seleccionar(years=years,
+                                  aglomerados=args.aglomerados or AGLOMERADOS_INTERES)
+        series = {
+            'tasas_laborales': panel.tasas_empleo(datos),
+            'media_ingreso_real': panel.media_ingreso_real(datos),
+            'media_ipcf_real': panel.media_ipcf_real(datos),
+        }
+    else:
+        from evolucion_media import serie_tasas_empleo
+        from media_ingresos import serie_media_ingreso_real, serie_media_ipcf_real
+        series = {
+            'tasas_laborales': serie_tasas_empleo(years=years, aglomerados=args.aglomerados),
+            'media_ingreso_real': serie_media_ingreso_real(years=years,
+                                                           aglomerados=args.aglomerados),
+            'media_ipcf_real': serie_media_ipcf_real(years=years, aglomerados=args.aglomerados),
+        }
+    for nombre, df in series.items():
+        if df is None:
+            continue
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            path = os.path.join(args.output, f"{nombre}.csv")
+            df.to_csv(path, index=False)
+            print(f"Indicador {nombre} guardado en: {path}")
+        else:
+            print(df.to_string(index=False))
+
+
+def cmd_plot(args):
+    if args.choropleth:
+        from coropletas import renderizar_coropletas, cargar_unidades
+        if args.choropleth == 'Media_Ingreso_Real':
+            from media_ingresos import serie_media_ingreso_real
+            df_indicador = serie_media_ingreso_real()
+        else:
+            from evolucion_media import serie_tasas_empleo
+            df_indicador = serie_tasas_empleo()
+        if df_indicador is not None:
+            kwargs = {'salida_dir': args.output} if args.output else {}
+            if args.format:
+                kwargs['formatos'] = tuple(args.format)
+            if args.units:
+                kwargs['unidades'] = cargar_unidades(args.units)
+                if kwargs['unidades'] is None:
+                    return
+            archivos = renderizar_coropletas(df_indicador, args.choropleth, **kwargs)
+            print(f"--- Mapas generados: {len(archivos)} ---")
+        return
+
+    import graficos
+    if args.interactive:
+        graficos.graficar()
+    else:
+        kwargs = _argumentos(args, 'workers')
+        if args.output:
+            kwargs['salida_dir'] = args.output
+        if args.format:
+            kwargs['formatos'] = tuple(args.format)
+        graficos.renderizar_graficos(force=args.force, **kwargs)
+
+
+def cmd_validate(args):
+    from test import calculate_employment_rate_caba_women
+    if calculate_employment_rate_caba_women() is None:
+        sys.exit(1)
+
+
+def cmd_benchmark(args):
+    from benchmark import correr_benchmarks
+    kwargs = _argumentos(args, 'years', 'workdir', 'output')
+    correr_benchmarks(escala=args.scale, repeticiones=args.repeat,
+                      comparar_con=args.compare, conservar=args.keep, **kwargs)
+
+
+def medir_importacion(modulos):
+    """
+    Importa 'modulos' en un intérprete nuevo y devuelve los segundos que tarda y las
+    bibliotecas de gráficos que quedaron cargadas.
+    """
+    codigo = (
+        "import sys, time, json\n"
+        f"sys.path.insert(0, {SRC_DIR!r})\n"
+        "inicio = time.perf_counter()\n"
+        f"for m in {modulos!r}: __import__(m)\n"
+        "segundos = time.perf_counter() - inicio\n"
+        f"graficos = [m for m in {MODULOS_GRAFICOS!r} if m in sys.modules]\n"
+        "print(json.dumps({'segundos': segundos, 'graficos': graficos}))\n"
+    )
+    salida = subprocess.run([sys.executable, '-c', codigo], capture_output=True,
+                            text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def cmd_benchmark_startup(args):
+    """
+    Mide el tiempo de importación de cada subcomando (el mejor de 'repeat' corridas,
+    cada una en un proceso nuevo) y verifica que solo 'plot' cargue bibliotecas de
+    gráficos. Sale con código 1 si otro subcomando las carga.
+    """
+    resultados = {}
+    for subcomando, modulos in MODULOS_SUBCOMANDO.items():
+        corridas = [medir_importacion(modulos) for _ in range(args.repeat)]
+        resultados[subcomando] = {
+            'modulos': modulos,
+            'segundos': min(c['segundos'] for c in corridas),
+            'graficos': corridas[0]['graficos'],
+        }
+
+    print(f"\n{'Subcomando':<12} {'Import (s)':>10}  Bibliotecas de gráficos")
+    for subcomando, r in resultados.items():
+        print(f"{subcomando:<12} {r['segundos']:>10.3f}  {', '.join(r['graficos']) or '-'}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, indent=2)
+        print(f"Resultados guardados en: {args.json}")
+
+    con_graficos = [s for s, r in resultados.items() if s != 'plot' and r['graficos']]
+    if con_graficos:
+        print(f"ERROR: cargan bibliotecas de gráficos: {', '.join(con_graficos)}")
+        sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Informe EPH: descarga, sanitización, indicadores y gráficos.")
+    parser.add_argument('--instrument', metavar='JSON',
+                        help="Mide cada etapa (tiempo, filas, bytes, memoria), imprime un "
+                             "resumen y guarda los registros en este archivo JSON.")
+    parser.add_argument('--stage-log', metavar='JSONL',
+                        help="Agrega una línea JSON por etapa medida a este archivo.")
+    parser.add_argument('--profile', metavar='ETAPA',
+                        choices=['http', 'unzip', 'parse', 'filter', 'write', 'load',
+                                 'concat', 'join', 'aggregate', 'render'],
+                        help="Perfila todas las ejecuciones de una etapa (guarda el perfil "
+                             "en ./data/perfiles).")
+    parser.add_argument('--profiler', choices=['cprofile', 'pyinstrument'], default='cprofile',
+                        help="pyinstrument solo perfila el hilo principal: las etapas 'load' "
+                             "y 'http', que corren en pools de hilos, requieren cprofile.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def rango_de_anios(sub):
+        sub.add_argument('--start-year', type=int)
+        sub.add_argument('--end-year', type=int)
+
+    sub = subparsers.add_parser('scrape', help="Descarga los ZIP de microdatos del INDEC.")
+    rango_de_anios(sub)
+    sub.add_argument('--workers', type=int, help="Descargas en paralelo.")
+    sub.set_defaults(func=cmd_scrape)
+
+    sub = subparsers.add_parser('sanitize', help="Filtra y tipa los trimestres descargados.")
+    rango_de_anios(sub)
+    sub.add_argument('--workers', type=int,
+                     help="Cantidad de procesos para sanitizar trimestres en paralelo.")
+    sub.add_argument('--force', action='store_true',
+                     help="Reprocesa todos los trimestres aunque no hayan cambiado.")
+    sub.add_argument('--format', dest='output_format', choices=['parquet', 'csv'],
+                     help="Formato de los archivos sanitizados.")
+    sub.add_argument('--chunksize', type=int,
+                     help="Filas por bloque al filtrar en streaming (0 = cargar el archivo completo).")
+    sub.set_defaults(func=cmd_sanitize)
+
+    sub = subparsers.add_parser('geometries',
+                                help="Convierte el GeoJSON de radios en GeoParquet por aglomerado.")
+    sub.add_argument('--tolerance', type=float,
+                     help="Tolerancia de simplificación (unidades del CRS).")
+    sub.add_argument('--force', action='store_true',
+                     help="Regenera la caché aunque el GeoJSON no haya cambiado.")
+    sub.set_defaults(func=cmd_geometries)
+
+    sub = subparsers.add_parser('indicators', help="Calcula las series de indicadores.")
+    rango_de_anios(sub)
+    sub.add_argument('--aglomerados', type=int, nargs='+',
+                     help="Códigos de aglomerado a incluir (por defecto, los del informe).")
+    sub.add_argument('--output', nargs='?', const=INDICADORES_DIR,
+                     help=f"Guarda las series en CSV (por defecto en {INDICADORES_DIR}).")
+    sub.add_argument('--panel', action='store_true',
+                     help="Calcula desde el panel compacto (ver 'panel') en lugar de la caché.")
+    sub.set_defaults(func=cmd_indicators)
+
+    sub = subparsers.add_parser('panel',
+                                help="Arma el panel compacto (np.memmap) de la base de personas.")
+    rango_de_anios(sub)
+    sub.add_argument('--aglomerados', type=int, nargs='+',
+                     help="Aglomerados a incluir (por defecto, todos).")
+    sub.add_argument('--force', action='store_true',
+                     help="Rearma el panel aunque las particiones no hayan cambiado.")
+    sub.set_defaults(func=cmd_panel)
+
+    sub = subparsers.add_parser('serve',
+                                help="Servicio HTTP local de indicadores con caché en memoria.")
+    rango_de_anios(sub)
+    sub.add_argument('--host')
+    sub.add_argument('--port', type=int)
+    sub.add_argument('--interval', dest='intervalo', type=float,
+                     help="Segundos entre revisiones del almacén sanitizado.")
+    sub.add_argument('--cache-size', dest='max_entradas', type=int,
+                     help="Tablas calculadas que se guardan en memoria.")
+    sub.set_defaults(func=cmd_serve)
+
+    sub = subparsers.add_parser('report',
+                                help="Calcula un informe de indicadores declarativos sobre el panel.")
+    rango_de_anios(sub)
+    sub.add_argument('--definitions', metavar='JSON',
+                     help="Definiciones de los indicadores (por defecto, las del informe).")
+    sub.add_argument('--aglomerados', type=int, nargs='+',
+                     help="Códigos de aglomerado a incluir (por defecto, los del informe).")
+    sub.add_argument('--output', help="Archivo CSV del informe.")
+    sub.set_defaults(func=cmd_report)
+
+    sub = subparsers.add_parser('plot', help="Genera los gráficos (por defecto como archivos).")
+    sub.add_argument('--interactive', action='store_true',
+                     help="Muestra los gráficos en pantalla en lugar de guardarlos.")
+    sub.add_argument('--choropleth', choices=['Tasa_Empleo', 'Tasa_Actividad',
+                                              'Tasa_Desocupacion', 'Media_Ingreso_Real'],
+                     help="Genera un mapa coroplético por trimestre del indicador.")
+    sub.add_argument('--units', metavar='ARCHIVO',
+                     help="Con --choropleth: capa de unidades a colorear (GeoParquet o "
+                          "GeoJSON), asignadas a su aglomerado con un STRtree.")
+    sub.add_argument('--output', help="Directorio de salida de los gráficos.")
+    sub.add_argument('--format', nargs='+', choices=['png', 'svg'],
+                     help="Formatos de salida.")
+    sub.add_argument('--workers', type=int,
+                     help="Cantidad de procesos para renderizar gráficos en paralelo.")
+    sub.add_argument('--force', action='store_true',
+                     help="Vuelve a renderizar aunque los datos no hayan cambiado.")
+    sub.set_defaults(func=cmd_plot)
+
+    sub = subparsers.add_parser('validate',
+                                help="Compara la Tasa de Empleo de mujeres en CABA con el INDEC.")
+    sub.set_defaults(func=cmd_validate)
+
+    sub = subparsers.add_parser('benchmark',
+                                help="Mide tiempo y memoria del pipeline con datos sintéticos.")
+    sub.add_argument('--scale', type=float, default=1.0,
+                     help="Tamaño de cada trimestre relativo a uno nacional (1 a 50).")
+    sub.add_argument('--years', type=int, nargs='+')
+    sub.add_argument('--repeat', type=int, default=1)
+    sub.add_argument('--workdir', help="Directorio de trabajo (por defecto, uno temporal).")
+    sub.add_argument('--keep', action='store_true',
+                     help="No borra el directorio de trabajo temporal al terminar.")
+    sub.add_argument('--output', help="Archivo JSON de resultados.")
+    sub.add_argument('--compare', help="JSON de una corrida anterior para comparar.")
+    sub.set_defaults(func=cmd_benchmark)
+
+    sub = subparsers.add_parser('benchmark-startup',
+                                help="Mide el tiempo de importación de cada subcomando.")
+    sub.add_argument('--repeat', type=int, default=3)
+    sub.add_argument('--json', help="Archivo donde guardar los resultados.")
+    sub.set_defaults(func=cmd_benchmark_startup)
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    if args.instrument or args.stage_log or args.profile:
+        import instrumentacion
+        instrumentacion.configurar(log_path=args.stage_log, perfilar=args.profile,
+                                   perfilador=args.profiler)
+    args.func(args)
+    if args.instrument:
+        instrumentacion.imprimir_resumen()
+        instrumentacion.exportar_json(args.instrument)
@@ -0,0 +1,290 @@
+import os
+import time
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+from instrumentacion import etapa
+from geometrias import (GEOMETRIAS_DIR, COLUMNA_AGLOMERADO, TOLERANCIA_SIMPLIFICACION,
+                        preparar_geometrias, cargar_radios, cargar_indice, guardar_indice)
+
+# --- Configuración ---
+# Mapas coropléticos de indicadores EPH. Los microdatos solo identifican el
+# aglomerado, así que cada unidad geográfica toma el valor de su aglomerado:
+#   - la unidad por defecto es el aglomerado disuelto (unión de sus radios), que se
+#     calcula una sola vez y se guarda en DISUELTOS_FILENAME;
+#   - cualquier otra capa (departamentos, radios de otra fuente) se asigna a un
+#     aglomerado con un STRtree sobre los aglomerados disueltos (cargar_unidades).
+# Las geometrías se convierten a trazos de matplotlib una vez; en cada cuadro
+# (trimestre) solo cambian los colores.
+DISUELTOS_FILENAME = 'aglomerados_disueltos.parquet'
+COROPLETAS_DIR = './data/graficos/coropletas'
+CMAP = 'viridis'
+COLOR_SIN_DATO = 'lightgrey'
+
+# Índice espacial en memoria (se reconstruye si cambian los disueltos)
+_indice_espacial_cache = {'firma': None, 'arbol': None, 'codigos': None}
+_indice_espacial_lock = threading.Lock()
+
+
+def firma_disueltos(indice):
+    """Firma de los disueltos: hash del GeoJSON de origen y tolerancia de la caché."""
+    fuente = next(iter(indice['fuente'].values()))
+    return f"{fuente['sha256']}-{indice['tolerancia']}"
+
+
+def preparar_disueltos(geometrias_dir=GEOMETRIAS_DIR, force=False):
+    """
+    Disuelve los radios de cada aglomerado en un único (multi)polígono, simplificado
+    con la tolerancia de la caché de geometrías, y lo guarda como GeoParquet. Se
+    recalcula solo si cambió el GeoJSON de origen. Devuelve el GeoDataFrame
+    (una fila por aglomerado, columna eph_codagl).
+    """
+    import geopandas as gpd
+
+    indice = preparar_geometrias(geometrias_dir=geometrias_dir)
+    if indice is None:
+        return None
+    path = os.path.join(geometrias_dir, DISUELTOS_FILENAME)
+    firma = firma_disueltos(indice)
+    if not force and indice.get('disueltos') == firma and os.path.exists(path):
+        return gpd.read_parquet(path)
+
+    print("--- Disolviendo radios por aglomerado ---")
+    start = time.perf_counter()
+    tolerancia = indice.get('tolerancia', TOLERANCIA_SIMPLIFICACION)
+    filas, crs = [], None
+    for aglomerado in indice['aglomerados']:
+        # Se une la geometría original y se simplifica el resultado, para no abrir
+        # huecos entre radios vecinos simplificados por separado
+        radios = cargar_radios(aglomerado, simplificada=False, columnas=[],
+                               geometrias_dir=geometrias_dir)
+        crs = radios.crs
+        union = shapely.union_all(radios.geometry.to_numpy())
+        filas.append((aglomerado, shapely.simplify(union, tolerancia, preserve_topology=True)))
+
+    gdf = gpd.GeoDataFrame(
+        {COLUMNA_AGLOMERADO: [a for a, _ in filas]},
+        geometry=[g for _, g in filas], crs=crs)
+    gdf.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+    indice['disueltos'] = firma
+    guardar_indice(indice, geometrias_dir)
+    print(f"--- {len(gdf)} aglomerados disueltos ({time.perf_counter() - start:.1f}s) ---")
+    return gdf
+
+
+def indice_espacial_aglomerados(geometrias_dir=GEOMETRIAS_DIR):
+    """
+    Devuelve (STRtree, códigos de aglomerado) sobre los aglomerados disueltos. El
+    árbol se arma una vez por proceso y se reutiliza mientras no cambien los disueltos.
+    """
+    indice = cargar_indice(geometrias_dir)
+    with _indice_espacial_lock:
+        if (_indice_espacial_cache['arbol'] is None or indice.get('disueltos') is None
+                or _indice_espacial_cache['firma'] != indice.get('disueltos')):
+            disueltos = preparar_disueltos(geometrias_dir)
+            if disueltos is None:
+                return None, None
+            _indice_espacial_cache['arbol'] = STRtree(disueltos.geometry.to_numpy())
+            _indice_espacial_cache['codigos'] = disueltos[COLUMNA_AGLOMERADO].to_numpy()
+            _indice_espacial_cache['firma'] = cargar_indice(geometrias_dir).get('disueltos')
+        return _indice_espacial_cache['arbol'], _indice_espacial_cache['codigos']
+
+
+def asignar_aglomerado(geometrias, geometrias_dir=GEOMETRIAS_DIR):
+    """
+    Código de aglomerado (texto, como eph_codagl) de cada geometría de 'geometrias'
+    (GeoSeries o arreglo de shapely), según el aglomerado que contiene su punto
+    representativo. Las que no caen en ninguno quedan en None.
+    """
+    arbol, codigos = indice_espacial_aglomerados(geometrias_dir)
+    geometrias = np.asarray(geometrias)
+    resultado = np.full(len(geometrias), None, dtype=object)
+    if arbol is None:
+        return resultado
+
+    puntos = shapely.point_on_surface(geometrias)
+    consulta, aglomerado = arbol.query(puntos, predicate='within')
+    # Si un punto cae en más de un aglomerado (bordes), queda el primero
+    consulta, primero = np.unique(consulta, return_index=True)
+    resultado[consulta] = codigos[aglomerado[primero]]
+    return resultado
+
+
+def cargar_unidades(path, geometrias_dir=GEOMETRIAS_DIR):
+    """
+    Lee una capa de unidades geográficas (GeoParquet o cualquier formato que lea
+    geopandas: departamentos, radios de otra fuente...) para colorearla con
+    renderizar_coropletas. Si no trae eph_codagl, cada unidad se asigna a un
+    aglomerado con el STRtree de los aglomerados disueltos (asignar_aglomerado),
+    en el sistema de coordenadas de los disueltos.
+    """
+    import geopandas as gpd
+
+    unidades = gpd.read_parquet(path) if path.endswith('.parquet') else gpd.read_file(path)
+    if COLUMNA_AGLOMERADO in unidades.columns:
+        return unidades
+
+    disueltos = preparar_disueltos(geometrias_dir)
+    if disueltos is None:
+        return None
+    if unidades.crs is not None and disueltos.crs is not None and unidades.crs != disueltos.crs:
+        unidades = unidades.to_crs(disueltos.crs)
+    unidades[COLUMNA_AGLOMERADO] = asignar_aglomerado(unidades.geometry, geometrias_dir)
+    sin_aglomerado = int(unidades[COLUMNA_AGLOMERADO].isna().sum())
+    if sin_aglomerado:
+        print(f"ADVERTENCIA: {sin_aglomerado} de {len(unidades)} unidades de {path} no caen "
+              "en ningún aglomerado (quedan sin dato).")
+    return unidades
+
+
+def trazos_de_geometrias(geometrias):
+    """
+    Convierte polígonos y multipolígonos a trazos de matplotlib (uno por polígono) y
+    devuelve (trazos, fila de origen de cada trazo). Se hace una vez por mapa. Las
+    geometrías (o partes) de otro tipo, como puntos o líneas, y las vacías no tienen
+    superficie que colorear: se omiten con un aviso.
+    """
+    from matplotlib.path import Path
+
+    # Un multipolígono se separa en sus polígonos; cada uno recuerda su fila de origen
+    partes, filas = shapely.get_parts(np.asarray(geometrias), return_index=True)
+    tipos = shapely.get_type_id(partes)
+    poligonos = (tipos == shapely.GeometryType.POLYGON) & ~shapely.is_empty(partes)
+    if not poligonos.all():
+        omitidos = pd.Series(shapely.get_type_id(partes[~poligonos])).map(
+            lambda t: shapely.GeometryType(t).name).value_counts()
+        print("ADVERTENCIA: se omiten geometrías que no son polígonos: "
+              + ", ".join(f"{n} {tipo}" for tipo, n in omitidos.items()) + ".")
+        partes, filas = partes[poligonos], filas[poligonos]
+    trazos = []
+    for poligono in partes:
+        anillos = [poligono.exterior, *poligono.interiors]
+        trazos.append(Path.make_compound_path(
+            *[Path(np.asarray(anillo.coords)[:, :2], closed=True) for anillo in anillos]))
+    return trazos, filas
+
+
+def valores_por_unidad(df_indicador, columna, aglomerados_unidades):
+    """
+    Matriz (periodos x unidades) con el valor de 'columna' del aglomerado de cada
+    unidad en cada trimestre (NaN si falta), y la lista de periodos (año, trimestre).
+    """
+    tabla = df_indicador.pivot_table(index=['ANO4', 'TRIMESTRE'], columns='AGLOMERADO',
+                                     values=columna, aggfunc='first').sort_index()
+    tabla.columns = tabla.columns.astype(str)
+    tabla = tabla.reindex(columns=pd.Index(aglomerados_unidades).astype(str).unique())
+    posiciones = tabla.columns.get_indexer(pd.Index(aglomerados_unidades).astype(str))
+    return tabla.to_numpy()[:, posiciones], list(tabla.index)
+
+
+def renderizar_coropletas(df_indicador, columna='Tasa_Empleo', unidades=None,
+                          salida_dir=COROPLETAS_DIR, formatos=('png',), titulo=None):
+    """
+    Genera un mapa coroplético de 'columna' por trimestre de df_indicador (filas con
+    ANO4, TRIMESTRE, AGLOMERADO, como serie_tasas_empleo o serie_media_ingreso_real).
+
+    'unidades' es un GeoDataFrame con las unidades a colorear (p. ej. radios); si no
+    tiene eph_codagl se asigna con asignar_aglomerado. Por defecto se usan los
+    aglomerados disueltos. La figura y los trazos se arman una sola vez: en cada
+    cuadro solo se actualizan los colores y el título. La escala de colores es la
+    misma en todos los cuadros. Devuelve la lista de archivos generados.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PathCollection
+
+    if unidades is None:
+        unidades = preparar_disueltos()
+        if unidades is None:
+            return []
+    if COLUMNA_AGLOMERADO in unidades.columns:
+        aglomerados_unidades = unidades[COLUMNA_AGLOMERADO].to_numpy()
+    else:
+        aglomerados_unidades = asignar_aglomerado(unidades.geometry)
+
+    valores, periodos = valores_por_unidad(df_indicador, columna, aglomerados_unidades)
+    # Sin ningún valor no hay escala de colores (set_clim con NaN)
+    if not periodos or np.isnan(valores).all():
+        print(f"ADVERTENCIA: No hay datos de {columna} para graficar.")
+        return []
+
+    # 1. Geometría: una sola vez para todos los cuadros
+    trazos, fila_de_trazo = trazos_de_geometrias(unidades.geometry)
+    if not trazos:
+        print("ADVERTENCIA: Las unidades no tienen polígonos para graficar.")
+        return []
+    cmap = matplotlib.colormaps[CMAP].copy()
+    cmap.set_bad(COLOR_SIN_DATO)
+
+    fig, ax = plt.subplots(1, 1, figsize=(8, 8))
+    coleccion = PathCollection(trazos, cmap=cmap, edgecolor='black', linewidth=0.2)
+    coleccion.set_clim(np.nanmin(valores), np.nanmax(valores))
+    ax.add_collection(coleccion)
+    xmin, ymin, xmax, ymax = unidades.total_bounds
+    ax.set_xlim(xmin, xmax)
+    ax.set_ylim(ymin, ymax)
+    ax.set_aspect('equal')
+    ax.set_xlabel('Longitud')
+    ax.set_ylabel('Latitud')
+    fig.colorbar(coleccion, ax=ax, shrink=0.7, label=columna)
+
+    # 2. Un cuadro por trimestre: solo cambian los colores
+    os.makedirs(salida_dir, exist_ok=True)
+    archivos = []
+    for (anio, trimestre), valores_periodo in zip(periodos, valores):
+        with etapa('render', grafico=f"{columna}_coropleta", year=anio, trim=trimestre):
+            coleccion.set_array(np.ma.masked_invalid(valores_periodo[fila_de_trazo]))
+            ax.set_title(f"{titulo or columna} - T{trimestre}/{anio}", fontsize=14)
+            for formato in formatos:
+                archivo = os.path.join(salida_dir, f"{columna}_{anio}_T{trimestre}.{formato}")
+                fig.savefig(archivo, bbox_inches='tight')
+                archivos.append(archivo)
+    plt.close(fig)
+    return archivos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Genera mapas coropléticos trimestrales de un indicador EPH.")
+    parser.add_argument('--indicator', default='Tasa_Empleo',
+                        help="Columna a graficar (Tasa_Empleo, Tasa_Actividad, "
+                             "Tasa_Desocupacion o Media_Ingreso_Real).")
+    parser.add_argument('--radios', action='store_true',
+                        help="Colorea cada radio censal en lugar del aglomerado disuelto.")
+    parser.add_argument('--units', metavar='ARCHIVO',
+                        help="Capa de unidades a colorear (GeoParquet o GeoJSON); las que no "
+                             "traen eph_codagl se asignan a un aglomerado con un STRtree.")
+    parser.add_argument('--output', default=COROPLETAS_DIR)
+    parser.add_argument('--format', nargs='+', choices=['png', 'svg'], default=['png'])
+    args = parser.parse_args()
+
+    if args.indicator == 'Media_Ingreso_Real':
+        from media_ingresos import serie_media_ingreso_real
+        df_indicador = serie_media_ingreso_real()
+    else:
+        from evolucion_media import serie_tasas_empleo
+        df_indicador = serie_tasas_empleo()
+
+    unidades = None
+    if args.units and df_indicador is not None:
+        unidades = cargar_unidades(args.units)
+        if unidades is None:
+            df_indicador = None
+    elif args.radios and df_indicador is not None:
+        import geopandas as gpd
+        radios = [cargar_radios(a) for a in df_indicador['AGLOMERADO'].unique()]
+        unidades = pd.concat([r for r in radios if r is not None], ignore_index=True)
+        unidades = gpd.GeoDataFrame(unidades, geometry='geometry')
+
+    if df_indicador is not None:
+        archivos = renderizar_coropletas(df_indicador, args.indicator, unidades,
+                                         salida_dir=args.output, formatos=tuple(args.format))
+        print(f"--- Mapas generados: {len(archivos)} en {args.output} ---")
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+import os
+import io
+import zipfile
+import argparse
+from itertools import product
+
+# --- Configuración ---
+# Generador de microdatos EPH sintéticos con el formato de los ZIP del INDEC: un
+# usu_individual_T{trim}{aa}.txt y un usu_hogar_T{trim}{aa}.txt separados por ';' y
+# en latin1, con coma decimal en los ingresos per cápita. Sirve para benchmarks y
+# pruebas sin descargar los archivos reales. Los valores son aleatorios pero con
+# estructura plausible (hogares con varios componentes, ponderador por hogar, P21
+# solo para ocupados, -9 como no respuesta).
+DATA_DIR = './data'
+
+# Escala 1 = un trimestre nacional (~17.000 hogares, ~50.000 personas)
+HOGARES_POR_TRIMESTRE = 17_000
+# Hogares generados y escritos por bloque (acota la memoria a escala 50x)
+HOGARES_POR_BLOQUE = 50_000
+
+AGLOMERADOS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 12, 13, 14, 15, 17, 18, 19, 20, 22, 23, 25,
+               26, 27, 29, 30, 31, 32, 33, 34, 36, 38, 91, 93]
+REGION_POR_AGLOMERADO = {a: r for r, codigos in {
+    1: [32, 33], 40: [19, 20, 22, 23, 25, 27, 29], 41: [7, 8, 12, 15],
+    42: [2, 3, 4, 5, 6, 9, 10, 13, 14, 18, 26, 30, 34, 36, 38], 43: [17],
+    44: [31, 91, 93]}.items() for a in codigos}
+AGLOMERADOS_MAS_500 = {2, 3, 4, 10, 13, 29, 32, 33}
+
+# ESTADO: 0 entrevista no realizada, 1 ocupado, 2 desocupado, 3 inactivo, 4 menor de 10
+PROB_ESTADO_ADULTO = [0.01, 0.57, 0.04, 0.38]
+
+
+def nombre_zip(year, trim):
+    return f"EPH_T{trim}_{year}_txt.zip"
+
+
+def _formato_coma(valores):
+    """Números con dos decimales y coma decimal, como en los TXT del INDEC."""
+    return pd.Series(np.char.replace(np.char.mod('%.2f', valores), '.', ','))
+
+
+def generar_bloque(rng, year, trim, n_hogares, primer_hogar):
+    """Genera (personas, hogares) para 'n_hogares' hogares de un trimestre."""
+    # 1. Hogares
+    codusu = np.char.add('TQRMNO', np.char.zfill(
+        (np.arange(n_hogares) + primer_hogar).astype(str), 13))
+    aglomerado = rng.choice(AGLOMERADOS, n_hogares)
+    pondera_hogar = rng.integers(50, 2500, n_hogares)
+    componentes = rng.choice([1, 2, 3, 4, 5, 6], n_hogares, p=[0.2, 0.3, 0.2, 0.17, 0.09, 0.04])
+    itf = np.where(rng.random(n_hogares) < 0.05, 0,
+                   np.round(rng.lognormal(13, 0.8, n_hogares)))
+
+    hogares = pd.DataFrame({
+        'CODUSU': codusu,
+        'ANO4': year,
+        'TRIMESTRE': trim,
+        'NRO_HOGAR': 1,
+        'REALIZADA': 1,
+        'REGION': [REGION_POR_AGLOMERADO[a] for a in aglomerado],
+        'MAS_500': np.where(np.isin(aglomerado, list(AGLOMERADOS_MAS_500)), 'S', 'N'),
+        'AGLOMERADO': aglomerado,
+        'PONDERA': pondera_hogar,
+        'IV1': rng.integers(1, 7, n_hogares),
+        'II1': rng.integers(1, 6, n_hogares),
+        'IX_TOT': componentes,
+        'ITF': itf.astype(np.int64),
+        'DECIFR': rng.integers(1, 11, n_hogares),
+        'IPCF': _formato_coma(itf / componentes),
+        'DECCFR': rng.integers(1, 11, n_hogares),
+        'PONDIH': np.maximum(pondera_hogar + rng.integers(-40, 40, n_hogares), 1),
+    })
+
+    # 2. Personas: cada hogar repetido por su cantidad de componentes
+    hogar = np.repeat(np.arange(n_hogares), componentes)
+    n = len(hogar)
+    componente = np.arange(n) - np.repeat(np.cumsum(componentes) - componentes, componentes) + 1
+    edad = np.where(componente <= 2, rng.integers(18, 90, n), rng.integers(-1, 60, n))
+    estado = np.where(edad < 10, 4, rng.choice([0, 1, 2, 3], n, p=PROB_ESTADO_ADULTO))
+    ocupado = estado == 1
+    p21 = np.where(ocupado, np.round(rng.lognormal(12.5, 0.7, n)), 0)
+    p21 = np.where(ocupado & (rng.random(n) < 0.08), -9, p21)
+
+    personas = pd.DataFrame({
+        'CODUSU': codusu[hogar],
+        'ANO4': year,
+        'TRIMESTRE': trim,
+        'NRO_HOGAR': 1,
+        'COMPONENTE': componente,
+        'H15': 1,
+        'REGION': hogares['REGION'].to_numpy()[hogar],
+        'MAS_500': hogares['MAS_500'].to_numpy()[hogar],
+        'AGLOMERADO': aglomerado[hogar],
+        'PONDERA': pondera_hogar[hogar],
+        'CH03': np.minimum(componente, 10),
+        'CH04': rng.integers(1, 3, n),
+        'CH06': edad,
+        'CH07': rng.integers(1, 6, n),
+        'NIVEL_ED': rng.integers(1, 8, n),
+        'ESTADO': estado,
+        'CAT_OCUP': np.where(ocupado, rng.integers(1, 5, n), 0),
+        'CAT_INAC': np.where(estado == 3, rng.integers(1, 8, n), 0),
+        'PP04A': np.where(ocupado, rng.integers(1, 4, n), 0),
+        'P21': p21.astype(np.int64),
+        'DECOCUR': np.where(ocupado, rng.integers(1, 11, n), 0),
+        'PONDIIO': np.maximum(pondera_hogar[hogar] + rng.integers(-60, 60, n), 1),
+        'P47T': np.where(rng.random(n) < 0.6, np.round(rng.lognormal(12.3, 0.9, n)), 0).astype(np.int64),
+        'PONDII': np.maximum(pondera_hogar[hogar] + rng.integers(-60, 60, n), 1),
+        'ITF': hogares['ITF'].to_numpy()[hogar],
+        'DECIFR': hogares['DECIFR'].to_numpy()[hogar],
+        'IPCF': hogares['IPCF'].to_numpy()[hogar],
+        'DECCFR': hogares['DECCFR'].to_numpy()[hogar],
+        'PONDIH': hogares['PONDIH'].to_numpy()[hogar],
+    })
+    return personas, hogares
+
+
+def generar_trimestre(year, trim, escala=1.0, data_dir=DATA_DIR, seed=None):
+    """
+    Escribe data_dir/EPH_T{trim}_{year}_txt.zip con las bases de personas y hogares
+    de un trimestre sintético. 'escala' multiplica el tamaño de un trimestre nacional
+    (1 a 50). Se genera y escribe por bloques de hogares. Devuelve (ruta, personas).
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    seed = (year * 10 + trim) if seed is None else seed
+    rng = np.random.default_rng(seed)
+    total_hogares = int(HOGARES_POR_TRIMESTRE * escala)
+    sufijo = f"T{trim}{str(year)[2:]}"
+    zip_path = os.path.join(data_dir, nombre_zip(year, trim))
+
+    total_personas = 0
+    # ZIP no permite escribir dos miembros a la vez: las personas se escriben por
+    # bloques directo al ZIP y los hogares (unas 3 veces menos filas) al final
+    with zipfile.ZipFile(zip_path + '.tmp', 'w', zipfile.ZIP_DEFLATED) as z:
+        bloques_hogares = []
+        with z.open(f"usu_individual_{sufijo}.txt", 'w', force_zip64=True) as f:
+            texto = io.TextIOWrapper(f, encoding='latin1', newline='')
+            for inicio in range(0, total_hogares, HOGARES_POR_BLOQUE):
+                n_hogares = min(HOGARES_POR_BLOQUE, total_hogares - inicio)
+                personas, hogares = generar_bloque(rng, year, trim, n_hogares, inicio)
+                personas.to_csv(texto, sep=';', index=False, header=(inicio == 0))
+                bloques_hogares.append(hogares)
+                total_personas += len(personas)
+            texto.flush()
+            texto.detach()
+        with z.open(f"usu_hogar_{sufijo}.txt", 'w', force_zip64=True) as f:
+            texto = io.TextIOWrapper(f, encoding='latin1', newline='')
+            pd.concat(bloques_hogares, ignore_index=True).to_csv(texto, sep=';', index=False)
+            texto.flush()
+            texto.detach()
+    os.replace(zip_path + '.tmp', zip_path)
+    return zip_path, total_personas
+
+
+def generar_datos(years, trimesters=(1, 2, 3, 4), escala=1.0, data_dir=DATA_DIR):
+    """Genera un ZIP sintético por trimestre. Devuelve la lista de rutas."""
+    rutas = []
+    for year, trim in product(years, trimesters):
+        zip_path, personas = generar_trimestre(year, trim, escala, data_dir)
+        print(f"Generado {zip_path}: {personas:,} personas (escala {escala}x)")
+        rutas.append(zip_path)
+    return rutas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Genera ZIPs de microdatos EPH sintéticos con el formato del INDEC.")
+    parser.add_argument('--start-year', type=int, default=2023)
+    parser.add_argument('--end-year', type=int, default=2023)
+    parser.add_argument('--trimesters', type=int, nargs='+', default=[1, 2, 3, 4])
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Tamaño relativo a un trimestre nacional (1 a 50).")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    args = parser.parse_args()
+
+    generar_datos(range(args.start_year, args.end_year + 1), args.trimesters,
+                  args.scale, args.data_dir)
@@ -0,0 +1,130 @@
+import pandas as pd
+import numpy as np
+
+from instrumentacion import medir_etapa
+
+# --- Configuración ---
+CLAVES_GRUPO = ['ANO4', 'TRIMESTRE', 'AGLOMERADO']
+# Puntos de corte de los deciles (el 0.5 es la mediana)
+CUANTILES_DECILES = [k / 10 for k in range(1, 10)]
+
+
+def ordenar_por_grupo(codigos, valores, pesos):
+    """
+    Ordena las observaciones por (grupo, valor) con un único sort y devuelve los
+    arreglos ordenados junto con el inicio de cada grupo y los pesos acumulados.
+    """
+    orden = np.lexsort((valores, codigos))
+    codigos, valores, pesos = codigos[orden], valores[orden], pesos[orden]
+
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]])
+    peso_acumulado = np.cumsum(pesos)
+    return codigos, valores, pesos, inicios, peso_acumulado
+
+
+def cuantiles_ponderados(valores, peso_acumulado, inicios, peso_total, cuantiles):
+    """
+    Cuantiles ponderados de cada grupo sobre datos ya ordenados: el cuantil q es el
+    menor valor cuyo peso acumulado dentro del grupo alcanza q * peso del grupo.
+    Devuelve una matriz (grupos x cuantiles).
+    """
+    # Peso acumulado antes del inicio de cada grupo
+    offset = np.r_[0.0, peso_acumulado[:-1]][inicios]
+    objetivo = offset[:, None] + np.asarray(cuantiles)[None, :] * peso_total[:, None]
+    # El acumulado global es creciente, así que basta un searchsorted para todos los grupos
+    posiciones = np.searchsorted(peso_acumulado, objetivo, side='left')
+    finales = np.r_[inicios[1:], len(valores)] - 1
+    posiciones = np.minimum(posiciones, finales[:, None])
+    return valores[posiciones]
+
+
+def gini_ponderado(valores, pesos, inicios, peso_total):
+    """
+    Coeficiente de Gini de cada grupo (datos ordenados) a partir del área bajo la
+    curva de Lorenz: G = 1 - sum(w_i * (S_{i-1} + S_i)) / (W * Y).
+    """
+    ingreso = valores * pesos
+    ingreso_total = np.add.reduceat(ingreso, inicios)
+
+    # Ingreso acumulado dentro de cada grupo
+    acumulado = np.cumsum(ingreso)
+    offset = np.r_[0.0, acumulado[:-1]][inicios]
+    grupo = np.repeat(np.arange(len(inicios)), np.diff(np.r_[inicios, len(valores)]))
+    acumulado = acumulado - offset[grupo]
+    acumulado_previo = acumulado - ingreso
+
+    area = np.add.reduceat(pesos * (acumulado_previo + acumulado), inicios)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - area / (peso_total * ingreso_total)
+
+
+def participacion_por_decil(valores, pesos, peso_acumulado, inicios, peso_total):
+    """
+    Porcentaje del ingreso del grupo que concentra cada decil de población. Cada
+    observación se asigna al decil en el que termina su peso acumulado.
+    Devuelve una matriz (grupos x 10).
+    """
+    n_grupos = len(inicios)
+    grupo = np.repeat(np.arange(n_grupos), np.diff(np.r_[inicios, len(valores)]))
+    offset = np.r_[0.0, peso_acumulado[:-1]][inicios]
+    proporcion = (peso_acumulado - offset[grupo]) / peso_total[grupo]
+    decil = np.clip(np.ceil(proporcion * 10 - 1e-9).astype(np.int64), 1, 10) - 1
+
+    ingreso = valores * pesos
+    por_decil = np.bincount(grupo * 10 + decil, weights=ingreso,
+                            minlength=n_grupos * 10).reshape(n_grupos, 10)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return por_decil / por_decil.sum(axis=1, keepdims=True) * 100
+
+
+@medir_etapa('aggregate')
+def estadisticas_ingreso(df, columna='P21_REAL', ponderador='PONDIIO', claves=None,
+                         solo_positivos=True):
+    """
+    Calcula por grupo (por defecto Año, Trimestre y Aglomerado) la media, la mediana,
+    los deciles, el Gini y la participación de cada decil en el ingreso de 'columna',
+    ponderando por 'ponderador'. Pensado para el resultado de deflacionar_ingresos.
+
+    Con 'solo_positivos' se excluyen ingresos <= 0 (incluye el -9 de no respuesta).
+    Todo sale de un único ordenamiento de los datos por (grupo, ingreso).
+    """
+    claves = CLAVES_GRUPO if claves is None else list(claves)
+
+    valores = df[columna].to_numpy(dtype=np.float64)
+    pesos = df[ponderador].to_numpy(dtype=np.float64)
+    validos = ~np.isnan(valores) & (pesos > 0)
+    if solo_positivos:
+        validos &= valores > 0
+
+    if not validos.any():
+        return pd.DataFrame(columns=claves)
+
+    # 1. Código entero de grupo para cada fila válida
+    codigos, grupos = pd.MultiIndex.from_arrays(
+        [df[c].to_numpy()[validos] for c in claves], names=claves).factorize()
+
+    # 2. Un único ordenamiento por (grupo, valor)
+    codigos, valores, pesos, inicios, peso_acumulado = ordenar_por_grupo(
+        codigos, valores[validos], pesos[validos])
+    grupos = grupos[codigos[inicios]]
+    peso_total = np.add.reduceat(pesos, inicios)
+
+    # 3. Indicadores
+    media = np.add.reduceat(valores * pesos, inicios) / peso_total
+    deciles = cuantiles_ponderados(valores, peso_acumulado, inicios, peso_total,
+                                   CUANTILES_DECILES)
+    gini = gini_ponderado(valores, pesos, inicios, peso_total)
+    participacion = participacion_por_decil(valores, pesos, peso_acumulado, inicios,
+                                            peso_total)
+
+    df_resultado = grupos.to_frame(index=False, name=claves)
+    df_resultado['Poblacion'] = peso_total
+    df_resultado['Media'] = media
+    df_resultado['Mediana'] = deciles[:, 4]
+    for k in range(9):
+        df_resultado[f'Decil_{k + 1}'] = deciles[:, k]
+    df_resultado['Gini'] = gini
+    for k in range(10):
+        df_resultado[f'Participacion_D{k + 1}'] = participacion[:, k]
+
+    return df_resultado.sort_values(claves).reset_index(drop=True)
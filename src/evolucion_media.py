@@ -1,29 +1,19 @@
 import pandas as pd
-import os
-import matplotlib.pyplot as plt
-import seaborn as sns
-from itertools import product
+import numpy as np
 
-from utils import load_sanitized_eph_data
-#
+from cache_indicadores import obtener_indicador_por_trimestre
+from instrumentacion import medir_etapa
 
 # --- Configuración ---
-# Directorio donde se encuentran los archivos CSV filtrados
-SANITIZED_DIR = './data/data_sanitized'
-# Definimos el rango de años que ya hemos procesado
-START_ANO4 = 2016
-END_ANO4 = 2025
-
-# Los mismos códigos usados para nombrar los archivos (deben coincidir)
-AGLOMERADOS_INTERES = [31, 32]
-# 32 CABA
-# 31 USUHAIA
-AGLOMERADOS_STR = "_".join(map(str, AGLOMERADOS_INTERES))
-# Nombre de archivo estandarizado: EPH_T{trim}_YYYY_AGLOS_{codes}.csv
-
-# Configuración inicial de visualización
-sns.set_style("whitegrid")
-plt.rcParams['figure.figsize'] = (12, 7)
+# El directorio de datos, el rango de años y los aglomerados del informe se definen
+# en utils (SANITIZED_DIR, START_YEAR, END_YEAR, AGLOMERADOS_INTERES)
+
+# Columnas que necesita el cálculo de tasas laborales
+COLUMNAS_TASAS = ['ANO4', 'TRIMESTRE', 'AGLOMERADO', 'PONDERA', 'ESTADO', 'CH06']
+
+# Límites de los grupos de edad (desde inclusive, hasta exclusive) para grupos_de_edad
+LIMITES_EDAD = [14, 25, 35, 50, 65, 200]
+
 
 # --- Funciones de Carga y Análisis ---
 
@@ -32,74 +22,87 @@ def run_analysis():
     """
     Función principal de análisis y visualización.
     """
-    df_eph = load_sanitized_eph_data()
+    # Solo se recalculan los trimestres nuevos o modificados (ver cache_indicadores)
+    df_tasas = serie_tasas_empleo()
 
-    if df_eph is None:
+    if df_tasas is None:
         return
 
-    tasa_empleo_caba = calcular_tasa_empleo_por_aglomerado(32, df_eph)
-    tasa_empleo_ushuaia = calcular_tasa_empleo_por_aglomerado(31, df_eph)
+    tasa_empleo_caba = df_tasas[df_tasas['AGLOMERADO'] == 32]
+    tasa_empleo_ushuaia = df_tasas[df_tasas['AGLOMERADO'] == 31]
     print(f"{tasa_empleo_caba}")
 
     # --- Análisis y Preparación ---
 
 
-def calcular_tasa_empleo_por_aglomerado(aglomerado, df):
+def grupos_de_edad(df, limites=LIMITES_EDAD):
     """
-    Calcula la Tasa de Empleo (TE), Tasa de Desocupación (TD) y Tasa de Actividad (TA) 
-    agrupando por Año, Trimestre y Aglomerado.
+    Devuelve una Serie categórica 'GRUPO_EDAD' (p. ej. '14-24') a partir de CH06,
+    para usar como clave extra en calcular_tasa_empleo_por_aglomerado.
     """
+    etiquetas = [f"{desde}-{hasta - 1}" for desde, hasta in zip(limites[:-1], limites[1:])]
+    etiquetas[-1] = f"{limites[-2]}+"
+    return pd.cut(df['CH06'], bins=limites, labels=etiquetas, right=False).rename('GRUPO_EDAD')
 
-    # 1. Asegurar tipos de datos y definir Poblaciones clave
-    df['PONDERA'] = pd.to_numeric(df['PONDERA'], errors='coerce')
-    df['ESTADO'] = pd.to_numeric(df['ESTADO'], errors='coerce')
-    df['CH06'] = pd.to_numeric(df['CH06'], errors='coerce')
-    df['AGLOMERADO'] = pd.to_numeric(df['AGLOMERADO'], errors='coerce')
 
+def ponderadores_poblaciones(aglomerado, df):
+    """
+    Devuelve un DataFrame alineado con df con el ponderador (PONDERA) de cada fila en
+    cada población (Total_PTR, Poblacion_Activa, Poblacion_Ocupada,
+    Poblacion_Desocupada), o 0 si la fila no pertenece a ella. Sumándolo por grupo
+    se obtienen las poblaciones de las tasas laborales.
+    """
+    # 1. Definir Poblaciones clave (los tipos ya vienen dados por EPH_SCHEMA al cargar)
     # Población Total de Referencia (PTR: Edad >= 14)
-    df_ptr = df[df['CH06'] >= 14].copy()
-
-    # Población Activa (PA: Ocupados [1] + Desocupados [2])
-    df_pa = df_ptr[df_ptr['ESTADO'].isin([1, 2])].copy()
-
-    # Población Ocupada (PO: ESTADO = 1)
-    df_po = df_ptr[df_ptr['ESTADO'] == 1].copy()
-
-    # Población Desocupada (PD: ESTADO = 2)
-    df_pd = df_ptr[df_ptr['ESTADO'] == 2].copy()
-
-    # 2. Calcular Ponderadores (Suma de Poblaciones) por Grupo
-    group_keys = ['ANO4', 'TRIMESTRE', 'AGLOMERADO']
-
-    # --- Sumas de Población ---
+    en_ptr = df['CH06'].to_numpy() >= 14
+    if aglomerado is not None:
+        codigos = aglomerado if isinstance(aglomerado, (list, tuple, set)) else [aglomerado]
+        en_ptr &= df['AGLOMERADO'].isin(codigos).to_numpy()
+
+    estado = df['ESTADO'].to_numpy()
+    # Un PONDERA faltante no suma a ninguna población (NaN no se puede pasar a entero)
+    pondera = np.nan_to_num(np.where(en_ptr, df['PONDERA'].to_numpy(dtype='float64'), 0)).astype(np.int64)
+
+    # 2. Ponderadores por población: PONDERA * indicador de pertenencia
+    pesos = pd.DataFrame({
+        # A. Denominador para TE y TA
+        'Total_PTR': pondera,
+        # B. Denominador para TD y Numerador para TA: Ocupados [1] + Desocupados [2]
+        'Poblacion_Activa': pondera * ((estado == 1) | (estado == 2)),
+        # C. Numerador para TE: Ocupados (ESTADO = 1)
+        'Poblacion_Ocupada': pondera * (estado == 1),
+        # D. Numerador para TD: Desocupados (ESTADO = 2)
+        'Poblacion_Desocupada': pondera * (estado == 2),
+    }, index=df.index)
+    return pesos
+
+
+@medir_etapa('aggregate')
+def calcular_tasa_empleo_por_aglomerado(aglomerado, df, claves_extra=None):
+    """
+    Calcula la Tasa de Empleo (TE), Tasa de Desocupación (TD) y Tasa de Actividad (TA) 
+    agrupando por Año, Trimestre y Aglomerado.
 
-    # A. Denominador para TE y TA
-    df_total = df_ptr.groupby(group_keys)[
-        'PONDERA'].sum().reset_index(name='Total_PTR')
+    'aglomerado' limita el cálculo a un código o lista de códigos (None = todos).
+    'claves_extra' agrega aperturas: nombres de columna (p. ej. 'CH04' para sexo) o
+    Series alineadas con df (p. ej. grupos_de_edad(df)).
 
-    # B. Denominador para TD y Numerador para TA
-    df_activa = df_pa.groupby(group_keys)['PONDERA'].sum(
-    ).reset_index(name='Poblacion_Activa')
+    Todas las poblaciones salen de una única pasada: se arman columnas de ponderador
+    multiplicado por el indicador de cada población y se suman en un solo groupby,
+    sin copiar ni modificar el DataFrame recibido.
+    """
 
-    # C. Numerador para TE
-    df_ocupada = df_po.groupby(group_keys)['PONDERA'].sum(
-    ).reset_index(name='Poblacion_Ocupada')
+    # 1-2. Ponderadores de cada población (PONDERA * indicador de pertenencia)
+    pesos = ponderadores_poblaciones(aglomerado, df)
 
-    # D. Numerador para TD
-    df_desocupada = df_pd.groupby(group_keys)['PONDERA'].sum(
-    ).reset_index(name='Poblacion_Desocupada')
+    # 3. Una sola agregación por Año, Trimestre, Aglomerado (y aperturas extra)
+    claves = ['ANO4', 'TRIMESTRE', 'AGLOMERADO'] + list(claves_extra or [])
+    series_claves = [df[c] if isinstance(c, str) else c for c in claves]
 
-    # 3. Combinar las series de población en un único DataFrame de resultados
-    df_resultado = pd.merge(df_total, df_activa, on=group_keys, how='left')
-    df_resultado = pd.merge(df_resultado, df_ocupada,
-                            on=group_keys, how='left')
-    df_resultado = pd.merge(df_resultado, df_desocupada,
-                            on=group_keys, how='left')
+    df_resultado = pesos.groupby(series_claves, observed=True).sum().reset_index()
 
-    # Rellenar los conteos nulos con 0 (si un aglomerado no tiene desocupados, por ejemplo)
-    df_resultado[['Poblacion_Activa', 'Poblacion_Ocupada', 'Poblacion_Desocupada']] = \
-        df_resultado[['Poblacion_Activa', 'Poblacion_Ocupada',
-                      'Poblacion_Desocupada']].fillna(0)
+    # Solo quedan los grupos con población de referencia (los demás tenían ponderador 0)
+    df_resultado = df_resultado[df_resultado['Total_PTR'] > 0].reset_index(drop=True)
 
     # 4. Aplicar Fórmulas para calcular las Tasas
 
@@ -126,6 +129,19 @@ def calcular_tasa_empleo_por_aglomerado(aglomerado, df):
 
     return df_resultado
 
+
+def serie_tasas_empleo(years=None, trimesters=None, aglomerados=None):
+    """
+    Serie de TE, TA y TD por trimestre y aglomerado, armada desde la caché por
+    trimestre: solo se recalculan los trimestres nuevos o cuyas particiones cambiaron.
+    'aglomerados' elige las particiones a usar (por defecto AGLOMERADOS_INTERES).
+    """
+    definicion = {'indicador': 'tasas_laborales', 'version': 1}
+    return obtener_indicador_por_trimestre(
+        'tasas_laborales', definicion,
+        lambda df: calcular_tasa_empleo_por_aglomerado(None, df),
+        columnas=COLUMNAS_TASAS, years=years, trimesters=trimesters, aglomerados=aglomerados)
+
 # --- Ejecución ---
 # resultados_te_aglomerado = calcular_te_por_periodo_y_aglomerado(df)
 # print(resultados_te_aglomerado)
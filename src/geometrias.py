@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import argparse
+
+from manifest import record_file, is_file_current
+
+# --- Configuración ---
+# Los radios censales de la EPH se convierten una sola vez del GeoJSON a GeoParquet,
+# un archivo por aglomerado (eph_codagl), con la geometría original y una
+# simplificada para graficar. Los mapas leen solo el aglomerado que necesitan.
+GEOJSON_PATH = './data/radios_eph.geojson'
+GEOMETRIAS_DIR = './data/geometrias'
+# Índice con el tamaño/mtime/SHA-256 del GeoJSON de origen y los parámetros usados
+INDICE_GEOMETRIAS = 'geometrias.json'
+COLUMNA_AGLOMERADO = 'eph_codagl'
+GEOMETRIA_SIMPLIFICADA = 'geometry_simplificada'
+# Tolerancia de simplificación en unidades del CRS (grados en EPSG:4326, ~10 m)
+TOLERANCIA_SIMPLIFICACION = 0.0001
+
+
+def ruta_aglomerado(aglomerado, geometrias_dir=GEOMETRIAS_DIR):
+    """Archivo GeoParquet de los radios de un aglomerado."""
+    return os.path.join(geometrias_dir, f"radios_{COLUMNA_AGLOMERADO}={aglomerado}.parquet")
+
+
+def cargar_indice(geometrias_dir=GEOMETRIAS_DIR):
+    path = os.path.join(geometrias_dir, INDICE_GEOMETRIAS)
+    indice = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                indice = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Advertencia: índice de geometrías ilegible ({e}). Se regenera.")
+            indice = {}
+    indice.setdefault('fuente', {})
+    return indice
+
+
+def guardar_indice(indice, geometrias_dir=GEOMETRIAS_DIR):
+    path = os.path.join(geometrias_dir, INDICE_GEOMETRIAS)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(indice, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def geometrias_actualizadas(indice, geojson_path=GEOJSON_PATH, tolerancia=TOLERANCIA_SIMPLIFICACION,
+                            geometrias_dir=GEOMETRIAS_DIR):
+    """Indica si la caché corresponde al GeoJSON actual y a la misma tolerancia."""
+    if indice.get('tolerancia') != tolerancia:
+        return False
+    if not is_file_current(indice, 'fuente', os.path.basename(geojson_path), geojson_path):
+        return False
+    return all(os.path.exists(ruta_aglomerado(a, geometrias_dir))
+               for a in indice.get('aglomerados', []))
+
+
+def preparar_geometrias(geojson_path=GEOJSON_PATH, geometrias_dir=GEOMETRIAS_DIR,
+                        tolerancia=TOLERANCIA_SIMPLIFICACION, force=False):
+    """
+    Convierte el GeoJSON de radios en un GeoParquet por aglomerado con la geometría
+    original y la simplificada. No hace nada si la caché ya corresponde al GeoJSON
+    (según tamaño, mtime y SHA-256) y a la misma tolerancia. Devuelve el índice.
+    """
+    os.makedirs(geometrias_dir, exist_ok=True)
+    indice = cargar_indice(geometrias_dir)
+    if not force and geometrias_actualizadas(indice, geojson_path, tolerancia, geometrias_dir):
+        return indice
+
+    if not os.path.exists(geojson_path):
+        print(f"ERROR: No se encontró {geojson_path}.")
+        return None
+
+    import geopandas as gpd
+
+    print(f"--- Preparando geometrías desde: {geojson_path} ---")
+    start = time.perf_counter()
+    gdf = gpd.read_file(geojson_path)
+    gdf[COLUMNA_AGLOMERADO] = gdf[COLUMNA_AGLOMERADO].astype(str)
+    # preserve_topology evita polígonos inválidos al simplificar
+    gdf[GEOMETRIA_SIMPLIFICADA] = gdf.geometry.simplify(tolerancia, preserve_topology=True)
+
+    aglomerados = sorted(gdf[COLUMNA_AGLOMERADO].unique())
+    for aglomerado, gdf_aglomerado in gdf.groupby(COLUMNA_AGLOMERADO, sort=True):
+        path = ruta_aglomerado(aglomerado, geometrias_dir)
+        gdf_aglomerado.reset_index(drop=True).to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+
+    indice = {'fuente': {}, 'tolerancia': tolerancia, 'aglomerados': aglomerados}
+    record_file(indice, 'fuente', os.path.basename(geojson_path), geojson_path)
+    guardar_indice(indice, geometrias_dir)
+    print(
+        f"--- Geometrías preparadas: {len(gdf)} radios en {len(aglomerados)} aglomerados "
+        f"({time.perf_counter() - start:.1f}s) ---")
+    return indice
+
+
+def cargar_radios(aglomerado, simplificada=True, columnas=None, geometrias_dir=GEOMETRIAS_DIR):
+    """
+    Devuelve el GeoDataFrame de radios de un aglomerado, leyendo solo su archivo y
+    solo la geometría pedida (la simplificada por defecto, para graficar). Prepara
+    la caché si todavía no existe o si el GeoJSON cambió.
+    """
+    import geopandas as gpd
+
+    # Se acepta la caché con la tolerancia con que se haya preparado
+    indice = cargar_indice(geometrias_dir)
+    if not geometrias_actualizadas(indice, tolerancia=indice.get('tolerancia'),
+                                   geometrias_dir=geometrias_dir):
+        if preparar_geometrias(geometrias_dir=geometrias_dir) is None:
+            return None
+
+    path = ruta_aglomerado(aglomerado, geometrias_dir)
+    if not os.path.exists(path):
+        print(f"ADVERTENCIA: No hay radios para el aglomerado {aglomerado}.")
+        return None
+
+    geometria = GEOMETRIA_SIMPLIFICADA if simplificada else 'geometry'
+    if columnas is not None:
+        columnas = [c for c in columnas if c not in ('geometry', GEOMETRIA_SIMPLIFICADA)]
+        columnas = columnas + [geometria]
+    else:
+        import pyarrow.parquet as pq
+        nombres = pq.read_schema(path).names
+        otra = 'geometry' if simplificada else GEOMETRIA_SIMPLIFICADA
+        columnas = [c for c in nombres if c != otra]
+
+    gdf = gpd.read_parquet(path, columns=columnas).set_geometry(geometria)
+    if simplificada:
+        gdf = gdf.rename_geometry('geometry')
+    return gdf
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Convierte el GeoJSON de radios EPH en GeoParquet por aglomerado.")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCIA_SIMPLIFICACION,
+                        help="Tolerancia de simplificación (unidades del CRS).")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenera la caché aunque el GeoJSON no haya cambiado.")
+    args = parser.parse_args()
+
+    preparar_geometrias(tolerancia=args.tolerance, force=args.force)
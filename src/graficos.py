@@ -1,13 +1,35 @@
 import matplotlib
-matplotlib.use('Qt5Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
-from utils import load_sanitized_eph_data
-from evolucion_media import calcular_tasa_empleo_por_aglomerado
-from media_ingresos import deflacionar_ingresos
-import geopandas as gpd
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from plot_utils import configurar_estilo
+from instrumentacion import etapa, cantidad_registros, registros, incorporar_registros
+from utils import AGLOMERADOS_INTERES
+from geometrias import GEOJSON_PATH, preparar_geometrias, cargar_radios
+from evolucion_media import serie_tasas_empleo
+from media_ingresos import calcular_media_ingreso_real, serie_media_ingreso_real
+
+# --- Configuración ---
+# Modo batch (sin pantalla): los gráficos se guardan en GRAFICOS_DIR con backend Agg.
+# RENDER_INDEX guarda el hash de los datos de cada gráfico para no volver a
+# renderizar los que no cambiaron, y en CLAVE_ERRORES el error de los gráficos que
+# fallaron en el último renderizado (se reintentan en el próximo).
+GRAFICOS_DIR = './data/graficos'
+RENDER_INDEX = 'render_index.json'
+CLAVE_ERRORES = '_errores'
+FORMATOS = ('png', 'svg')
+# Cambiar al modificar el código de un gráfico, para forzar su re-renderizado
+VERSION_GRAFICOS = 1
+
+configurar_estilo()
 
 tasas = ['Tasa_Empleo', 'Tasa_Actividad', 'Tasa_Desocupacion']
 labels = ['Tasa de Empleo (TE)', 'Tasa de Actividad (TA)',
@@ -19,7 +41,23 @@ codigos_aglomerados = {
 }
 
 
-def graficar_tasa_empleo_serie(df_resultado):
+def mostrar_o_guardar(fig, ruta=None, formatos=FORMATOS):
+    """
+    Sin 'ruta' muestra la figura en pantalla. Con 'ruta' (sin extensión) la guarda
+    en cada formato de 'formatos' y la cierra para liberar memoria.
+    """
+    if ruta is None:
+        plt.show()
+        return []
+
+    archivos = [f"{ruta}.{formato}" for formato in formatos]
+    for archivo in archivos:
+        fig.savefig(archivo, bbox_inches='tight')
+    plt.close(fig)
+    return archivos
+
+
+def graficar_tasa_empleo_serie(df_resultado, ruta=None, formatos=FORMATOS):
     """Genera un gráfico de líneas comparando la Tasa de Empleo por aglomerado a lo largo del tiempo."""
 
     """
@@ -69,7 +107,7 @@ def graficar_tasa_empleo_serie(df_resultado):
 
         # El título debe incluir el código del aglomerado
         ax.set_title(
-            f'Aglomerado: {codigos_aglomerados[aglomerado_code]}', fontsize=14)
+            f'Aglomerado: {codigos_aglomerados.get(aglomerado_code, aglomerado_code)}', fontsize=14)
         ax.set_xlabel('Período (Año y Trimestre)')
         ax.set_ylabel('Porcentaje (%)')
         ax.legend(loc='lower left', fontsize=10)
@@ -94,39 +132,23 @@ def graficar_tasa_empleo_serie(df_resultado):
         'Análisis de Series de Tiempo de Indicadores Laborales EPH', fontsize=20, y=1)
     # Ajuste para que el título no se solape
     plt.tight_layout(rect=[0, 0, 1, 1])
-    plt.show()
+    mostrar_o_guardar(fig, ruta, formatos)
 
 
-def graficar_media_ingreso_real(df_eph_deflacionado):
+def graficar_media_ingreso_real(df_media, ruta=None, formatos=FORMATOS):
     """
-    Calcula la media del ingreso real ponderado por periodo y genera el gráfico.
+    Grafica la media del ingreso real ponderado por periodo y aglomerado.
+    Recibe la serie de serie_media_ingreso_real / calcular_media_ingreso_real, o
+    directamente el DataFrame deflacionado (en ese caso calcula la media).
+    Con 'ruta' guarda el gráfico en lugar de mostrarlo (ver mostrar_o_guardar).
     """
 
-    # 1. Calcular la Media Ponderada por Periodo y Aglomerado
-
-    # A. Suma del Ingreso Ponderado (Numerador)
-    ingreso_ponderado_sum = df_eph_deflacionado.groupby(['ANO4', 'TRIMESTRE', 'AGLOMERADO'])[
-        'P21_PONDERADO_REAL'
-    ].sum().reset_index(name='Suma_P21_Ponderado_Real')
-
-    # B. Suma de los Ponderadores (Denominador)
-    # Se usa el ponderador de hogar (PONDIH) para el Ingreso Total Familiar (P21)
-    ponderador_sum = df_eph_deflacionado.groupby(['ANO4', 'TRIMESTRE', 'AGLOMERADO'])[
-        'PONDIIO'
-    ].sum().reset_index(name='Suma_PONDIIO')
-
-    # 2. Merge y Cálculo de la Media Final
-    df_media = pd.merge(ingreso_ponderado_sum, ponderador_sum, on=[
-                        'ANO4', 'TRIMESTRE', 'AGLOMERADO'])
-
-    df_media['Media_Ingreso_Real'] = (
-        df_media['Suma_P21_Ponderado_Real'] / df_media['Suma_PONDIIO']
-    )
-
-    # 3. Preparar columna de período y graficar
-    df_media['PERIODO'] = df_media['ANO4'] + (df_media['TRIMESTRE'] - 1) / 4
+    # 1. Calcular la Media Ponderada por Periodo y Aglomerado (si hace falta)
+    if 'Media_Ingreso_Real' not in df_media.columns:
+        df_media = calcular_media_ingreso_real(df_media)
 
-    plt.figure(figsize=(15, 6))
+    # 2. Graficar
+    fig = plt.figure(figsize=(15, 6))
     sns.lineplot(
         data=df_media,
         x='PERIODO',
@@ -139,50 +161,212 @@ def graficar_media_ingreso_real(df_eph_deflacionado):
     plt.xlabel('Período')
     plt.ylabel('Ingreso Real Promedio Ponderado')
     plt.legend(title='Cód. Aglomerado')
-    plt.show()
+    mostrar_o_guardar(fig, ruta, formatos)
 
 
 
-def graficar_mapa():
+def graficar_mapa(aglomerado=32, ruta=None, formatos=FORMATOS):
+    """
+    Mapa de los radios censales de la EPH de un aglomerado. Lee solo ese aglomerado
+    (con la geometría simplificada) desde la caché de geometrias.py.
+    """
     fig, ax = plt.subplots(1, 1, figsize=(8, 8))
-    gdf_eph = gpd.read_file("./data/radios_eph.geojson")
-    gdf_caba = gdf_eph[gdf_eph["eph_codagl"] == '32']
-    print(gdf_caba.head())
-    
-    gdf_caba.plot(
-       ax=ax, 
-        edgecolor='black', 
-        linewidth=0.5, 
+    gdf_aglomerado = cargar_radios(aglomerado)
+    if gdf_aglomerado is None:
+        plt.close(fig)
+        return
+
+    gdf_aglomerado.plot(
+        ax=ax,
+        edgecolor='black',
+        linewidth=0.5,
         facecolor='lightblue',
         alpha=0.8
     )
 
     # Añadir etiquetas de interés (opcional)
-    ax.set_title(f'Cobertura EPH - {"CABA"}', fontsize=14)
+    nombre = codigos_aglomerados.get(aglomerado, aglomerado)
+    ax.set_title(f'Cobertura EPH - {nombre}', fontsize=14)
     ax.set_xlabel('Longitud')
     ax.set_ylabel('Latitud')
 
-    # Mostrar el mapa
-    plt.show()
+    # Mostrar o guardar el mapa
+    mostrar_o_guardar(fig, ruta, formatos)
 
 
 def graficar():
-    """Función principal para cargar datos y generar el gráfico de Tasa de Empleo."""
-
-    df_eph = load_sanitized_eph_data()
-
-    if df_eph is None:
-        return
+    """Función principal para cargar datos y generar los gráficos en pantalla."""
 
     graficar_mapa()
 
     
-    # Calcular la Tasa de Empleo por aglomerado
-    #df_tasa_empleo = calcular_tasa_empleo_por_aglomerado(None, df_eph)
-    #df_eph_deflacionado = deflacionar_ingresos(df_eph)
+    # Series por trimestre desde la caché (solo se recalculan trimestres nuevos o modificados)
+    #df_tasa_empleo = serie_tasas_empleo()
+    #df_media = serie_media_ingreso_real()
     # Generar el gráfico
     #graficar_tasa_empleo_serie(df_tasa_empleo)
-    #graficar_media_ingreso_real(df_eph_deflacionado)
+    #graficar_media_ingreso_real(df_media)
+
+
+# --- Renderizado batch (sin pantalla) ---
+
+
+def usar_backend_headless():
+    """Usa el backend Agg (sin pantalla). También se ejecuta en cada proceso del pool."""
+    matplotlib.use('Agg')
+
+
+def hash_datos(df):
+    """Hash de un DataFrame (columnas y valores) para detectar cambios en los datos."""
+    digest = hashlib.sha256(",".join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def cargar_indice_render(salida_dir):
+    path = os.path.join(salida_dir, RENDER_INDEX)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Advertencia: índice de gráficos ilegible ({e}). Se renderiza todo.")
+    return {}
 
 
-graficar()
+def guardar_indice_render(salida_dir, indice):
+    path = os.path.join(salida_dir, RENDER_INDEX)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(indice, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def renderizar_grafico(tipo, datos, ruta, formatos):
+    """
+    Renderiza un gráfico del batch (se ejecuta en el proceso principal o en el pool).
+    'datos' es el DataFrame de la serie o, para los mapas, el código de aglomerado.
+    Devuelve los registros de etapas del renderizado (ver instrumentacion.py).
+    """
+    usar_backend_headless()
+    registros_previos = cantidad_registros()
+    with etapa('render', grafico=os.path.basename(ruta)):
+        if tipo == 'tasas_laborales':
+            graficar_tasa_empleo_serie(datos, ruta, formatos)
+        elif tipo == 'media_ingreso_real':
+            graficar_media_ingreso_real(datos, ruta, formatos)
+        elif tipo == 'mapa':
+            graficar_mapa(datos, ruta, formatos)
+    return registros(registros_previos)
+
+
+def trabajos_de_render():
+    """
+    Lista de gráficos del batch: (nombre, tipo, datos, hash de los datos). Las series
+    salen de la caché por trimestre, así que armarlas no recalcula trimestres sin cambios.
+    """
+    trabajos = []
+    df_tasas = serie_tasas_empleo()
+    if df_tasas is not None:
+        trabajos.append(('tasas_laborales', 'tasas_laborales', df_tasas, hash_datos(df_tasas)))
+    df_media = serie_media_ingreso_real()
+    if df_media is not None:
+        trabajos.append(('media_ingreso_real', 'media_ingreso_real',
+                         df_media, hash_datos(df_media)))
+
+    # Las geometrías se preparan aquí, antes de repartir los mapas entre procesos
+    indice = preparar_geometrias() if os.path.exists(GEOJSON_PATH) else None
+    if indice is not None:
+        fuente = indice['fuente'][os.path.basename(GEOJSON_PATH)]
+        for aglomerado in AGLOMERADOS_INTERES:
+            trabajos.append((f'mapa_{aglomerado}', 'mapa', aglomerado,
+                             f"{fuente['sha256']}-{indice['tolerancia']}-{aglomerado}"))
+    else:
+        print(f"ADVERTENCIA: No se encontró {GEOJSON_PATH}; se omiten los mapas.")
+    return trabajos
+
+
+def renderizar_graficos(salida_dir=GRAFICOS_DIR, formatos=FORMATOS, workers=1, force=False):
+    """
+    Genera todos los gráficos como archivos (sin pantalla), en serie o en un pool de
+    procesos. Se saltean los gráficos cuyos datos, formatos y versión no cambiaron
+    desde el último renderizado y cuyos archivos siguen existiendo. Un gráfico que
+    falla no detiene a los demás: su error queda en el índice y se reintenta en la
+    próxima corrida. Devuelve {nombre: error} de los gráficos que fallaron.
+    """
+    print(f"--- Renderizando gráficos en: {salida_dir} ---")
+    usar_backend_headless()
+    os.makedirs(salida_dir, exist_ok=True)
+
+    indice = cargar_indice_render(salida_dir)
+    pendientes = []
+    sin_cambios = 0
+    for nombre, tipo, datos, hash_entrada in trabajos_de_render():
+        ruta = os.path.join(salida_dir, nombre)
+        firma = f"v{VERSION_GRAFICOS}-{hash_entrada}"
+        archivos = [f"{ruta}.{formato}" for formato in formatos]
+        if (not force and indice.get(nombre) == firma
+                and all(os.path.exists(a) for a in archivos)):
+            sin_cambios += 1
+            continue
+        pendientes.append((nombre, tipo, datos, ruta, firma))
+
+    errores = {}
+
+    def registrar(nombre, firma, renderizar):
+        try:
+            renderizar()
+        except Exception as e:
+            print(f"Error al renderizar el gráfico {nombre}: {type(e).__name__}: {e}")
+            errores[nombre] = f"{type(e).__name__}: {e}"
+            # Sin firma: se vuelve a renderizar en la próxima corrida
+            indice.pop(nombre, None)
+        else:
+            indice[nombre] = firma
+
+    start = time.perf_counter()
+    if workers > 1 and len(pendientes) > 1:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=usar_backend_headless) as executor:
+            futures = {executor.submit(renderizar_grafico, tipo, datos, ruta, formatos):
+                       (nombre, firma) for nombre, tipo, datos, ruta, firma in pendientes}
+            for future in as_completed(futures):
+                registrar(*futures[future], lambda: incorporar_registros(future.result()))
+    else:
+        for nombre, tipo, datos, ruta, firma in pendientes:
+            try:
+                registrar(nombre, firma, lambda: renderizar_grafico(tipo, datos, ruta, formatos))
+            finally:
+                # Una figura a medio armar no pasa al gráfico siguiente
+                plt.close('all')
+    wall_time = time.perf_counter() - start
+
+    indice.pop(CLAVE_ERRORES, None)
+    if errores:
+        indice[CLAVE_ERRORES] = errores
+    guardar_indice_render(salida_dir, indice)
+    print(
+        f"--- Finalizado. Gráficos renderizados: {len(pendientes) - len(errores)} "
+        f"({wall_time:.1f}s). Sin cambios: {sin_cambios}. Con errores: {len(errores)} ---")
+    return errores
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Genera los gráficos del informe (en pantalla o como archivos).")
+    parser.add_argument('--batch', action='store_true',
+                        help="Guarda todos los gráficos como archivos, sin pantalla (backend Agg).")
+    parser.add_argument('--output', default=GRAFICOS_DIR,
+                        help="Directorio de salida del modo batch.")
+    parser.add_argument('--format', nargs='+', choices=FORMATOS, default=list(FORMATOS),
+                        help="Formatos de salida del modo batch.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Cantidad de procesos para renderizar gráficos en paralelo.")
+    parser.add_argument('--force', action='store_true',
+                        help="Vuelve a renderizar aunque los datos no hayan cambiado.")
+    args = parser.parse_args()
+
+    if args.batch:
+        renderizar_graficos(salida_dir=args.output, formatos=tuple(args.format),
+                            workers=args.workers, force=args.force)
+    else:
+        graficar()
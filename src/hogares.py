@@ -0,0 +1,123 @@
+import pandas as pd
+import numpy as np
+
+from utils import load_sanitized_eph_data, periodos_fallidos
+from instrumentacion import etapa
+
+# --- Configuración ---
+# Unión de la base de personas con la de hogares por CODUSU + NRO_HOGAR (dentro de
+# cada trimestre). En lugar de un merge sobre la clave de texto, cada hogar se
+# identifica con un entero:
+#   (código de periodo * cantidad de CODUSU + código de CODUSU) * 100 + NRO_HOGAR
+# donde el código de CODUSU sale de un índice hash sobre los CODUSU de la base de
+# hogares. Las claves de hogares se ordenan una vez y cada persona busca la suya con
+# una búsqueda binaria; solo se copian las columnas pedidas de la base de hogares.
+CLAVES_HOGAR = ['CODUSU', 'NRO_HOGAR']
+CLAVES_PERIODO = ['ANO4', 'TRIMESTRE']
+# Columnas de la base de hogares que se agregan por defecto a cada persona
+COLUMNAS_HOGAR = ['IX_TOT', 'ITF', 'IPCF', 'PONDIH']
+# NRO_HOGAR es menor que 100 (los hogares de servicio doméstico usan 51)
+MAX_NRO_HOGAR = 100
+
+
+def claves_enteras(df, codusu):
+    """
+    Clave entera del hogar de cada fila de 'df' (columnas ANO4, TRIMESTRE, CODUSU y
+    NRO_HOGAR). 'codusu' es el índice de CODUSU de indice_hogares; las filas cuyo
+    CODUSU no está en el índice quedan con clave -1.
+    """
+    codigo = codusu.get_indexer(df['CODUSU'])
+    periodo = (df['ANO4'].to_numpy(dtype=np.int64) * 10
+               + df['TRIMESTRE'].to_numpy(dtype=np.int64))
+    claves = ((periodo * len(codusu) + codigo) * MAX_NRO_HOGAR
+              + df['NRO_HOGAR'].to_numpy(dtype=np.int64))
+    claves[codigo < 0] = -1
+    return claves
+
+
+def indice_hogares(df_hogar):
+    """
+    Índice de la base de hogares para unir_hogares: CODUSU distintos (índice hash),
+    claves enteras ordenadas y la fila de df_hogar de cada clave. Si un hogar aparece
+    más de una vez en el trimestre se usa su primera fila.
+    """
+    codusu = pd.Index(pd.unique(df_hogar['CODUSU']))
+    claves = claves_enteras(df_hogar, codusu)
+    filas = np.argsort(claves, kind='stable')
+    claves = claves[filas]
+
+    repetidas = np.flatnonzero(claves[1:] == claves[:-1]) + 1
+    if len(repetidas):
+        print(f"Advertencia: {len(repetidas)} hogares repetidos en la base de hogares; "
+              "se usa la primera fila de cada uno.")
+        claves = np.delete(claves, repetidas)
+        filas = np.delete(filas, repetidas)
+    return {'codusu': codusu, 'claves': claves, 'filas': filas}
+
+
+def buscar_hogares(indice, df_personas):
+    """Fila de la base de hogares de cada persona (-1 si su hogar no está)."""
+    claves = claves_enteras(df_personas, indice['codusu'])
+    if len(indice['claves']) == 0:
+        return np.full(len(claves), -1, dtype=np.int64)
+    posiciones = np.searchsorted(indice['claves'], claves)
+    posiciones = np.minimum(posiciones, len(indice['claves']) - 1)
+    encontradas = (claves >= 0) & (indice['claves'][posiciones] == claves)
+    return np.where(encontradas, indice['filas'][posiciones], -1)
+
+
+def unir_hogares(df_personas, df_hogar, columnas=COLUMNAS_HOGAR):
+    """
+    Agrega a cada persona las 'columnas' de su hogar (mismo ANO4, TRIMESTRE, CODUSU
+    y NRO_HOGAR). Equivale a un merge 'left' de personas con hogares, sin cambiar el
+    orden ni la cantidad de filas de df_personas. Si una columna ya existe en
+    df_personas se reemplaza por la de la base de hogares. Las personas sin hogar
+    quedan con NaN (y los enteros pasan a float64).
+    """
+    columnas = [c for c in columnas if c in df_hogar.columns]
+    with etapa('join', filas_hogar=len(df_hogar)) as e:
+        filas = buscar_hogares(indice_hogares(df_hogar), df_personas)
+        sin_hogar = int((filas < 0).sum())
+        if sin_hogar:
+            print(f"Advertencia: {sin_hogar} personas sin hogar en la base de hogares.")
+
+        resultado = df_personas.copy(deep=False)
+        for columna in columnas:
+            serie = df_hogar[columna]
+            if isinstance(serie.dtype, np.dtype):
+                # take con relleno pasa los enteros a float64 para poder poner NaN
+                valores = pd.api.extensions.take(serie.to_numpy(), filas,
+                                                 allow_fill=bool(sin_hogar))
+            else:
+                valores = serie.array.take(filas, allow_fill=bool(sin_hogar))
+            resultado[columna] = pd.Series(valores, index=df_personas.index)
+        e.filas = len(resultado)
+    return resultado
+
+
+def cargar_personas_con_hogar(columnas_personas, columnas_hogar=COLUMNAS_HOGAR,
+                              years=None, trimesters=None, periodos=None, aglomerados=None):
+    """
+    Carga las bases sanitizadas de personas y de hogares de los trimestres y
+    aglomerados pedidos (leyendo solo las columnas necesarias) y agrega a cada
+    persona las columnas de su hogar con unir_hogares. Los trimestres con particiones
+    que no se pudieron leer quedan en attrs['periodos_fallidos'], como en la carga.
+    """
+    claves = CLAVES_PERIODO + CLAVES_HOGAR
+    columnas_personas = list(dict.fromkeys(claves + list(columnas_personas)))
+    columnas_hogar = [c for c in columnas_hogar if c not in claves]
+
+    df_personas = load_sanitized_eph_data(columns=columnas_personas, years=years,
+                                          trimesters=trimesters, periodos=periodos,
+                                          aglomerados=aglomerados)
+    if df_personas is None:
+        return None
+    df_hogar = load_sanitized_eph_data(columns=claves + columnas_hogar, years=years,
+                                       trimesters=trimesters, periodos=periodos,
+                                       aglomerados=aglomerados, base='hogar')
+    if df_hogar is None:
+        print("ADVERTENCIA: No hay bases de hogares sanitizadas. Vuelva a ejecutar el sanitizador.")
+        return None
+    resultado = unir_hogares(df_personas, df_hogar, columnas_hogar)
+    resultado.attrs['periodos_fallidos'] = periodos_fallidos(df_personas, df_hogar)
+    return resultado
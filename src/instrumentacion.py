@@ -0,0 +1,424 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+import multiprocessing.util
+from functools import wraps
+from contextlib import contextmanager
+
+try:
+    # resource solo existe en Unix (el proyecto también se usa en Windows)
+    import resource
+except ImportError:
+    resource = None
+
+# --- Configuración ---
+# Instrumentación de las etapas del pipeline (http, unzip, parse, filter, write,
+# load, concat, join, aggregate, render). Cada etapa registra tiempo de reloj, filas,
+# bytes y memoria (RSS al terminar y pico de RSS del proceso hasta ese momento),
+# junto con su contexto (año, trimestre, archivo...).
+#
+# Los registros quedan en memoria (exportar_json / imprimir_resumen) y se emiten como
+# líneas JSON por el logger 'eph.etapas'. Sin configurar, etapa() no mide ni guarda
+# nada (el servicio y los bucles por bloque no acumulan registros). Se configura con
+# configurar() o con las variables de entorno, que heredan los procesos de los pools:
+#   EPH_INSTRUMENTAR  '1' para guardar los registros en memoria
+#   EPH_ETAPAS_LOG    archivo donde agregar una línea JSON por etapa
+#   EPH_PERFILAR      nombre de la etapa a perfilar con cProfile (o pyinstrument)
+ENV_ACTIVO = 'EPH_INSTRUMENTAR'
+ENV_LOG = 'EPH_ETAPAS_LOG'
+ENV_PERFILAR = 'EPH_PERFILAR'
+ENV_PERFILADOR = 'EPH_PERFILADOR'
+PERFILES_DIR = './data/perfiles'
+
+logger = logging.getLogger('eph.etapas')
+
+_registros = []
+_lock = threading.Lock()
+# Contexto que heredan las etapas anidadas del mismo hilo (p. ej. año y trimestre)
+_contexto = threading.local()
+# Perfilado: un perfilador por hilo (en _hilo); 'perfiladores' los junta para guardarlos
+_perfil = {'etapa': None, 'tipo': 'cprofile', 'perfiladores': [], 'pid': None,
+           'sesion': None, 'aviso_hilos': False}
+_hilo = threading.local()
+# Si etapa() mide y guarda registros (ver configurar)
+_medir = {'activo': False}
+
+
+# --- Memoria ---
+
+
+def _proc_status_mb(*campos):
+    """Valores de /proc/self/status en MB (VmRSS, VmHWM) en una sola lectura; None fuera de Linux."""
+    valores = dict.fromkeys(campos)
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for linea in f:
+                campo = linea.split(':', 1)[0]
+                if campo in valores:
+                    valores[campo] = int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return tuple(valores.values())
+
+
+def rss_actual_mb():
+    """Memoria residente actual del proceso en MB (None si no se puede medir)."""
+    return _proc_status_mb('VmRSS')[0]
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso en MB (None sin /proc ni 'resource')."""
+    return _pico_ru_maxrss(_proc_status_mb('VmHWM')[0])
+
+
+def rss_mb():
+    """(RSS actual, pico de RSS) en MB leyendo /proc una sola vez."""
+    actual, pico = _proc_status_mb('VmRSS', 'VmHWM')
+    return actual, _pico_ru_maxrss(pico)
+
+
+def _pico_ru_maxrss(pico):
+    """Pico de RSS de 'resource' cuando /proc no lo dio."""
+    if pico is not None or resource is None:
+        return pico
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS informa bytes; el resto de los Unix, KB
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def reiniciar_pico_rss():
+    """Reinicia el pico de RSS del proceso (solo Linux). Devuelve True si se pudo."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_status_mb('VmHWM')[0] is not None
+    except OSError:
+        return False
+
+
+# --- Configuración en tiempo de ejecución ---
+
+
+def configurar(log_path=None, perfilar=None, perfilador='cprofile'):
+    """
+    Activa la medición de etapas, el log JSON por etapa en 'log_path' y/o el
+    perfilado de la etapa 'perfilar' con 'perfilador' ('cprofile' o 'pyinstrument').
+    Se guarda también en variables de entorno para que lo hereden los procesos hijos.
+    """
+    os.environ[ENV_ACTIVO] = '1'
+    if log_path:
+        os.environ[ENV_LOG] = os.path.abspath(log_path)
+    if perfilar:
+        os.environ[ENV_PERFILAR] = perfilar
+        os.environ[ENV_PERFILADOR] = perfilador
+    _configurar_desde_entorno()
+
+
+def _configurar_desde_entorno():
+    log_path = os.environ.get(ENV_LOG)
+    if log_path and not any(getattr(h, 'baseFilename', None) == log_path
+                            for h in logger.handlers):
+        handler = logging.FileHandler(log_path, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    _perfil['etapa'] = os.environ.get(ENV_PERFILAR)
+    _perfil['tipo'] = os.environ.get(ENV_PERFILADOR, 'cprofile')
+    _medir['activo'] = os.environ.get(ENV_ACTIVO) == '1' or bool(log_path)
+
+
+# --- Perfilado de una etapa ---
+
+
+def _iniciar_perfil(nombre):
+    """
+    Activa el perfilador del hilo actual si 'nombre' es la etapa elegida (no anida).
+    Cada hilo tiene su propio cProfile.Profile, así las etapas que corren en pools
+    de hilos ('load', 'http') también se perfilan; guardar_perfil los combina.
+    """
+    if _perfil['etapa'] != nombre or getattr(_hilo, 'activo', False):
+        return False
+    with _lock:
+        if _perfil['pid'] != os.getpid():
+            # Primer perfil de este proceso (un hijo de un pool no hereda los del padre)
+            _perfil['pid'] = os.getpid()
+            _perfil['sesion'] = object()
+            _perfil['perfiladores'] = []
+            if multiprocessing.parent_process() is None:
+                atexit.register(guardar_perfil)
+            else:
+                # Los procesos de un pool no corren atexit; sí los finalizadores de multiprocessing
+                multiprocessing.util.Finalize(None, guardar_perfil, exitpriority=0)
+
+    if _perfil['tipo'] == 'pyinstrument':
+        if threading.current_thread() is not threading.main_thread():
+            if not _perfil['aviso_hilos']:
+                print(f"Advertencia: pyinstrument solo perfila el hilo principal; la etapa "
+                      f"'{nombre}' corre en otros hilos. Use --profiler cprofile.")
+                _perfil['aviso_hilos'] = True
+            return False
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("Advertencia: pyinstrument no está instalado; se usa cProfile.")
+            _perfil['tipo'] = 'cprofile'
+
+    # El perfilador del hilo vale para la sesión de perfilado actual de este proceso
+    if getattr(_hilo, 'sesion', None) is not _perfil['sesion']:
+        if _perfil['tipo'] == 'pyinstrument':
+            _hilo.perfilador = Profiler()
+        else:
+            import cProfile
+            _hilo.perfilador = cProfile.Profile()
+        with _lock:
+            _hilo.sesion = _perfil['sesion']
+            _perfil['perfiladores'].append(_hilo.perfilador)
+    perfilador = _hilo.perfilador
+
+    if _perfil['tipo'] == 'pyinstrument':
+        perfilador.start()
+    else:
+        try:
+            perfilador.enable()
+        except ValueError:
+            # Desde Python 3.12 solo puede haber un cProfile activo a la vez: si otro
+            # hilo ya está perfilando esta etapa, esta ejecución no se perfila
+            return False
+    _hilo.activo = True
+    return True
+
+
+def _detener_perfil():
+    if _perfil['tipo'] == 'pyinstrument':
+        _hilo.perfilador.stop()
+    else:
+        _hilo.perfilador.disable()
+    _hilo.activo = False
+
+
+def guardar_perfil(perfiles_dir=PERFILES_DIR, lineas=20):
+    """
+    Guarda el perfil acumulado de la etapa elegida (todas sus ejecuciones en este
+    proceso, en todos los hilos) e imprime las funciones con más tiempo acumulado.
+    Se llama sola al salir.
+    """
+    with _lock:
+        perfiladores = _perfil['perfiladores']
+        # Un perfil posterior empieza una sesión nueva (con perfiladores nuevos)
+        _perfil['perfiladores'] = []
+        _perfil['pid'] = None
+    if not perfiladores:
+        return None
+    os.makedirs(perfiles_dir, exist_ok=True)
+    base = os.path.join(perfiles_dir, f"{_perfil['etapa']}_{os.getpid()}")
+
+    if _perfil['tipo'] == 'pyinstrument':
+        # Solo el hilo principal: hay un único perfilador
+        perfilador = perfiladores[0]
+        path = base + '.html'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(perfilador.output_html())
+        print(perfilador.output_text())
+    else:
+        import pstats
+        path = base + '.prof'
+        estadisticas = pstats.Stats(perfiladores[0])
+        for perfilador in perfiladores[1:]:
+            estadisticas.add(perfilador)
+        estadisticas.dump_stats(path)
+        estadisticas.sort_stats('cumulative').print_stats(lineas)
+    hilos = f" ({len(perfiladores)} hilos)" if len(perfiladores) > 1 else ""
+    print(f"Perfil de la etapa '{_perfil['etapa']}'{hilos} guardado en: {path}")
+    return path
+
+
+# --- Etapas ---
+
+
+class Etapa:
+    """Etapa en curso. Dentro del bloque se cargan filas y bytes procesados."""
+
+    __slots__ = ('nombre', 'contexto', 'filas', 'bytes')
+
+    def __init__(self, nombre, contexto):
+        self.nombre = nombre
+        self.contexto = contexto
+        self.filas = None
+        self.bytes = None
+
+    def agregar(self, filas=0, bytes=0):
+        """Suma filas y bytes (para etapas que procesan por bloques)."""
+        self.filas = (self.filas or 0) + filas
+        self.bytes = (self.bytes or 0) + bytes
+
+
+@contextmanager
+def contexto_etapas(**contexto):
+    """Agrega 'contexto' a todas las etapas que se midan dentro del bloque (mismo hilo)."""
+    anterior = getattr(_contexto, 'valores', {})
+    _contexto.valores = {**anterior, **contexto}
+    try:
+        yield
+    finally:
+        _contexto.valores = anterior
+
+
+@contextmanager
+def etapa(nombre, **contexto):
+    """
+    Mide el bloque como una etapa del pipeline:
+
+        with etapa('parse', year=2020, trim=1) as e:
+            df = ...
+            e.filas = len(df)
+
+    El registro se guarda aunque el bloque lance una excepción (con 'error'). Sin
+    configurar() solo se perfila (si corresponde): no se mide ni se guarda nada.
+    """
+    if not _medir['activo']:
+        perfilando = _iniciar_perfil(nombre)
+        try:
+            yield Etapa(nombre, contexto)
+        finally:
+            if perfilando:
+                _detener_perfil()
+        return
+
+    contexto = {**getattr(_contexto, 'valores', {}), **contexto}
+    registro = Etapa(nombre, contexto)
+    perfilando = _iniciar_perfil(nombre)
+    inicio_epoch = time.time()
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield registro
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        if perfilando:
+            _detener_perfil()
+        rss, rss_pico = rss_mb()
+        datos = {
+            'etapa': nombre,
+            **contexto,
+            'segundos': round(segundos, 6),
+            'filas': registro.filas,
+            'bytes': registro.bytes,
+            'rss_mb': rss,
+            'rss_pico_mb': rss_pico,
+            'inicio': round(inicio_epoch, 3),
+            'pid': os.getpid(),
+        }
+        if error:
+            datos['error'] = error
+        with _lock:
+            _registros.append(datos)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(datos, default=str))
+
+
+def medir_etapa(nombre, contar_filas=len):
+    """
+    Decorador que mide cada llamada como la etapa 'nombre'. Las filas salen de
+    'contar_filas(resultado)' (por defecto len; None para no contarlas).
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with etapa(nombre, funcion=funcion.__name__) as e:
+                resultado = funcion(*args, **kwargs)
+                if contar_filas is not None and resultado is not None:
+                    e.filas = contar_filas(resultado)
+                return resultado
+        return envoltura
+    return decorador
+
+
+def medir_iterable(nombre, iterable, contar_filas=len, **contexto):
+    """
+    Recorre 'iterable' midiendo cada paso (obtener el siguiente elemento) como la
+    etapa 'nombre', con el número de bloque en el contexto. Sirve para lectores por
+    bloques, donde el trabajo ocurre al pedir cada bloque.
+    """
+    iterador = iter(iterable)
+    fin = object()
+    bloque = 0
+    while True:
+        with etapa(nombre, bloque=bloque, **contexto) as e:
+            elemento = next(iterador, fin)
+            if elemento is not fin and contar_filas is not None:
+                e.filas = contar_filas(elemento)
+        if elemento is fin:
+            return
+        yield elemento
+        bloque += 1
+
+
+# --- Consulta y exportación ---
+
+
+def cantidad_registros():
+    """Cantidad de registros en este proceso (para tomar solo los de un tramo)."""
+    with _lock:
+        return len(_registros)
+
+
+def registros(desde=0):
+    """Copia de los registros de este proceso a partir de la posición 'desde'."""
+    with _lock:
+        return list(_registros[desde:])
+
+
+def incorporar_registros(otros):
+    """Agrega registros generados en otros procesos (p. ej. devueltos por un pool)."""
+    pid = os.getpid()
+    with _lock:
+        _registros.extend(r for r in otros if r.get('pid') != pid)
+
+
+def limpiar_registros():
+    with _lock:
+        _registros.clear()
+
+
+def resumen():
+    """Totales por etapa: ejecuciones, segundos, filas, bytes y pico de RSS."""
+    totales = {}
+    for r in registros():
+        t = totales.setdefault(r['etapa'], {'ejecuciones': 0, 'segundos': 0.0, 'filas': 0,
+                                            'bytes': 0, 'rss_pico_mb': None})
+        t['ejecuciones'] += 1
+        t['segundos'] += r['segundos']
+        t['filas'] += r['filas'] or 0
+        t['bytes'] += r['bytes'] or 0
+        if r['rss_pico_mb'] is not None:
+            t['rss_pico_mb'] = max(t['rss_pico_mb'] or 0, r['rss_pico_mb'])
+    return totales
+
+
+def imprimir_resumen():
+    totales = resumen()
+    if not totales:
+        return
+    print(f"\n{'Etapa':<14} {'Veces':>6} {'Segundos':>9} {'Filas':>11} {'MB':>9} {'Pico RSS':>9}")
+    for nombre, t in totales.items():
+        pico = f"{t['rss_pico_mb']:.0f}" if t['rss_pico_mb'] is not None else '-'
+        print(f"{nombre:<14} {t['ejecuciones']:>6} {t['segundos']:>9.3f} {t['filas']:>11} "
+              f"{t['bytes'] / 2**20:>9.1f} {pico:>9}")
+
+
+def exportar_json(path):
+    """Guarda los registros y el resumen por etapa en un archivo JSON."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'registros': registros(), 'resumen': resumen()}, f, indent=2, default=str)
+    print(f"Registros de etapas guardados en: {path}")
+
+
+_configurar_desde_entorno()
@@ -0,0 +1,87 @@
+import os
+import json
+import hashlib
+
+# --- Configuración ---
+# El manifiesto vive junto a los datos descargados
+DATA_DIR = './data'
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_PATH = os.path.join(DATA_DIR, MANIFEST_FILENAME)
+
+# Secciones del manifiesto:
+#   'raw':        ZIPs descargados por scraper.py (clave: nombre del ZIP)
+#   'sanitized':  particiones generadas por sanitize.py (clave: ruta relativa al almacén)
+#   'trimestres': trimestres particionados por sanitize.py (clave: base/ANO4=año/TRIMESTRE=trim)
+#                 con el ZIP de origen, el formato y sus aglomerados
+SECTIONS = ('raw', 'sanitized', 'trimestres')
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    """Calcula el SHA-256 de un archivo leyéndolo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Carga el manifiesto; si no existe o está dañado devuelve uno vacío."""
+    manifest = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Advertencia: manifiesto ilegible en {path} ({e}). Se reconstruye.")
+            manifest = {}
+    for section in SECTIONS:
+        manifest.setdefault(section, {})
+    return manifest
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Guarda el manifiesto con escritura atómica (archivo temporal + rename)."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def record_file(manifest, section, key, path, **extra):
+    """
+    Registra tamaño, mtime y SHA-256 de 'path' bajo manifest[section][key].
+    Los argumentos extra (URL de origen, hash del ZIP fuente, etc.) se guardan tal cual.
+    """
+    stat = os.stat(path)
+    entry = {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': sha256_file(path),
+    }
+    entry.update(extra)
+    manifest[section][key] = entry
+    return entry
+
+
+def is_file_current(manifest, section, key, path):
+    """
+    Indica si 'path' coincide con lo registrado en el manifiesto.
+
+    Si tamaño y mtime coinciden se asume que no cambió (sin releer el archivo).
+    Si solo cambió el mtime se recalcula el SHA-256 y, si coincide, se actualiza el mtime.
+    """
+    entry = manifest[section].get(key)
+    if entry is None or not os.path.exists(path):
+        return False
+
+    stat = os.stat(path)
+    if stat.st_size != entry.get('size'):
+        return False
+    if stat.st_mtime_ns == entry.get('mtime_ns'):
+        return True
+
+    if sha256_file(path) != entry.get('sha256'):
+        return False
+    entry['mtime_ns'] = stat.st_mtime_ns
+    return True
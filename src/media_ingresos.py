@@ -1,58 +1,215 @@
 import pandas as pd
+import numpy as np
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
-from itertools import product
 
-from utils import load_sanitized_eph_data
-from utils import calcular_ipc_trimestral
-
-
-def get_deflactores():
-
-    deflactores_df = calcular_ipc_trimestral()
-
-    BASE_IPC = deflactores_df[
-        (deflactores_df['ANIO'] == 2025) &
-        (deflactores_df['TRIMESTRE'] == 1)
-    ]['INDICE'].iloc[0]
-
-    deflactores_df['Deflactor_normalizado'] = deflactores_df['INDICE'] / BASE_IPC
-    deflactores_df['Deflactor_normalizado'] = pd.to_numeric(
-        deflactores_df['Deflactor_normalizado'], errors='coerce')
+from utils import get_tabla_deflactores, BASE_DEFLACTOR, IPC_FILEPATH
+from manifest import sha256_file
+from cache_indicadores import obtener_indicador_por_trimestre
+from hogares import cargar_personas_con_hogar
+from instrumentacion import medir_etapa
+
+# Columnas que necesita la deflación de ingresos
+COLUMNAS_INGRESOS = ['ANO4', 'TRIMESTRE', 'AGLOMERADO', 'P21', 'PONDIIO']
+
+# Columnas de la base de hogares para el ingreso per cápita familiar
+COLUMNAS_INGRESO_HOGAR = ['IPCF', 'PONDIH']
+
+# Ponderador de cada columna de ingreso: el ingreso de la ocupación principal (P21)
+# usa PONDIIO; los ingresos del hogar (ITF total, IPCF per cápita) usan PONDIH
+PONDERADOR_INGRESO = {
+    'P21': 'PONDIIO',
+    'ITF': 'PONDIH',
+    'IPCF': 'PONDIH',
+}
+
+
+def get_deflactores(base=BASE_DEFLACTOR):
+    """
+    Devuelve los deflactores trimestrales normalizados al periodo 'base' como
+    DataFrame (ANIO, TRIMESTRE, Deflactor_normalizado), a partir de la tabla
+    compartida de utils.get_tabla_deflactores.
+    """
+    tabla = get_tabla_deflactores(base)
+    if tabla is None:
+        return None
+
+    deflactores_df = pd.DataFrame(
+        [(anio, trimestre, deflactor)
+         for (anio, trimestre), deflactor in sorted(tabla.items())],
+        columns=['ANIO', 'TRIMESTRE', 'Deflactor_normalizado'])
 
     return deflactores_df
 
 
-def deflacionar_ingresos(df_eph):
-    """Calcula el ingreso real y el ponderador del ingreso."""
-
-    deflactores_df = get_deflactores()
-
-    # 1. Merge para obtener el deflactor en cada fila de ingreso
-    df_eph_merged = pd.merge(
-        df_eph,
-        deflactores_df[['ANIO', 'TRIMESTRE', 'Deflactor_normalizado']],
-        left_on=['ANO4', 'TRIMESTRE'], right_on=['ANIO', 'TRIMESTRE'], how='inner')
-
-    df_eph_merged['P21'] = pd.to_numeric(
-        df_eph_merged['P21'], errors='coerce')
+def construir_indice_deflactores(tabla):
+    """
+    Convierte la tabla {(año, trimestre): deflactor} en un arreglo indexado por
+    código de periodo: (año - año_inicial) * 4 + (trimestre - 1). Los periodos
+    sin IPC quedan en NaN. Devuelve (año_inicial, arreglo).
+    """
+    anio_inicial = min(anio for anio, _ in tabla)
+    anio_final = max(anio for anio, _ in tabla)
+    deflactores = np.full((anio_final - anio_inicial + 1) * 4, np.nan)
+    for (anio, trimestre), deflactor in tabla.items():
+        deflactores[(anio - anio_inicial) * 4 + trimestre - 1] = deflactor
+    return anio_inicial, deflactores
+
+
+def deflactor_por_fila(df_eph, base=BASE_DEFLACTOR):
+    """
+    Devuelve un arreglo con el deflactor de cada fila (lookup por código de
+    periodo, sin merge) y la lista de periodos (año, trimestre) sin deflactor.
+    """
+    tabla = get_tabla_deflactores(base)
+    if tabla is None:
+        return None, []
+    anio_inicial, deflactores = construir_indice_deflactores(tabla)
+
+    codigo = (df_eph['ANO4'].to_numpy(dtype=np.int64) - anio_inicial) * 4 + \
+        df_eph['TRIMESTRE'].to_numpy(dtype=np.int64) - 1
+    fuera_de_rango = (codigo < 0) | (codigo >= len(deflactores))
+    deflactor = deflactores[np.clip(codigo, 0, len(deflactores) - 1)]
+    deflactor[fuera_de_rango] = np.nan
+
+    codigos_faltantes = np.unique(codigo[np.isnan(deflactor)])
+    periodos_faltantes = [(int(anio_inicial + c // 4), int(c % 4 + 1))
+                          for c in codigos_faltantes]
+    return deflactor, periodos_faltantes
+
+
+@medir_etapa('aggregate')
+def deflacionar_ingresos(df_eph, columnas=('P21',), base=BASE_DEFLACTOR):
+    """
+    Calcula el ingreso real (a precios del periodo 'base') y el ingreso real
+    ponderado de cada columna de 'columnas' (P21, ITF, IPCF).
+
+    Agrega solo las columnas {col}_REAL y {col}_PONDERADO_REAL sobre una copia
+    superficial de df_eph (no se copian los datos originales). Las filas de
+    trimestres sin deflactor se conservan con NaN y esos trimestres se informan
+    por consola y en df.attrs['periodos_sin_deflactor'].
+    """
+    # 1. Deflactor de cada fila a partir del código de periodo
+    deflactor, periodos_faltantes = deflactor_por_fila(df_eph, base)
+    if deflactor is None:
+        return None
+
+    if periodos_faltantes:
+        faltantes = ", ".join(f"T{t}/{a}" for a, t in periodos_faltantes)
+        print(
+            f"ADVERTENCIA: Sin deflactor para {faltantes}. Sus ingresos reales quedan en NaN.")
+
+    df_resultado = df_eph.copy(deep=False)
+    df_resultado.attrs['periodos_sin_deflactor'] = periodos_faltantes
 
     # 2. Deflacionar el Ingreso (Ingreso_Real = Ingreso_Nominal / Deflactor)
-    # Columna Ingreso: En EPH, el ingreso total familiar suele ser 'ITF' y el individual 'P21'
-    # Asumiremos que quieres deflacionar el 'ITF' (Ingreso Total Familiar)
-
-    # **NOTA**: Debes verificar la columna de Ingreso en tu microdato (P21 o ITF)
-    df_eph_merged['P21_REAL'] = (
-        df_eph_merged['P21'] / (df_eph_merged['Deflactor_normalizado'])
+    # En EPH el ingreso individual es 'P21' y el del hogar 'ITF' (total) o 'IPCF' (per cápita)
+    for columna in columnas:
+        ponderador = PONDERADOR_INGRESO[columna]
+        if columna not in df_eph.columns or ponderador not in df_eph.columns:
+            print(
+                f"ERROR: Faltan las columnas {columna}/{ponderador} para deflacionar {columna}.")
+            continue
+
+        ingreso_real = df_eph[columna].to_numpy(dtype=np.float64) / deflactor
+        df_resultado[f'{columna}_REAL'] = ingreso_real
+        df_resultado[f'{columna}_PONDERADO_REAL'] = \
+            ingreso_real * df_eph[ponderador].to_numpy(dtype=np.float64)
+
+    return df_resultado
+
+
+@medir_etapa('aggregate')
+def calcular_media_ingreso_real(df_eph_deflacionado):
+    """
+    Calcula la media del ingreso real ponderado (P21) por Año, Trimestre y Aglomerado.
+    """
+
+    # A. Suma del Ingreso Ponderado (Numerador)
+    # B. Suma de los Ponderadores (Denominador)
+    # Se usa el ponderador de ingresos (PONDIIO) para el ingreso de la ocupación principal (P21).
+    # Solo cuentan las filas con ingreso real (las de trimestres sin deflactor quedan en NaN)
+    sumas = pd.DataFrame({
+        'Suma_P21_Ponderado_Real': df_eph_deflacionado['P21_PONDERADO_REAL'],
+        'Suma_PONDIIO': df_eph_deflacionado['PONDIIO'].astype('float64').where(
+            df_eph_deflacionado['P21_REAL'].notna()),
+    })
+    df_media = sumas.groupby([df_eph_deflacionado['ANO4'],
+                              df_eph_deflacionado['TRIMESTRE'],
+                              df_eph_deflacionado['AGLOMERADO']]).sum().reset_index()
+
+    df_media['Media_Ingreso_Real'] = (
+        df_media['Suma_P21_Ponderado_Real'] / df_media['Suma_PONDIIO']
     )
 
-    # Columna Ponderador de ingreso ('PONDIH' o similar)
-    # El ingreso se pondera con el ponderador de hogar (PONDIH), no el individual (PONDERA)
-    df_eph_merged['P21_PONDERADO_REAL'] = (
-        # PONDIH: Ponderador de Hogar
-        df_eph_merged['P21_REAL'] * df_eph_merged['PONDIIO']
+    # Columna de período para graficar
+    df_media['PERIODO'] = df_media['ANO4'] + (df_media['TRIMESTRE'] - 1) / 4
+
+    return df_media
+
+
+def serie_media_ingreso_real(base=BASE_DEFLACTOR, years=None, trimesters=None,
+                             aglomerados=None):
+    """
+    Serie de la media del ingreso real por trimestre y aglomerado, desde la caché
+    por trimestre. La definición incluye el periodo base y el hash del IPC, así un
+    IPC actualizado invalida los resultados.
+    """
+    definicion = {
+        'indicador': 'media_ingreso_real',
+        'version': 1,
+        'base': list(base),
+        'ipc_sha256': sha256_file(IPC_FILEPATH) if os.path.exists(IPC_FILEPATH) else None,
+    }
+    return obtener_indicador_por_trimestre(
+        'media_ingreso_real', definicion,
+        lambda df: calcular_media_ingreso_real(deflacionar_ingresos(df, base=base)),
+        columnas=COLUMNAS_INGRESOS, years=years, trimesters=trimesters,
+        aglomerados=aglomerados)
+
+
+@medir_etapa('aggregate')
+def calcular_media_ipcf_real(df_eph_deflacionado):
+    """
+    Calcula la media del ingreso per cápita familiar real (IPCF) de las personas por
+    Año, Trimestre y Aglomerado. Cada persona aporta el IPCF de su hogar con el
+    ponderador de ingresos del hogar (PONDIH).
+    """
+    sumas = pd.DataFrame({
+        'Suma_IPCF_Ponderado_Real': df_eph_deflacionado['IPCF_PONDERADO_REAL'],
+        'Suma_PONDIH': df_eph_deflacionado['PONDIH'].astype('float64').where(
+            df_eph_deflacionado['IPCF_REAL'].notna()),
+    })
+    df_media = sumas.groupby([df_eph_deflacionado['ANO4'],
+                              df_eph_deflacionado['TRIMESTRE'],
+                              df_eph_deflacionado['AGLOMERADO']]).sum().reset_index()
+
+    df_media['Media_IPCF_Real'] = (
+        df_media['Suma_IPCF_Ponderado_Real'] / df_media['Suma_PONDIH']
     )
-
-    # Quitar filas sin ingreso o sin deflactor
-    return df_eph_merged.dropna(subset=['P21_REAL'])
+    df_media['PERIODO'] = df_media['ANO4'] + (df_media['TRIMESTRE'] - 1) / 4
+    return df_media
+
+
+def serie_media_ipcf_real(base=BASE_DEFLACTOR, years=None, trimesters=None,
+                          aglomerados=None):
+    """
+    Serie de la media del ingreso per cápita familiar real por trimestre y
+    aglomerado. El IPCF y el PONDIH salen de la base de hogares, unida a la de
+    personas con hogares.unir_hogares; la caché se invalida si cambia cualquiera
+    de las dos bases de un trimestre.
+    """
+    definicion = {
+        'indicador': 'media_ipcf_real',
+        'version': 1,
+        'base': list(base),
+        'ipc_sha256': sha256_file(IPC_FILEPATH) if os.path.exists(IPC_FILEPATH) else None,
+    }
+    return obtener_indicador_por_trimestre(
+        'media_ipcf_real', definicion,
+        lambda df: calcular_media_ipcf_real(deflacionar_ingresos(df, columnas=('IPCF',),
+                                                                 base=base)),
+        years=years, trimesters=trimesters, bases=('personas', 'hogar'),
+        aglomerados=aglomerados,
+        cargar=lambda periodos, aglomerados: cargar_personas_con_hogar(
+            ['AGLOMERADO'], COLUMNAS_INGRESO_HOGAR, periodos=periodos,
+            aglomerados=aglomerados))
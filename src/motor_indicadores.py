@@ -0,0 +1,325 @@
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from estadisticas_ponderadas import CLAVES_GRUPO
+from evolucion_media import grupos_de_edad
+from instrumentacion import etapa
+
+# --- Configuración ---
+# Indicadores declarativos: cada indicador es un cociente de sumas ponderadas
+#   escala * suma(peso [* valor] en filas de numerador y denominador)
+#          / suma(peso en filas del denominador)
+# por Año, Trimestre y Aglomerado (más las 'aperturas' que se pidan). Se define con
+# un dict (o un objeto JSON):
+#   'numerador':   filtro que se suma en el numerador (dentro del denominador)
+#   'denominador': filtro de la población de referencia
+#   'peso':        columna ponderadora (PONDERA, PONDIIO, PONDIH)
+#   'valor':       columna a promediar (opcional; p. ej. P21_REAL para una media).
+#                  Las filas sin valor quedan fuera del denominador.
+#   'aperturas':   claves extra de agrupación (columnas o CLAVES_DERIVADAS)
+#   'escala':      factor del cociente (100 para tasas, 1 para medias)
+# Un filtro es un dict {columna: condición} (se cumplen todas):
+#   2            igual a 2                  [1, 2]         uno de esos valores
+#   [">=", 14]   operador y valor           "notna"        sin valores faltantes
+# compilar() reúne todos los indicadores en un plan que evalúa cada condición y
+# cada columna de sumas una sola vez, y agrupa los datos en un único groupby.
+OPERADORES = {
+    '==': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal,
+    '>': np.greater, '>=': np.greater_equal,
+}
+# Claves de agrupación que se calculan a partir de los datos: (función, columnas que usa)
+CLAVES_DERIVADAS = {
+    'GRUPO_EDAD': (grupos_de_edad, ['CH06']),
+}
+INFORME_PATH = './data/indicadores/informe.csv'
+
+# Población de referencia de las tasas laborales (como en evolucion_media)
+PTR = {'CH06': ['>=', 14]}
+ACTIVOS = {**PTR, 'ESTADO': [1, 2]}
+OCUPADOS = {**PTR, 'ESTADO': 1}
+
+# Informe por defecto
+INDICADORES_INFORME = {
+    'Tasa_Empleo': {'numerador': {'ESTADO': 1}, 'denominador': PTR,
+                    'peso': 'PONDERA', 'escala': 100},
+    'Tasa_Actividad': {'numerador': {'ESTADO': [1, 2]}, 'denominador': PTR,
+                       'peso': 'PONDERA', 'escala': 100},
+    'Tasa_Desocupacion': {'numerador': {'ESTADO': 2}, 'denominador': ACTIVOS,
+                          'peso': 'PONDERA', 'escala': 100},
+    'Tasa_Empleo_Mujeres': {'numerador': {'ESTADO': 1}, 'denominador': {**PTR, 'CH04': 2},
+                            'peso': 'PONDERA', 'escala': 100},
+    'Tasa_Empleo_Varones': {'numerador': {'ESTADO': 1}, 'denominador': {**PTR, 'CH04': 1},
+                            'peso': 'PONDERA', 'escala': 100},
+    'Tasa_Desocupacion_Mujeres': {'numerador': {'ESTADO': 2},
+                                  'denominador': {**ACTIVOS, 'CH04': 2},
+                                  'peso': 'PONDERA', 'escala': 100},
+    'Tasa_Desocupacion_Varones': {'numerador': {'ESTADO': 2},
+                                  'denominador': {**ACTIVOS, 'CH04': 1},
+                                  'peso': 'PONDERA', 'escala': 100},
+    'Tasa_Empleo_Por_Edad': {'numerador': {'ESTADO': 1}, 'denominador': PTR,
+                             'peso': 'PONDERA', 'escala': 100, 'aperturas': ['GRUPO_EDAD']},
+    'Tasa_Desocupacion_Por_Edad': {'numerador': {'ESTADO': 2}, 'denominador': ACTIVOS,
+                                   'peso': 'PONDERA', 'escala': 100,
+                                   'aperturas': ['GRUPO_EDAD']},
+    'Tasa_Empleo_Por_Sexo_Y_Edad': {'numerador': {'ESTADO': 1}, 'denominador': PTR,
+                                    'peso': 'PONDERA', 'escala': 100,
+                                    'aperturas': ['CH04', 'GRUPO_EDAD']},
+    # Categoría ocupacional de los ocupados: 2 cuenta propia, 3 asalariado
+    'Porcentaje_Asalariados': {'numerador': {'CAT_OCUP': 3}, 'denominador': OCUPADOS,
+                               'peso': 'PONDERA', 'escala': 100},
+    'Porcentaje_Cuenta_Propia': {'numerador': {'CAT_OCUP': 2}, 'denominador': OCUPADOS,
+                                 'peso': 'PONDERA', 'escala': 100},
+    # Ingresos (columnas de media_ingresos.deflacionar_ingresos)
+    'Media_Ingreso_Real': {'valor': 'P21_REAL', 'peso': 'PONDIIO'},
+    'Media_Ingreso_Real_Mujeres': {'valor': 'P21_REAL', 'peso': 'PONDIIO',
+                                   'denominador': {'CH04': 2}},
+    'Media_Ingreso_Real_Varones': {'valor': 'P21_REAL', 'peso': 'PONDIIO',
+                                   'denominador': {'CH04': 1}},
+    'Media_IPCF_Real': {'valor': 'IPCF_REAL', 'peso': 'PONDIH'},
+}
+
+
+# --- Compilación ---
+
+
+def normalizar_condicion(columna, condicion):
+    """Convierte una condición del filtro en (columna, operador, valor) hasheable."""
+    if isinstance(condicion, str):
+        if condicion != 'notna':
+            raise ValueError(f"Condición desconocida para {columna}: {condicion!r}.")
+        return columna, 'notna', None
+    if isinstance(condicion, (list, tuple)):
+        if condicion and isinstance(condicion[0], str):
+            if len(condicion) != 2 or condicion[0] not in OPERADORES:
+                raise ValueError(f"Condición inválida para {columna}: {condicion!r}.")
+            return columna, condicion[0], condicion[1]
+        return columna, 'in', tuple(sorted(condicion))
+    return columna, '==', condicion
+
+
+def normalizar_filtro(filtro):
+    """Filtro como frozenset de condiciones (el orden de las claves no importa)."""
+    return frozenset(normalizar_condicion(c, v) for c, v in (filtro or {}).items())
+
+
+def compilar(definiciones, claves=CLAVES_GRUPO):
+    """
+    Reúne las 'definiciones' ({nombre: definición}) en un plan de evaluación:
+    condiciones distintas, columnas de sumas distintas (peso, valor y filtro) y,
+    por indicador, su numerador, denominador, claves de agrupación y escala.
+    Indicadores que comparten un denominador (o un numerador) lo calculan una vez.
+    """
+    sumas = {}
+    indicadores = {}
+    aperturas = []
+    for nombre, definicion in definiciones.items():
+        desconocidas = set(definicion) - {'numerador', 'denominador', 'peso', 'valor',
+                                          'aperturas', 'escala'}
+        if desconocidas:
+            raise ValueError(f"Claves desconocidas en {nombre}: {', '.join(sorted(desconocidas))}.")
+        if 'peso' not in definicion:
+            raise ValueError(f"Falta el 'peso' del indicador {nombre}.")
+        peso = definicion['peso']
+        valor = definicion.get('valor')
+
+        denominador = normalizar_filtro(definicion.get('denominador'))
+        if valor is not None:
+            denominador |= {(valor, 'notna', None)}
+        numerador = denominador | normalizar_filtro(definicion.get('numerador'))
+
+        clave_num = sumas.setdefault((peso, valor, numerador), len(sumas))
+        clave_den = sumas.setdefault((peso, None, denominador), len(sumas))
+        claves_indicador = list(claves) + [a for a in definicion.get('aperturas', [])
+                                           if a not in claves]
+        aperturas += [a for a in claves_indicador if a not in claves and a not in aperturas]
+        indicadores[nombre] = {
+            'numerador': f"suma_{clave_num}",
+            'denominador': f"suma_{clave_den}",
+            'claves': claves_indicador,
+            'escala': definicion.get('escala', 1),
+        }
+
+    return {
+        'claves': list(claves),
+        'aperturas': aperturas,
+        'sumas': {f"suma_{i}": clave for clave, i in sumas.items()},
+        'condiciones': sorted({c for _, _, filtro in sumas for c in filtro}, key=repr),
+        'indicadores': indicadores,
+    }
+
+
+# --- Evaluación ---
+
+
+def evaluar_condicion(df, columna, operador, valor):
+    """Máscara booleana (NumPy) de una condición sobre 'df'."""
+    datos = df[columna]
+    if operador == 'notna':
+        return datos.notna().to_numpy()
+    if operador == 'in':
+        return datos.isin(valor).to_numpy()
+    return OPERADORES[operador](datos.to_numpy(), valor)
+
+
+def columnas_necesarias(plan):
+    """Columnas de los datos que usa el plan (sin las claves derivadas)."""
+    columnas = list(plan['claves'])
+    columnas += [a for a in plan['aperturas'] if a not in CLAVES_DERIVADAS]
+    for peso, valor, _ in plan['sumas'].values():
+        columnas += [peso] + ([valor] if valor else [])
+    columnas += [c for c, _, _ in plan['condiciones']]
+    for apertura in plan['aperturas']:
+        if apertura in CLAVES_DERIVADAS:
+            columnas += CLAVES_DERIVADAS[apertura][1]
+    return list(dict.fromkeys(columnas))
+
+
+def evaluar(plan, df):
+    """
+    Evalúa el plan sobre 'df' en una sola pasada: cada condición se evalúa una vez,
+    cada filtro combinado una vez, y todas las columnas de sumas se agregan en un
+    único groupby por las claves más todas las aperturas. Los indicadores con menos
+    aperturas se obtienen reagrupando ese resultado (que es chico).
+
+    Devuelve {nombre: DataFrame} con las claves del indicador, 'Numerador',
+    'Denominador' y una columna con el nombre del indicador. Solo quedan los grupos
+    con denominador positivo.
+    """
+    with etapa('aggregate', funcion='motor_indicadores',
+               indicadores=len(plan['indicadores'])) as e:
+        # 1. Máscaras: una por condición y una por filtro combinado
+        mascaras = {c: evaluar_condicion(df, *c) for c in plan['condiciones']}
+        filtros = {}
+        pesos = {}
+        columnas = {}
+        for nombre, (peso, valor, filtro) in plan['sumas'].items():
+            if filtro not in filtros:
+                mascara = np.ones(len(df), dtype=bool)
+                for condicion in filtro:
+                    mascara &= mascaras[condicion]
+                filtros[filtro] = mascara
+            if peso not in pesos:
+                pesos[peso] = df[peso].to_numpy(dtype=np.float64)
+            ponderado = pesos[peso] if valor is None else \
+                pesos[peso] * df[valor].to_numpy(dtype=np.float64)
+            columnas[nombre] = np.where(filtros[filtro], ponderado, 0.0)
+
+        # 2. Un único groupby por las claves y todas las aperturas
+        claves = plan['claves'] + plan['aperturas']
+        series_claves = [CLAVES_DERIVADAS[c][0](df).rename(c) if c in CLAVES_DERIVADAS
+                         else df[c] for c in claves]
+        tabla = pd.DataFrame(columnas, index=df.index).groupby(
+            series_claves, observed=True, dropna=False, sort=True).sum()
+        e.filas = len(df)
+
+        # 3. Cada indicador: reagrupar si usa menos claves y dividir
+        reagrupadas = {tuple(claves): tabla}
+        resultados = {}
+        for nombre, indicador in plan['indicadores'].items():
+            claves_indicador = tuple(indicador['claves'])
+            if claves_indicador not in reagrupadas:
+                reagrupadas[claves_indicador] = tabla.groupby(
+                    level=list(claves_indicador), observed=True, dropna=False,
+                    sort=True).sum()
+            sumas = reagrupadas[claves_indicador]
+            resultado = pd.DataFrame({
+                'Numerador': sumas[indicador['numerador']],
+                'Denominador': sumas[indicador['denominador']],
+            }).reset_index()
+            # Las filas sin valor en una apertura propia no forman grupo
+            resultado = resultado.dropna(subset=[c for c in claves_indicador
+                                                 if c not in plan['claves']])
+            resultado = resultado[resultado['Denominador'] > 0].reset_index(drop=True)
+            resultado[nombre] = (indicador['escala'] * resultado['Numerador']
+                                 / resultado['Denominador'])
+            resultados[nombre] = resultado
+    return resultados
+
+
+def calcular_indicadores(df, definiciones=INDICADORES_INFORME, claves=CLAVES_GRUPO):
+    """Compila y evalúa las 'definiciones' sobre 'df' (ver compilar y evaluar)."""
+    return evaluar(compilar(definiciones, claves), df)
+
+
+def informe_largo(resultados):
+    """
+    Une los resultados de evaluar en una tabla larga: claves, aperturas (vacías si
+    el indicador no las usa), 'Indicador', 'Numerador', 'Denominador' y 'Valor'.
+    """
+    tablas = [df.rename(columns={nombre: 'Valor'}).assign(Indicador=nombre)
+              for nombre, df in resultados.items()]
+    if not tablas:
+        return None
+    informe = pd.concat(tablas, ignore_index=True)
+    fijas = ['Indicador', 'Numerador', 'Denominador', 'Valor']
+    return informe[[c for c in informe.columns if c not in fijas] + fijas]
+
+
+def cargar_definiciones(path):
+    """
+    Lee definiciones de indicadores de un archivo JSON ({nombre: definición}) y las
+    valida compilándolas. Devuelve None si el archivo no se puede leer o es inválido.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            definiciones = json.load(f)
+        compilar(definiciones)
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"ERROR: definiciones inválidas en {path}: {e}")
+        return None
+    return definiciones
+
+
+def informe_desde_panel(definiciones=INDICADORES_INFORME, years=None, aglomerados=None):
+    """
+    Calcula las 'definiciones' sobre el panel compacto (ver panel.py), deflacionando
+    antes los ingresos que usen. Devuelve la tabla larga de informe_largo.
+    """
+    import panel
+    from utils import AGLOMERADOS_INTERES
+    from media_ingresos import PONDERADOR_INGRESO, deflacionar_ingresos
+
+    plan = compilar(definiciones)
+    datos = panel.abrir_panel()
+    if datos is None:
+        return None
+    datos = datos.seleccionar(years=years, aglomerados=aglomerados or AGLOMERADOS_INTERES)
+
+    # Columnas *_REAL: se piden al panel las nominales y se deflacionan
+    necesarias = columnas_necesarias(plan)
+    reales = [c[:-len('_REAL')] for c in necesarias
+              if c.endswith('_REAL') and c[:-len('_REAL')] in PONDERADOR_INGRESO]
+    df = datos.a_dataframe(necesarias + reales + [PONDERADOR_INGRESO[c] for c in reales])
+    if reales:
+        df = deflacionar_ingresos(df, columnas=tuple(reales))
+        if df is None:
+            return None
+    faltantes = [c for c in necesarias if c not in df.columns]
+    if faltantes:
+        print(f"ERROR: El panel no tiene las columnas {', '.join(faltantes)}.")
+        return None
+    return informe_largo(evaluar(plan, df))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Calcula un informe de indicadores declarativos sobre el panel.")
+    parser.add_argument('--definitions', help="Archivo JSON con las definiciones "
+                                              "(por defecto, INDICADORES_INFORME).")
+    parser.add_argument('--aglomerados', type=int, nargs='+')
+    parser.add_argument('--output', default=INFORME_PATH)
+    args = parser.parse_args()
+
+    definiciones = cargar_definiciones(args.definitions) if args.definitions \
+        else INDICADORES_INFORME
+    informe = None
+    if definiciones is not None:
+        informe = informe_desde_panel(definiciones, aglomerados=args.aglomerados)
+    if informe is not None:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        informe.to_csv(args.output, index=False)
+        print(f"Informe de {informe['Indicador'].nunique()} indicadores guardado en: {args.output}")
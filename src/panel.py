@@ -0,0 +1,447 @@
+import os
+import json
+import time
+import shutil
+import argparse
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from manifest import MANIFEST_PATH, load_manifest
+from utils import (START_YEAR, END_YEAR, BASE_DEFLACTOR, aglomerados_del_trimestre,
+                   find_sanitized_files, load_sanitized_eph_data, periodos_fallidos)
+from cache_indicadores import hash_definicion, hash_archivo_sanitizado
+from hogares import CLAVES_HOGAR, CLAVES_PERIODO, unir_hogares
+from evolucion_media import COLUMNAS_TASAS, calcular_tasa_empleo_por_aglomerado
+from media_ingresos import (COLUMNAS_INGRESOS, COLUMNAS_INGRESO_HOGAR, deflacionar_ingresos,
+                            calcular_media_ingreso_real, calcular_media_ipcf_real)
+from instrumentacion import etapa
+
+# --- Configuración ---
+# Panel compacto de la base de personas (con las columnas de su hogar ya unidas): un
+# archivo binario por columna con tipos angostos, abierto con np.memmap. Abrirlo no
+# lee datos; las páginas se cargan al usarlas y quedan en la caché del sistema, así
+# varios procesos que abren el mismo panel comparten una sola copia en memoria.
+#   {PANEL_DIR}/actual.json                   versión vigente ({"version": "panel_<hash>"})
+#   {PANEL_DIR}/panel_<hash>/{columna}.bin    valores de la columna (orden año, trimestre, aglomerado)
+#   {PANEL_DIR}/panel_<hash>/panel.json       filas, tipos, tramos por aglomerado y hashes de origen
+# Cada armado escribe una versión nueva y la activa reemplazando actual.json, así
+# nunca se pisan archivos que otro proceso tiene abiertos con np.memmap. Las versiones
+# anteriores se borran con limpiar_versiones cuando ya nadie las usa.
+PANEL_DIR = './data/panel'
+META_FILENAME = 'panel.json'
+ACTUAL_FILENAME = 'actual.json'
+PREFIJO_VERSION = 'panel_'
+VERSION_PANEL = 1
+
+# Columnas del panel y su tipo en disco: códigos como enteros chicos, ponderadores
+# como float32 (son enteros menores a 2**24, exactos en float32) e ingresos float64.
+# Un código con valores faltantes se guarda como float32 (con NaN) y se avisa.
+PANEL_DTYPES = {
+    'ANO4': 'int16',
+    'TRIMESTRE': 'int8',
+    'AGLOMERADO': 'int16',
+    'CH04': 'int8',
+    'CH06': 'int16',
+    'NIVEL_ED': 'int8',
+    'ESTADO': 'int8',
+    'CAT_OCUP': 'int8',
+    'PONDERA': 'float32',
+    'PONDIIO': 'float32',
+    'P21': 'float64',
+    # Del hogar (unidas con hogares.unir_hogares)
+    'PONDIH': 'float32',
+    'ITF': 'float64',
+    'IPCF': 'float64',
+}
+COLUMNAS_HOGAR_PANEL = ['PONDIH', 'ITF', 'IPCF']
+
+
+class Panel:
+    """
+    Panel abierto con abrir_panel. Cada columna es un arreglo NumPy de solo lectura
+    (np.memmap del panel completo, o una vista/selección de sus filas).
+    """
+
+    def __init__(self, meta, columnas, filas=slice(None)):
+        self.meta = meta
+        self._columnas = columnas
+        # slice (vista sin copia) o arreglo de posiciones (copia al leer la columna)
+        self._filas = filas
+
+    @property
+    def columnas(self):
+        return list(self._columnas)
+
+    def __len__(self):
+        if isinstance(self._filas, slice):
+            return len(range(*self._filas.indices(self.meta['filas'])))
+        return len(self._filas)
+
+    def __getitem__(self, columna):
+        return self._columnas[columna][self._filas]
+
+    def seleccionar(self, years=None, trimesters=None, aglomerados=None, periodos=None):
+        """
+        Panel con las filas de los trimestres y aglomerados pedidos (None = todos).
+        'periodos' (lista de (año, trimestre)) se combina con years/trimesters para
+        pedir trimestres sueltos. Si las filas son contiguas las columnas siguen
+        siendo vistas del memmap.
+        """
+        periodos = None if periodos is None else set(map(tuple, periodos))
+        tramos = [(inicio, fin) for ano, trim, aglo, inicio, fin in self._tramos()
+                  if (years is None or ano in years)
+                  and (trimesters is None or trim in trimesters)
+                  and (periodos is None or (ano, trim) in periodos)
+                  and (aglomerados is None or aglo in aglomerados)]
+        # Unir tramos consecutivos
+        unidos = []
+        for inicio, fin in tramos:
+            if unidos and unidos[-1][1] == inicio:
+                unidos[-1][1] = fin
+            else:
+                unidos.append([inicio, fin])
+
+        if not unidos:
+            filas = slice(0, 0)
+        elif len(unidos) == 1:
+            filas = slice(*unidos[0])
+        else:
+            filas = np.concatenate([np.arange(inicio, fin) for inicio, fin in unidos])
+        if not isinstance(self._filas, slice) or self._filas != slice(None):
+            # Selección sobre una selección: posiciones relativas al panel completo
+            filas = np.arange(self.meta['filas'])[self._filas][filas]
+        return Panel(self.meta, self._columnas, filas)
+
+    def _tramos(self):
+        if isinstance(self._filas, slice) and self._filas == slice(None):
+            return self.meta['tramos']
+        # Tramos de una selección, relativos a sus filas
+        posiciones = np.arange(self.meta['filas'])[self._filas]
+        tramos = []
+        for ano, trim, aglo, inicio, fin in self.meta['tramos']:
+            desde, hasta = np.searchsorted(posiciones, [inicio, fin])
+            if hasta > desde:
+                tramos.append((ano, trim, aglo, int(desde), int(hasta)))
+        return tramos
+
+    def a_dataframe(self, columnas=None):
+        """
+        DataFrame con las 'columnas' pedidas (las que el panel no tenga se ignoran)
+        sobre los arreglos del panel, sin copiarlos si la selección es contigua. Sirve
+        de entrada a las funciones de evolucion_media, media_ingresos y
+        estadisticas_ponderadas, que no modifican el DataFrame recibido.
+        """
+        columnas = self.columnas if columnas is None else [
+            c for c in columnas if c in self._columnas]
+        return pd.DataFrame({c: self[c] for c in columnas}, copy=False)
+
+
+def _ruta_columna(panel_dir, columna):
+    return os.path.join(panel_dir, f"{columna}.bin")
+
+
+def directorio_vigente(panel_dir=PANEL_DIR):
+    """Directorio de la versión vigente del panel según actual.json; None si no hay."""
+    path = os.path.join(panel_dir, ACTUAL_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            version = json.load(f)['version']
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Advertencia: {path} ilegible ({e}). Se reconstruye el panel.")
+        return None
+    return os.path.join(panel_dir, version)
+
+
+def _leer_meta_version(directorio):
+    path = os.path.join(directorio, META_FILENAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Advertencia: panel ilegible en {directorio} ({e}). Se reconstruye.")
+        return None
+
+
+def leer_meta(panel_dir=PANEL_DIR):
+    """Metadatos de la versión vigente del panel; None si no existe o está dañado."""
+    directorio = directorio_vigente(panel_dir)
+    return None if directorio is None else _leer_meta_version(directorio)
+
+
+def _activar_version(panel_dir, version):
+    """Apunta actual.json a 'version' con un reemplazo atómico del archivo."""
+    path = os.path.join(panel_dir, ACTUAL_FILENAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': version}, f)
+    os.replace(path + '.tmp', path)
+
+
+def limpiar_versiones(panel_dir=PANEL_DIR):
+    """
+    Borra las versiones del panel distintas de la vigente (y los archivos del formato
+    anterior, sin versiones). Una versión que otro proceso todavía tiene abierta (en
+    Windows no se puede borrar un archivo mapeado) queda para la próxima limpieza.
+    Devuelve los nombres de las versiones borradas.
+    """
+    if not os.path.isdir(panel_dir):
+        return []
+    vigente = directorio_vigente(panel_dir)
+    vigente = None if vigente is None else os.path.basename(vigente)
+    borradas = []
+    for nombre in os.listdir(panel_dir):
+        path = os.path.join(panel_dir, nombre)
+        try:
+            if os.path.isdir(path) and nombre.startswith(PREFIJO_VERSION) and nombre != vigente:
+                shutil.rmtree(path)
+                borradas.append(nombre)
+            elif nombre == META_FILENAME or nombre.endswith('.bin'):
+                os.remove(path)
+        except OSError as e:
+            print(f"Advertencia: no se pudo borrar {path} ({e}); se reintenta en la próxima limpieza.")
+    return borradas
+
+
+def hashes_origen(years, trimesters, aglomerados=None):
+    """
+    Hash de las particiones de personas y hogares de cada trimestre disponible
+    ({"AAAA-T": hash}), con los aglomerados pedidos o todos los del trimestre.
+    """
+    manifest = load_manifest(MANIFEST_PATH)
+    hashes = {}
+    for year, trim in product(years, trimesters):
+        codigos = aglomerados_del_trimestre(year, trim) if aglomerados is None else aglomerados
+        archivos = find_sanitized_files(year, trim, 'personas', codigos)
+        if not archivos:
+            continue
+        archivos += find_sanitized_files(year, trim, 'hogar', codigos)
+        hashes[f"{year}-{trim}"] = '+'.join(hash_archivo_sanitizado(f, manifest)
+                                            for f in archivos)
+    return hashes
+
+
+def _cargar_trimestre(year, trim, aglomerados):
+    """Personas de un trimestre con las columnas del panel y las de su hogar."""
+    columnas = [c for c in PANEL_DTYPES if c not in COLUMNAS_HOGAR_PANEL]
+    df = load_sanitized_eph_data(columns=list(dict.fromkeys(columnas + CLAVES_HOGAR)),
+                                 periodos=[(year, trim)], aglomerados=aglomerados)
+    if df is None:
+        return None
+    df_hogar = load_sanitized_eph_data(
+        columns=CLAVES_PERIODO + CLAVES_HOGAR + COLUMNAS_HOGAR_PANEL,
+        periodos=[(year, trim)], aglomerados=aglomerados, base='hogar')
+    if df_hogar is None:
+        print(f"Advertencia: T{trim}/{year} sin base de hogares; sus columnas quedan en NaN.")
+        for columna in COLUMNAS_HOGAR_PANEL:
+            df[columna] = np.nan
+        return df
+    resultado = unir_hogares(df, df_hogar, COLUMNAS_HOGAR_PANEL)
+    resultado.attrs['periodos_fallidos'] = periodos_fallidos(df, df_hogar)
+    return resultado
+
+
+def _valores_columna(df, columna):
+    """Valores de la columna del panel en un trimestre (NaN float32 si falta la columna)."""
+    if columna not in df.columns:
+        return np.full(len(df), np.nan, dtype=np.float32)
+    serie = df[columna]
+    if serie.dtype.kind in 'iu':
+        return serie.to_numpy()
+    return serie.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _pasar_a_float32(path, dtype, bloque=1_000_000):
+    """Reescribe como float32 el archivo de una columna guardada como 'dtype', por bloques."""
+    with open(path + '.f32', 'wb') as f:
+        # np.memmap no admite archivos vacíos
+        if os.path.getsize(path):
+            origen = np.memmap(path, dtype=dtype, mode='r')
+            for inicio in range(0, len(origen), bloque):
+                origen[inicio:inicio + bloque].astype(np.float32).tofile(f)
+            del origen
+    os.replace(path + '.f32', path)
+
+
+def construir_panel(years=None, trimesters=None, aglomerados=None, panel_dir=PANEL_DIR,
+                    force=False, limpiar=True):
+    """
+    Arma el panel desde el almacén sanitizado, un trimestre por vez: cada columna
+    se convierte a su tipo de PANEL_DTYPES y se agrega a su archivo binario crudo,
+    así la memoria usada es la de un trimestre y no la del panel completo. Por
+    defecto incluye todos los aglomerados de cada trimestre.
+
+    No hace nada si el panel ya corresponde a las mismas particiones (según sus
+    SHA-256). Se escribe en una versión nueva que se activa al terminar; con
+    'limpiar' se borran después las anteriores (ver limpiar_versiones; quien tenga
+    abierto el panel anterior debe soltarlo y limpiar por su cuenta). Devuelve los
+    metadatos del panel.
+    """
+    years = range(START_YEAR, END_YEAR + 1) if years is None else years
+    trimesters = [1, 2, 3, 4] if trimesters is None else trimesters
+    definicion = {'version': VERSION_PANEL, 'columnas': PANEL_DTYPES,
+                  'aglomerados': None if aglomerados is None else sorted(set(aglomerados))}
+
+    hashes = hashes_origen(years, trimesters, aglomerados)
+    if not hashes:
+        print("ADVERTENCIA: No hay trimestres sanitizados para armar el panel.")
+        return None
+    meta = leer_meta(panel_dir)
+    if (not force and meta is not None and meta.get('definicion') == definicion
+            and meta.get('fuentes') == hashes):
+        print(f"--- Panel al día: {meta['filas']} filas de {len(hashes)} trimestres ---")
+        return meta
+
+    print(f"--- Armando panel de {len(hashes)} trimestres en: {panel_dir} ---")
+    start = time.perf_counter()
+    tmp_dir = os.path.join(panel_dir, f"panel.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # Cada trimestre se agrega al archivo de cada columna apenas se carga: en memoria
+    # solo hay un trimestre por vez
+    columnas = dict(PANEL_DTYPES)
+    archivos = {columna: open(_ruta_columna(tmp_dir, columna), 'wb') for columna in columnas}
+    tramos = []
+    filas = 0
+    completo = False
+    try:
+        for clave in list(hashes):
+            year, trim = (int(v) for v in clave.split('-'))
+            codigos = aglomerados_del_trimestre(year, trim) if aglomerados is None else aglomerados
+            df = _cargar_trimestre(year, trim, codigos)
+            if df is None or periodos_fallidos(df):
+                # Sin su hash en 'fuentes', el panel se vuelve a armar en la próxima llamada
+                print(f"ERROR: T{trim}/{year} no se pudo cargar completo; queda fuera del panel.")
+                del hashes[clave]
+                continue
+
+            # Filas contiguas por aglomerado (las particiones se leen en orden de código)
+            aglo = df['AGLOMERADO'].to_numpy()
+            inicios = np.flatnonzero(np.r_[True, aglo[1:] != aglo[:-1]])
+            finales = np.r_[inicios[1:], len(aglo)]
+            tramos += [[year, trim, int(aglo[i]), filas + int(i), filas + int(f)]
+                       for i, f in zip(inicios, finales)]
+
+            with etapa('write', panel=panel_dir, year=year, trim=trim) as e:
+                for columna in PANEL_DTYPES:
+                    valores = _valores_columna(df, columna)
+                    if (np.dtype(columnas[columna]).kind == 'i' and valores.dtype.kind == 'f'
+                            and np.isnan(valores).any()):
+                        # Un código con faltantes pasa a float32 (con NaN), también en
+                        # las filas ya escritas
+                        print(f"Advertencia: la columna {columna} tiene valores faltantes; "
+                              "se guarda como float32.")
+                        archivos[columna].close()
+                        _pasar_a_float32(_ruta_columna(tmp_dir, columna), columnas[columna])
+                        archivos[columna] = open(_ruta_columna(tmp_dir, columna), 'ab')
+                        columnas[columna] = 'float32'
+                    parte = valores.astype(columnas[columna], copy=False)
+                    parte.tofile(archivos[columna])
+                    e.agregar(bytes=parte.nbytes)
+                e.filas = len(df)
+            filas += len(df)
+            del df
+        completo = True
+    finally:
+        for archivo in archivos.values():
+            archivo.close()
+        if not completo:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # Metadatos al final, con los tramos y los tipos definitivos de cada columna
+    meta = {'definicion': definicion, 'fuentes': hashes, 'filas': filas,
+            'columnas': columnas, 'tramos': tramos}
+    with open(os.path.join(tmp_dir, META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    # Versión nueva (con sufijo si se rearma el mismo contenido con 'force') y activación
+    version = PREFIJO_VERSION + hash_definicion({'definicion': definicion, 'fuentes': hashes})
+    nombre, n = version, 1
+    while os.path.exists(os.path.join(panel_dir, nombre)):
+        nombre, n = f"{version}-{n}", n + 1
+    os.replace(tmp_dir, os.path.join(panel_dir, nombre))
+    _activar_version(panel_dir, nombre)
+    if limpiar:
+        limpiar_versiones(panel_dir)
+
+    mb = sum(np.dtype(d).itemsize for d in columnas.values()) * filas / 2**20
+    print(f"--- Panel armado: {filas} filas, {len(columnas)} columnas, {mb:.1f} MB "
+          f"({time.perf_counter() - start:.1f}s) ---")
+    return meta
+
+
+def abrir_panel(panel_dir=PANEL_DIR, columnas=None):
+    """
+    Abre el panel (o solo sus 'columnas') como memmaps de solo lectura. No lee los
+    datos: cada página se carga al usarse. Devuelve None si no hay panel.
+    """
+    # La versión se resuelve una sola vez: si otro proceso activa una nueva mientras
+    # tanto, este panel sigue leyendo la que abrió
+    directorio = directorio_vigente(panel_dir)
+    meta = None if directorio is None else _leer_meta_version(directorio)
+    if meta is None:
+        print(f"ADVERTENCIA: No hay panel en {panel_dir}. Ejecute construir_panel.")
+        return None
+
+    with etapa('load', panel=panel_dir) as e:
+        arreglos = {}
+        for columna, dtype in meta['columnas'].items():
+            if columnas is not None and columna not in columnas:
+                continue
+            if meta['filas'] == 0:
+                # np.memmap no admite archivos vacíos
+                arreglos[columna] = np.empty(0, dtype=dtype)
+            else:
+                arreglos[columna] = np.memmap(_ruta_columna(directorio, columna), dtype=dtype,
+                                              mode='r', shape=(meta['filas'],))
+        e.filas = meta['filas']
+    return Panel(meta, arreglos)
+
+
+# --- Indicadores sobre el panel ---
+
+
+def tasas_empleo(panel, aglomerado=None, claves_extra=None):
+    """
+    TE, TA y TD por trimestre y aglomerado (ver calcular_tasa_empleo_por_aglomerado).
+    'claves_extra' acepta columnas del panel (p. ej. 'CH04') o funciones que reciben
+    el DataFrame y devuelven una Serie (p. ej. evolucion_media.grupos_de_edad).
+    """
+    claves_extra = list(claves_extra or [])
+    df = panel.a_dataframe(COLUMNAS_TASAS + [c for c in claves_extra if isinstance(c, str)])
+    claves = [c(df) if callable(c) else c for c in claves_extra]
+    return calcular_tasa_empleo_por_aglomerado(aglomerado, df, claves)
+
+
+def media_ingreso_real(panel, base=BASE_DEFLACTOR):
+    """Media del ingreso real de la ocupación principal por trimestre y aglomerado."""
+    df = deflacionar_ingresos(panel.a_dataframe(COLUMNAS_INGRESOS), base=base)
+    return calcular_media_ingreso_real(df) if df is not None else None
+
+
+def media_ipcf_real(panel, base=BASE_DEFLACTOR):
+    """Media del ingreso per cápita familiar real por trimestre y aglomerado."""
+    columnas = ['ANO4', 'TRIMESTRE', 'AGLOMERADO'] + COLUMNAS_INGRESO_HOGAR
+    df = deflacionar_ingresos(panel.a_dataframe(columnas), columnas=('IPCF',),
+                              base=base)
+    return calcular_media_ipcf_real(df) if df is not None else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Arma el panel compacto (np.memmap) desde el almacén sanitizado.")
+    parser.add_argument('--start-year', type=int, default=START_YEAR)
+    parser.add_argument('--end-year', type=int, default=END_YEAR)
+    parser.add_argument('--aglomerados', type=int, nargs='+',
+                        help="Aglomerados a incluir (por defecto, todos).")
+    parser.add_argument('--force', action='store_true',
+                        help="Rearma el panel aunque las particiones no hayan cambiado.")
+    args = parser.parse_args()
+
+    construir_panel(years=range(args.start_year, args.end_year + 1),
+                    aglomerados=args.aglomerados, force=args.force)
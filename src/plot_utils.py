@@ -0,0 +1,14 @@
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+# --- Configuración de visualización ---
+# Vive aquí (y no en utils) para que los módulos de datos no carguen matplotlib ni
+# seaborn: solo los módulos que grafican importan este archivo.
+ESTILO_SEABORN = "whitegrid"
+TAMANO_FIGURA = (12, 7)
+
+
+def configurar_estilo():
+    """Aplica el estilo de seaborn y el tamaño de figura por defecto del informe."""
+    sns.set_style(ESTILO_SEABORN)
+    plt.rcParams['figure.figsize'] = TAMANO_FIGURA
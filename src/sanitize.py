@@ -1,26 +1,53 @@
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
 import zipfile
 import io
+import time
+import shutil
+import argparse
+import multiprocessing
 from itertools import product
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from schema import (EPH_SCHEMA, apply_eph_schema, infer_numeric_columns, scan_column_types,
+                    apply_column_types)
+from utils import SANITIZED_DIR, ARCHIVO_PARTICION, directorio_trimestre, clave_particion
+from manifest import MANIFEST_FILENAME, load_manifest, save_manifest, record_file, is_file_current
+from instrumentacion import (etapa, contexto_etapas, medir_iterable, cantidad_registros,
+                             registros, incorporar_registros, reiniciar_pico_rss)
 
 # --- Configuración ---
+# Se guarda el trimestre nacional completo, particionado por aglomerado en el almacén
+# de utils.SANITIZED_DIR; qué aglomerados usa el informe se decide al cargar
+# (utils.AGLOMERADOS_INTERES), así agregar uno no obliga a reprocesar los ZIP.
 DATA_DIR = './data'
-SANITIZED_DIR = os.path.join(DATA_DIR, 'data_sanitized')
 
-# Define los códigos de los aglomerados que quieres mantener
-# **DEBES VERIFICAR ESTOS CÓDIGOS EN LA DOCUMENTACIÓN DEL INDEC**
-AGLOMERADOS_INTERES = [31, 32]
+MANIFEST_PATH = os.path.join(DATA_DIR, MANIFEST_FILENAME)
+
+# Formato de los archivos sanitizados: 'parquet' (tipado, columnar) o 'csv'
+OUTPUT_FORMATS = ('parquet', 'csv')
+DEFAULT_FORMAT = 'parquet'
+
+# Bases de cada ZIP y palabras que identifican su archivo interno, en orden de prioridad
+BASES = {
+    'personas': ["individual", "personas"],
+    'hogar': ["hogar"],
+}
 
+# Filas leídas por bloque en el particionado en streaming (acota el pico de memoria)
+CHUNK_SIZE = 50_000
 
-def get_data_file_name_from_zip(zip_path):
-    """Inspecciona el ZIP y encuentra el nombre del archivo de datos ('individual' o 'hogar')."""
+
+def get_data_file_name_from_zip(zip_path, base='personas'):
+    """Inspecciona el ZIP y encuentra el nombre del archivo de datos de la base ('personas' o 'hogar')."""
     try:
         with zipfile.ZipFile(zip_path, 'r') as z:
             all_files_in_zip = z.namelist()
 
-            # Prioriza el archivo 'individual' sobre 'hogar'
-            keywords = ["individual", "personas"]
+            keywords = BASES[base]
 
             for keyword in keywords:
                 for filename in all_files_in_zip:
@@ -50,9 +77,357 @@ def load_eph_data(zip_path, internal_file_name):
         return None
 
 
-def sanitize_and_filter_eph(start_year=2016, end_year=2025):
+def write_sanitized(df, output_path):
+    """Guarda un DataFrame sanitizado en CSV o en Parquet (tipado con EPH_SCHEMA) según la extensión."""
+    if output_path.endswith('.parquet'):
+        apply_eph_schema(df).to_parquet(output_path, index=False)
+    else:
+        df.to_csv(output_path, index=False, encoding='utf-8')
+
+
+def particion_path(output_dir, aglomerado, output_format=DEFAULT_FORMAT):
+    """Ruta del archivo de la partición de un aglomerado dentro del directorio del trimestre."""
+    return os.path.join(output_dir, f"AGLOMERADO={aglomerado}",
+                        f"{ARCHIVO_PARTICION}.{output_format}")
+
+
+def stream_partition_eph(zip_path, internal_file_name, output_dir,
+                         output_format=DEFAULT_FORMAT, chunksize=CHUNK_SIZE):
     """
-    Carga, filtra por aglomerado (AGLOMERADO) y guarda los datos limpios.
+    Lee el archivo interno del ZIP por bloques, separa cada bloque por AGLOMERADO y
+    agrega cada parte a la partición de su aglomerado en output_dir
+    (AGLOMERADO={código}/datos.parquet o .csv). La memoria usada depende del tamaño
+    del bloque y no del archivo. En Parquet, una primera pasada por bloques
+    (scan_column_types) fija el tipo de cada columna para el archivo completo; en la
+    segunda solo las columnas de texto se leen como texto y cada bloque se tipa con
+    esos tipos, así todos tienen el mismo esquema que la carga completa aunque una
+    columna vacía al principio traiga texto más adelante. En CSV los valores se
+    copian como texto. Las filas sin AGLOMERADO válido se descartan.
+
+    Devuelve (filas_originales, {aglomerado: filas_guardadas}), o None si hubo un error.
+    """
+    rows_in = 0
+    rows_out = {}
+    writers = {}
+    leido = False
+    ok = False
+
+    def leer_bloques(f, dtype=None):
+        return pd.read_csv(
+            io.TextIOWrapper(f, encoding='latin1'),
+            sep=';',
+            dtype=dtype,
+            low_memory=False,
+            chunksize=chunksize
+        )
+
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as z:
+            # Tipos de las columnas para el archivo completo (no los del primer bloque)
+            tipos = None
+            dtype_lectura = str
+            if output_format != 'csv':
+                with z.open(internal_file_name) as f:
+                    tipos = scan_column_types(medir_iterable('parse', leer_bloques(f),
+                                                             pasada='tipos'))
+                for columna, dtype in tipos.items():
+                    if dtype != EPH_SCHEMA.get(columna, dtype):
+                        print(f"Advertencia: la columna {columna} tiene valores no numéricos; "
+                              "se deja como float64.")
+                # Leer como texto solo lo que queda como texto: un bloque de números
+                # ocupa bastante menos que el mismo bloque en cadenas
+                dtype_lectura = {columna: str for columna, dtype in tipos.items()
+                                 if dtype in ('object', 'category')}
+
+            # La descompresión ocurre al leer cada bloque y se mide en 'parse'
+            with etapa('unzip', archivo=internal_file_name) as e:
+                f = z.open(internal_file_name)
+                e.bytes = z.getinfo(internal_file_name).file_size
+            with f:
+                reader = leer_bloques(f, dtype_lectura)
+                for i, chunk in enumerate(medir_iterable('parse', reader)):
+                    if 'AGLOMERADO' not in chunk.columns:
+                        print(
+                            f"ERROR: Columna 'AGLOMERADO' no encontrada en {internal_file_name}. Verifique el diseño de registro y el separador (sep) en read_csv.")
+                        break
+                    leido = True
+                    rows_in += len(chunk)
+
+                    # Ordenar el bloque por aglomerado: cada partición es un tramo contiguo
+                    with etapa('filter', bloque=i) as e:
+                        codigos = chunk['AGLOMERADO']
+                        if codigos.dtype == object:
+                            codigos = codigos.str.strip()
+                        codigos = pd.to_numeric(codigos, errors='coerce').to_numpy(dtype='float64')
+                        validas = np.flatnonzero(~np.isnan(codigos))
+                        orden = validas[np.argsort(codigos[validas], kind='stable')]
+                        chunk = chunk.iloc[orden]
+                        codigos_tramo, inicios = np.unique(codigos[orden], return_index=True)
+                        finales = np.append(inicios[1:], len(orden))
+                        e.filas = len(orden)
+
+                    with etapa('write', bloque=i) as e:
+                        # El esquema se aplica una vez al bloque, no a cada partición
+                        if output_format != 'csv':
+                            table = pa.Table.from_pandas(apply_column_types(chunk, tipos),
+                                                         preserve_index=False)
+                            # Una columna de texto vacía en todo el bloque no tiene tipo
+                            for posicion, campo in enumerate(table.schema):
+                                if pa.types.is_null(campo.type):
+                                    table = table.set_column(posicion, campo.name,
+                                                             table.column(posicion).cast(pa.string()))
+                        for codigo, inicio, final in zip(codigos_tramo.astype(int).tolist(), inicios.tolist(),
+                                                        finales.tolist()):
+                            path = particion_path(output_dir, codigo, output_format)
+                            primero = codigo not in rows_out
+                            if primero:
+                                os.makedirs(os.path.dirname(path), exist_ok=True)
+                                rows_out[codigo] = 0
+                            rows_out[codigo] += final - inicio
+
+                            if output_format == 'csv':
+                                chunk.iloc[inicio:final].to_csv(
+                                    path, mode='w' if primero else 'a', header=primero,
+                                    index=False, encoding='utf-8')
+                                e.agregar(filas=final - inicio)
+                                continue
+                            tramo = table.slice(inicio, final - inicio)
+                            if primero:
+                                writers[codigo] = pq.ParquetWriter(path, tramo.schema)
+                            writers[codigo].write_table(tramo)
+                            e.agregar(filas=final - inicio, bytes=tramo.nbytes)
+                else:
+                    ok = leido
+    except Exception as e:
+        print(f"Error cargando archivo interno {internal_file_name}: {e}")
+        ok = False
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    if not ok:
+        return None
+    return rows_in, rows_out
+
+
+def ensure_raw_entry(manifest, zip_filename, zip_path):
+    """Registra (o actualiza) el ZIP en el manifiesto y devuelve su entrada."""
+    if not is_file_current(manifest, 'raw', zip_filename, zip_path):
+        previous = manifest['raw'].get(zip_filename, {})
+        record_file(manifest, 'raw', zip_filename, zip_path,
+                    url=previous.get('url'))
+    return manifest['raw'][zip_filename]
+
+
+def clave_trimestre(year, trim, base):
+    """Clave de un trimestre sanitizado en la sección 'trimestres' del manifiesto."""
+    return clave_particion(directorio_trimestre(year, trim, base))
+
+
+def is_sanitized_current(manifest, year, trim, base, source_sha256, output_format):
+    """
+    Indica si el trimestre de la base ya está particionado en el formato pedido, a
+    partir del mismo ZIP, y si todas sus particiones siguen intactas.
+    """
+    entry = manifest['trimestres'].get(clave_trimestre(year, trim, base))
+    if entry is None:
+        return False
+    if entry.get('source_sha256') != source_sha256 or entry.get('formato') != output_format:
+        return False
+    output_dir = directorio_trimestre(year, trim, base)
+    for aglomerado in entry.get('aglomerados', []):
+        path = particion_path(output_dir, aglomerado, output_format)
+        if not is_file_current(manifest, 'sanitized', clave_particion(path), path):
+            return False
+    return True
+
+
+def record_quarter(manifest, year, trim, base, zip_filename, output_format, aglomerados,
+                   ausente=False):
+    """
+    Registra en el manifiesto las particiones de un trimestre recién escrito (y
+    borra las que tenía antes) junto con el ZIP de origen. Con 'ausente' se registra
+    que el ZIP no trae la base (sin particiones), así no se reintenta en cada corrida.
+    """
+    source_sha256 = manifest['raw'][zip_filename]['sha256']
+    prefijo = clave_trimestre(year, trim, base) + '/'
+    for key in [k for k in manifest['sanitized'] if k.startswith(prefijo)]:
+        del manifest['sanitized'][key]
+
+    output_dir = directorio_trimestre(year, trim, base)
+    for aglomerado in aglomerados:
+        path = particion_path(output_dir, aglomerado, output_format)
+        record_file(manifest, 'sanitized', clave_particion(path), path,
+                    source=zip_filename, source_sha256=source_sha256)
+    manifest['trimestres'][clave_trimestre(year, trim, base)] = {
+        'source': zip_filename,
+        'source_sha256': source_sha256,
+        'formato': output_format,
+        'aglomerados': sorted(aglomerados),
+    }
+    if ausente:
+        manifest['trimestres'][clave_trimestre(year, trim, base)]['ausente'] = True
+
+
+def sanitize_member(zip_path, internal_file_name, output_dir, output_format=DEFAULT_FORMAT,
+                    chunksize=CHUNK_SIZE):
+    """
+    Particiona por aglomerado un archivo interno del ZIP y guarda cada partición en
+    output_dir. Con 'chunksize' se procesa en streaming (ver stream_partition_eph);
+    con chunksize=None se carga completo en memoria con load_eph_data.
+
+    Devuelve (filas_originales, {aglomerado: filas_guardadas}), o None si hubo un error.
+    """
+    if chunksize:
+        # Particionado en streaming: cada bloque se separa y se escribe al llegar
+        return stream_partition_eph(zip_path, internal_file_name, output_dir,
+                                    output_format, chunksize)
+
+    # Cargar el DataFrame completo (descompresión y parseo juntos)
+    with etapa('parse', archivo=internal_file_name) as e:
+        df = load_eph_data(zip_path, internal_file_name)
+        e.bytes = os.path.getsize(zip_path)
+        e.filas = len(df) if df is not None else None
+    if df is None:
+        return None
+
+    if 'AGLOMERADO' not in df.columns:
+        print(
+            f"ERROR: Columna 'AGLOMERADO' no encontrada en {internal_file_name}. Verifique el diseño de registro y el separador (sep) en read_csv.")
+        return None
+
+    # Separar por la columna 'AGLOMERADO' (el esquema se aplica una sola vez, antes;
+    # write_sanitized ya no tiene nada que convertir en cada partición). Las demás
+    # columnas numéricas se tipan sobre el archivo completo, no por partición, igual
+    # que en el modo en streaming.
+    with etapa('filter') as e:
+        apply_eph_schema(df)
+        if output_format != 'csv':
+            infer_numeric_columns(df)
+        codigos = pd.to_numeric(df['AGLOMERADO'], errors='coerce')
+        partes = df.groupby(codigos, sort=True)
+        e.filas = int(codigos.notna().sum())
+
+    # Guardar una partición por aglomerado
+    rows_out = {}
+    with etapa('write') as e:
+        for codigo, parte in partes:
+            path = particion_path(output_dir, int(codigo), output_format)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_sanitized(parte.copy(), path)
+            rows_out[int(codigo)] = len(parte)
+            e.agregar(filas=len(parte), bytes=os.path.getsize(path))
+    return len(df), rows_out
+
+
+def sanitize_quarter(year, trim, zip_path, output_format=DEFAULT_FORMAT, chunksize=CHUNK_SIZE,
+                     bases=tuple(BASES)):
+    """
+    Sanitiza un trimestre: extrae de su ZIP las 'bases' (personas y hogares), separa
+    cada una por aglomerado y reemplaza sus particiones en el almacén. Cada base se
+    escribe en un directorio temporal que se renombra al terminar, así un trimestre
+    nunca queda a medias. Es independiente del resto de los trimestres, por lo que
+    puede ejecutarse en un proceso aparte.
+
+    Devuelve un dict con el resultado de personas, las bases reemplazadas ('bases',
+    con las filas por aglomerado; las que el ZIP no trae, con 'ausente'), el tiempo y
+    los registros de sus etapas ('etapas', ver instrumentacion.py). Un error en una
+    base no descarta las que ya se reemplazaron; 'ok' indica si se completaron todas.
+    'chunksize' se pasa a sanitize_member.
+    """
+    start = time.perf_counter()
+    result = {'year': year, 'trim': trim, 'ok': False,
+              'rows_in': 0, 'rows_out': 0, 'segundos': 0.0, 'bases': {}}
+
+    # En un proceso del pool se reinicia el pico de RSS para que sea el del trimestre
+    if multiprocessing.parent_process() is not None:
+        reiniciar_pico_rss()
+    registros_previos = cantidad_registros()
+    print(f"Procesando T{trim}/{year}...")
+
+    for base in bases:
+        # 1. Encontrar nombre interno
+        output_dir = directorio_trimestre(year, trim, base)
+        internal_file_name = get_data_file_name_from_zip(zip_path, base)
+        if not internal_file_name:
+            print(
+                f"Advertencia: No se encontró el archivo de {base} dentro de {os.path.basename(zip_path)}.")
+            if zipfile.is_zipfile(zip_path):
+                # El ZIP se pudo leer y no trae la base: lo que haya es de otra versión
+                shutil.rmtree(output_dir, ignore_errors=True)
+                result['bases'][base] = {'rows_in': 0, 'rows_out': 0, 'particiones': {},
+                                         'ausente': True}
+            continue
+
+        # 2. Particionar en un directorio temporal
+        tmp_dir = output_dir + '.tmp'
+        try:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            with contexto_etapas(year=year, trim=trim, base=base):
+                counts = sanitize_member(zip_path, internal_file_name, tmp_dir,
+                                         output_format, chunksize)
+            if counts is None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                continue
+
+            # 3. Reemplazar el trimestre anterior
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.replace(tmp_dir, output_dir)
+        except Exception as e:
+            print(f"ERROR al guardar {base} de T{trim}/{year}: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            continue
+
+        rows_in, particiones = counts
+        rows_out = sum(particiones.values())
+        print(
+            f"Particionado ({base}): {rows_in} filas originales, {rows_out} filas guardadas "
+            f"en {len(particiones)} aglomerados.")
+        result['bases'][base] = {'rows_in': rows_in, 'rows_out': rows_out,
+                                 'particiones': particiones}
+
+    if 'personas' in result['bases']:
+        result.update(rows_in=result['bases']['personas']['rows_in'],
+                      rows_out=result['bases']['personas']['rows_out'])
+    result['ok'] = all(base in result['bases'] for base in bases)
+    result['segundos'] = time.perf_counter() - start
+    result['etapas'] = registros(registros_previos)
+    return result
+
+
+def print_timing_summary(results, wall_time):
+    """Imprime el tiempo de cada trimestre y compara el total con el tiempo de reloj."""
+    if not results:
+        return
+
+    print("--- Tiempos por trimestre ---")
+    for r in sorted(results, key=lambda r: (r['year'], r['trim'])):
+        estado = "ok" if r['ok'] else "error"
+        print(
+            f"T{r['trim']}/{r['year']}: {r['segundos']:.2f} s ({r['rows_out']} filas, {estado})")
+
+    total = sum(r['segundos'] for r in results)
+    speedup = total / wall_time if wall_time > 0 else 1.0
+    print(
+        f"Total: {wall_time:.2f} s de reloj, {total:.2f} s sumando trimestres (x{speedup:.1f})")
+
+
+def sanitize_and_filter_eph(start_year=2016, end_year=2025, force=False, workers=1,
+                            chunksize=CHUNK_SIZE, output_format=DEFAULT_FORMAT):
+    """
+    Carga, separa por aglomerado (AGLOMERADO) y guarda los datos limpios de las
+    bases de personas y de hogares de cada trimestre en el almacén particionado.
+
+    Solo se reprocesan las bases de cada trimestre cuyo ZIP o formato cambió desde
+    la última corrida según el manifiesto; 'force=True' reprocesa todo. Cada base
+    se registra en el manifiesto apenas se reemplaza, aunque otra del mismo
+    trimestre falle. Con 'workers' > 1
+    los trimestres se sanitizan en paralelo en un pool de procesos; los archivos
+    generados son los mismos que en modo serial. 'chunksize' se pasa a
+    sanitize_quarter (None = cargar cada archivo completo en memoria).
+    'output_format' elige entre Parquet tipado (por defecto) y CSV.
     """
     print(
         f"--- Inicializando Sanitización y Filtrado ({start_year}-{end_year}) ---")
@@ -65,10 +440,9 @@ def sanitize_and_filter_eph(start_year=2016, end_year=2025):
     years = range(start_year, end_year + 1)
     trimesters = [1, 2, 3, 4]
 
-    # Lista de aglomerados para incluir en el nombre del archivo
-    aglomerados_str = "_".join(map(str, AGLOMERADOS_INTERES))
-
-    processed_count = 0
+    manifest = load_manifest(MANIFEST_PATH)
+    pending = []
+    skipped_count = 0
 
     for year, trim in product(years, trimesters):
         # 2. Definir rutas
@@ -80,44 +454,81 @@ def sanitize_and_filter_eph(start_year=2016, end_year=2025):
             # print(f"Saltando T{trim}/{year}: Archivo ZIP no encontrado.")
             continue
 
-        print(f"Procesando T{trim}/{year}...")
-
-        # 4. Encontrar nombre interno y Cargar DataFrame
-        internal_file_name = get_data_file_name_from_zip(zip_path)
-        if not internal_file_name:
-            print(
-                f"Advertencia: No se encontró el archivo de datos dentro de {standardized_zip_filename}.")
-            continue
-
-        df = load_eph_data(zip_path, internal_file_name)
-        if df is None:
+        # 4. Saltar las bases en las que ni el ZIP ni el formato cambiaron
+        # (particiones en {base}/ANO4={year}/TRIMESTRE={trim}/AGLOMERADO={código}/)
+        raw_entry = ensure_raw_entry(
+            manifest, standardized_zip_filename, zip_path)
+        bases = [base for base in BASES
+                 if force or not is_sanitized_current(manifest, year, trim, base,
+                                                      raw_entry['sha256'], output_format)]
+        if not bases:
+            skipped_count += 1
             continue
 
-        # 5. Sanitización: Filtrar por la columna 'AGLOMERADO'
-        if 'AGLOMERADO' not in df.columns:
-            print(
-                f"ERROR: Columna 'AGLOMERADO' no encontrada en T{trim}/{year}. Verifique el diseño de registro y el separador (sep) en read_csv.")
-            continue
+        pending.append((year, trim, zip_path, tuple(bases)))
+    save_manifest(manifest, MANIFEST_PATH)
 
-        df_filtered = df[df['AGLOMERADO'].isin(AGLOMERADOS_INTERES)].copy()
-
-        print(
-            f"Filtrado aplicado: {len(df)} filas originales, {len(df_filtered)} filas retenidas.")
-
-        # 6. Guardar el DataFrame Sanitizado
+    # 5. Sanitizar los trimestres pendientes (en serie o en un pool de procesos) y
+    # registrar cada uno en el manifiesto al terminar (solo el proceso principal escribe)
+    start = time.perf_counter()
+    results = []
+    processed_count = 0
 
-        # Nuevo nombre: EPH_T{trim}_{year}_AGLOS_33_20_29.csv
-        sanitized_filename = f"EPH_T{trim}_{year}_AGLOS_{aglomerados_str}.csv"
-        sanitized_path = os.path.join(SANITIZED_DIR, sanitized_filename)
+    def registrar(result, zip_path):
+        nonlocal processed_count
+        for base, info in result['bases'].items():
+            record_quarter(manifest, result['year'], result['trim'], base,
+                           os.path.basename(zip_path), output_format, info['particiones'],
+                           ausente=info.get('ausente', False))
+        save_manifest(manifest, MANIFEST_PATH)
+        results.append(result)
+        processed_count += result['ok']
 
-        df_filtered.to_csv(sanitized_path, index=False, encoding='utf-8')
-        processed_count += 1
-        print(f"Guardado como: {sanitized_filename}")
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(sanitize_quarter, year, trim, zip_path,
+                                       output_format=output_format, chunksize=chunksize,
+                                       bases=bases): (year, trim, zip_path)
+                       for year, trim, zip_path, bases in pending}
+            for future in as_completed(futures):
+                year, trim, zip_path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"ERROR al sanitizar T{trim}/{year}: {e}")
+                    continue
+                # Los registros de etapas de cada proceso vuelven con su resultado
+                incorporar_registros(result['etapas'])
+                registrar(result, zip_path)
+    else:
+        for year, trim, zip_path, bases in pending:
+            registrar(sanitize_quarter(year, trim, zip_path, output_format=output_format,
+                                       chunksize=chunksize, bases=bases), zip_path)
+    wall_time = time.perf_counter() - start
 
+    print_timing_summary(results, wall_time)
     print(
-        f"--- Finalizado. Archivos procesados y guardados: {processed_count} ---")
+        f"--- Finalizado. Trimestres procesados y guardados: {processed_count}. "
+        f"Sin cambios: {skipped_count} ---")
 
 
 if __name__ == '__main__':
     # Ejecuta esta función después de que el scraper haya descargado los ZIPs
-    sanitize_and_filter_eph(start_year=2016, end_year=2025)
+    parser = argparse.ArgumentParser(
+        description="Sanitiza y particiona por aglomerado los microdatos EPH descargados.")
+    parser.add_argument('--start-year', type=int, default=2016)
+    parser.add_argument('--end-year', type=int, default=2025)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Cantidad de procesos para sanitizar trimestres en paralelo.")
+    parser.add_argument('--force', action='store_true',
+                        help="Reprocesa todos los trimestres aunque no hayan cambiado.")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT,
+                        help="Formato de los archivos sanitizados.")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE,
+                        help="Filas por bloque al filtrar en streaming (0 = cargar el archivo completo).")
+    args = parser.parse_args()
+
+    sanitize_and_filter_eph(start_year=args.start_year, end_year=args.end_year,
+                            force=args.force, workers=args.workers,
+                            chunksize=args.chunksize or None,
+                            output_format=args.format)
@@ -0,0 +1,186 @@
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# --- Esquema de tipos de la EPH (bases de personas y hogares) ---
+# Tipos compactos para las columnas que usa el análisis. Los códigos numéricos que se
+# comparan o agrupan (ESTADO, CH04, CH06...) van como enteros chicos; los códigos de
+# texto con pocos valores distintos van como categóricos. Los ingresos son float64
+# porque pueden traer decimales (con coma en los TXT del INDEC).
+# Las columnas que no figuran aquí se conservan con el tipo con que se leyeron, salvo
+# al sanitizar, donde infer_numeric_columns pasa a float64 las que son numéricas.
+EPH_SCHEMA = {
+    # Identificación
+    'CODUSU': 'object',
+    'ANO4': 'int16',
+    'TRIMESTRE': 'int8',
+    'NRO_HOGAR': 'int8',
+    'COMPONENTE': 'int8',
+    'REGION': 'category',
+    'MAS_500': 'category',
+    'AGLOMERADO': 'int16',
+    # Ponderadores
+    'PONDERA': 'int32',
+    'PONDIIO': 'int32',
+    'PONDII': 'int32',
+    'PONDIH': 'int32',
+    # Características de los hogares
+    'IX_TOT': 'int8',
+    # Características de las personas
+    'CH04': 'int8',
+    'CH06': 'int16',
+    'NIVEL_ED': 'int8',
+    'ESTADO': 'int8',
+    'CAT_OCUP': 'int8',
+    'CAT_INAC': 'int8',
+    # Ingresos
+    'P21': 'float64',
+    'ITF': 'float64',
+    'IPCF': 'float64',
+}
+
+
+def _to_numeric(series):
+    """Convierte texto a número aceptando coma decimal; los valores inválidos quedan NaN."""
+    if series.dtype == object:
+        # Camino rápido: la mayoría de las columnas ya son números con punto decimal
+        # (astype parsea texto bastante más rápido que pd.to_numeric)
+        try:
+            return series.astype('float64')
+        except (ValueError, TypeError):
+            series = series.str.strip().str.replace(',', '.', regex=False)
+    return pd.to_numeric(series, errors='coerce')
+
+
+def apply_eph_schema(df):
+    """
+    Convierte in-place las columnas presentes en 'df' a los tipos de EPH_SCHEMA y
+    devuelve el mismo DataFrame.
+
+    Si una columna entera trae valores no numéricos (NaN tras la conversión), se deja
+    como float64 y se avisa, en lugar de fallar la carga completa.
+    """
+    for column, dtype in EPH_SCHEMA.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+
+        if dtype in ('object', 'category'):
+            values = df[column]
+            if values.dtype != object:
+                values = values.astype(str)
+            df[column] = values.astype(dtype)
+            continue
+
+        values = _to_numeric(df[column])
+        if dtype.startswith('int') and values.isna().any():
+            print(
+                f"Advertencia: la columna {column} tiene valores no numéricos; se deja como float64.")
+            df[column] = values.astype('float64')
+        else:
+            df[column] = values.astype(dtype)
+    return df
+
+
+def infer_numeric_columns(df):
+    """
+    Convierte in-place a float64 las columnas fuera de EPH_SCHEMA cuyos valores no
+    vacíos son todos numéricos (acepta coma decimal) y devuelve el mismo DataFrame.
+    Las columnas con texto quedan como object.
+
+    Se usa float64 aunque la columna traiga enteros para que el tipo no dependa de
+    si hay valores vacíos: así el sanitizado por bloques (leído como texto) y el de
+    carga completa (tipos inferidos por read_csv) escriben el mismo esquema.
+    """
+    for column in df.columns:
+        if column in EPH_SCHEMA or df[column].dtype == 'float64':
+            continue
+
+        values = df[column]
+        if values.dtype != object:
+            if pd.api.types.is_numeric_dtype(values):
+                df[column] = values.astype('float64')
+            continue
+
+        numbers = _to_numeric(values)
+        # Solo se revisan los valores que no se pudieron convertir: deben estar vacíos
+        faltantes = values[numbers.isna().to_numpy()].dropna()
+        if (faltantes.str.strip() == '').all():
+            df[column] = numbers.astype('float64')
+    return df
+
+
+def scan_column_types(frames):
+    """
+    Recorre un archivo leído en bloques ('frames') y devuelve el tipo de
+    cada columna para el archivo completo: el mismo que le dan apply_eph_schema e
+    infer_numeric_columns al cargarlo entero. Un código entero con algún valor
+    faltante o inválido queda float64, y una columna fuera de EPH_SCHEMA queda
+    object si algún valor no vacío no es numérico (aunque los primeros bloques lo
+    sean). Sirve para que todos los bloques se escriban con el mismo esquema.
+    """
+    columns = {}
+    with_missing = set()
+    with_text = set()
+    for df in frames:
+        for column in df.columns:
+            columns.setdefault(column, None)
+            dtype = EPH_SCHEMA.get(column)
+            if dtype in ('object', 'category') or column in with_text:
+                continue
+            if dtype is not None and column in with_missing:
+                continue
+
+            values = df[column]
+            invalid = _to_numeric(values).isna().to_numpy()
+            if not invalid.any():
+                continue
+            with_missing.add(column)
+            if dtype is None and values.dtype == object and \
+                    (values[invalid].dropna().str.strip() != '').any():
+                with_text.add(column)
+
+    types = {}
+    for column in columns:
+        dtype = EPH_SCHEMA.get(column)
+        if dtype is None:
+            types[column] = 'object' if column in with_text else 'float64'
+        elif dtype.startswith('int') and column in with_missing:
+            types[column] = 'float64'
+        else:
+            types[column] = dtype
+    return types
+
+
+def apply_column_types(df, types):
+    """
+    Convierte in-place un bloque a los tipos de scan_column_types y devuelve el
+    mismo DataFrame. Las columnas object quedan como texto.
+    """
+    for column, dtype in types.items():
+        if column not in df.columns or df[column].dtype == dtype or dtype == 'object':
+            continue
+        if dtype == 'category':
+            df[column] = df[column].astype('category')
+        else:
+            df[column] = _to_numeric(df[column]).astype(dtype)
+    return df
+
+
+def concat_eph(frames):
+    """
+    Concatena DataFrames ya tipados conservando los categóricos: pd.concat los
+    convierte a object si las categorías de cada trimestre no coinciden.
+    """
+    frames = list(frames)
+    if not frames:
+        return None
+
+    category_columns = [c for c, dtype in EPH_SCHEMA.items() if dtype == 'category'
+                        and all(c in f.columns and isinstance(f[c].dtype, CategoricalDtype)
+                                for f in frames)]
+    for column in category_columns:
+        categories = sorted(set().union(
+            *(f[column].cat.categories for f in frames)))
+        for f in frames:
+            f[column] = f[column].cat.set_categories(categories)
+
+    return pd.concat(frames, ignore_index=True)
@@ -1,8 +1,17 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import os
+import re
+import json
+import time
+import zipfile
 from urllib.parse import urljoin
 from itertools import product
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from instrumentacion import etapa
+from manifest import MANIFEST_FILENAME, load_manifest, save_manifest, record_file, is_file_current
 
 # --- Configuración ---
 # URL de ejemplo del repositorio de microdatos del INDEC.
@@ -13,6 +22,26 @@ TARGET_DIR = './data'
 # T es el trimestre (1, 2, 3, 4) y YYYY el año (2016 a 2025)
 # Esto es esencial para el filtrado.
 
+# Una única expresión cubre todas las variantes de nombre publicadas por el INDEC:
+#   EPH_usu_1_Trim_YYYY_txt.zip, EPH_usu_1erTrim_YYYY_txt.zip, EPH_usu_1er_Trim_YYYY_txt.zip
+# (y sus equivalentes 2do, 3er, 4to)
+LINK_PATTERN = re.compile(
+    r'_(?P<trim>[1-4])(?:_|(?:er|do|to)_?)Trim_(?P<year>\d{4})_txt\.zip$')
+EPH_LINK_PATH = "/ftp/cuadros/menusuperior/eph/"
+
+# Copia local del índice de links de la página BASE_URL junto con su ETag/Last-Modified
+LISTING_CACHE_FILENAME = 'listing_cache.json'
+
+# Cantidad de descargas simultáneas (comparten el pool de conexiones de la sesión)
+MAX_WORKERS = 4
+# Tamaño de los bloques leídos de la respuesta HTTP
+CHUNK_SIZE = 64 * 1024
+# Sufijo de los archivos parciales; se renombran al completar la descarga
+PARTIAL_SUFFIX = '.part'
+# Junto a cada parcial se guarda el validador (ETag o Last-Modified) de la respuesta
+# que lo originó; al reanudar se envía en If-Range para no mezclar dos versiones
+PARTIAL_META_SUFFIX = '.part.json'
+
 
 def generate_eph_periods(start_year, end_year):
     """Genera una lista de tuplas (año, trimestre) para el rango especificado."""
@@ -23,126 +52,369 @@ def generate_eph_periods(start_year, end_year):
     return list(product(years, trimesters))
 
 
-def download_file(url, target_path):
-    """Descarga un archivo desde una URL y lo guarda en target_path."""
-    print(f"Descargando {os.path.basename(target_path)}...")
+def create_session(pool_size=MAX_WORKERS):
+    """Crea una sesión HTTP cuyo pool de conexiones se comparte entre los hilos de descarga."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1,
+                          pool_maxsize=pool_size, max_retries=3)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _request_range(session, url, offset, validador=None):
+    """
+    Abre la descarga pidiendo los bytes desde 'offset' (HTTP Range) si hay un parcial.
+    Con If-Range el servidor envía el archivo completo (200) si cambió desde 'validador'.
+    """
+    headers = {}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = validador
+    return session.get(url, stream=True, timeout=30, headers=headers)
+
+
+def _rango_pedido(response, offset):
+    """Indica si una respuesta 206 trae los bytes desde 'offset' (y no otro rango)."""
+    return offset > 0 and response.headers.get('Content-Range', '').startswith(f'bytes {offset}-')
+
+
+def _validador(response):
+    """ETag fuerte o Last-Modified de la respuesta (If-Range no admite ETag débiles)."""
+    etag = response.headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('Last-Modified')
 
-    # Usa 'stream=True' para descargar archivos grandes eficientemente
+
+def _leer_validador_parcial(tmp_path, url):
+    """Validador guardado del parcial, o None si no hay (o es de otra URL)."""
     try:
-        response = requests.get(url, stream=True, timeout=30)
-        response.raise_for_status()  # Lanza excepción para códigos de error HTTP
-
-        with open(target_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:  # Filtrar fragmentos keep-alive
-                    f.write(chunk)
-        print(f"Descarga de {os.path.basename(target_path)} completada.")
-        return True
-    except requests.exceptions.RequestException as e:
-        print(f"Error al descargar {os.path.basename(target_path)}: {e}")
+        with open(tmp_path[:-len(PARTIAL_SUFFIX)] + PARTIAL_META_SUFFIX, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta.get('validador') if meta.get('url') == url else None
+
+
+def _guardar_validador_parcial(tmp_path, url, validador):
+    meta_path = tmp_path[:-len(PARTIAL_SUFFIX)] + PARTIAL_META_SUFFIX
+    if validador is None:
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        return
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'validador': validador}, f)
+
+
+def download_file(url, target_path, session=None):
+    """
+    Descarga un archivo desde una URL y lo guarda en target_path.
+
+    Escribe en 'target_path.part' y renombra al terminar, de modo que target_path
+    solo existe si la descarga está completa. Si quedó un parcial de una corrida
+    anterior, se reanuda con HTTP Range e If-Range (con el ETag o Last-Modified de
+    la respuesta que lo originó); si el archivo cambió en el servidor se descarga de
+    nuevo desde cero. Devuelve un dict con las estadísticas de
+    la transferencia, o None si falló. La transferencia se mide como la etapa 'http'.
+    """
+    with etapa('http', archivo=os.path.basename(target_path)) as e:
+        stats = _download_file(url, target_path, session)
+        e.bytes = stats['bytes'] if stats else None
+    return stats
+
+
+def _download_file(url, target_path, session):
+    filename = os.path.basename(target_path)
+    tmp_path = target_path + PARTIAL_SUFFIX
+    session = session or requests
+    offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+    validador = _leer_validador_parcial(tmp_path, url) if offset else None
+    if offset and validador is None:
+        # Sin validador no hay forma de saber si el parcial es de la misma versión
+        offset = 0
+
+    if offset:
+        print(f"Reanudando {filename} desde el byte {offset}...")
+    else:
+        print(f"Descargando {filename}...")
+
+    start = time.perf_counter()
+    written = 0
+    try:
+        response = _request_range(session, url, offset, validador)
+        if offset and response.status_code == 416:
+            # El servidor rechaza el rango: el parcial no es válido, se reinicia
+            response.close()
+            offset = 0
+            response = _request_range(session, url, offset)
+        elif offset and response.status_code == 206 and not _rango_pedido(response, offset):
+            # Un 206 de otro rango no continúa el parcial: se pide una vez el archivo completo
+            print(f"{filename}: el servidor envió un rango distinto del pedido. "
+                  "Se descarga completo.")
+            response.close()
+            offset = 0
+            response = _request_range(session, url, offset)
+
+        with response:
+            response.raise_for_status()  # Lanza excepción para códigos de error HTTP
+
+            # 206: el servidor respetó el rango (y el archivo no cambió). 200: envía el
+            # archivo completo, que reemplaza al parcial. Un 206 sin pedir rango (o de
+            # otro rango) traería solo una parte del archivo: es un error.
+            if response.status_code == 206 and not _rango_pedido(response, offset):
+                print(f"Error al descargar {filename}: el servidor envió el rango "
+                      f"'{response.headers.get('Content-Range')}' sin que se pidiera.")
+                return None
+            resumed = offset > 0 and response.status_code == 206
+            if not resumed:
+                offset = 0
+                _guardar_validador_parcial(tmp_path, url, _validador(response))
+
+            expected = response.headers.get('Content-Length')
+            expected = int(expected) + offset if expected else None
+
+            # Usa 'stream=True' para descargar archivos grandes eficientemente
+            with open(tmp_path, 'ab' if resumed else 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:  # Filtrar fragmentos keep-alive
+                        f.write(chunk)
+                        written += len(chunk)
+    except (requests.exceptions.RequestException, OSError) as e:
+        # El parcial se conserva para reanudar en la próxima corrida
+        print(f"Error al descargar {filename}: {e}")
+        return None
+
+    total = offset + written
+    if expected is not None and total != expected:
+        print(
+            f"Error al descargar {filename}: se recibieron {total} de {expected} bytes.")
+        return None
+
+    # Renombrado atómico: nunca queda un ZIP truncado con el nombre final
+    os.replace(tmp_path, target_path)
+    _guardar_validador_parcial(tmp_path, url, None)
+    elapsed = time.perf_counter() - start
+    print(f"Descarga de {filename} completada.")
+    return {
+        'archivo': filename,
+        'bytes': written,
+        'total_bytes': total,
+        'segundos': elapsed,
+        'reanudado': resumed,
+    }
+
+
+def is_download_current(manifest, filename, filepath, url):
+    """
+    Indica si el ZIP local está completo y corresponde a 'url'.
+
+    Un archivo previo al manifiesto se adopta si es un ZIP íntegro; uno truncado,
+    modificado o publicado en otra URL se vuelve a descargar.
+    """
+    if not os.path.exists(filepath):
         return False
 
+    entry = manifest['raw'].get(filename)
+    if entry is None:
+        if not zipfile.is_zipfile(filepath):
+            print(f"{filename} está incompleto o dañado. Se vuelve a descargar.")
+            return False
+        record_file(manifest, 'raw', filename, filepath, url=url)
+        return True
 
-def get_possible_patterns(trim, year):
-    """Genera los patrones de nombre de archivo posibles para un trimestre."""
+    if not is_file_current(manifest, 'raw', filename, filepath):
+        print(f"{filename} no coincide con el manifiesto. Se vuelve a descargar.")
+        return False
+    if entry.get('url') != url:
+        print(f"{filename} fue publicado en una nueva URL. Se vuelve a descargar.")
+        return False
+    return True
 
-    # Mapeo de trimestres: numérico a abreviado con 'er/do/er/to'
-    trim_map = {
-        1: "1_Trim",    # EPH_usu_1_Trim_YYYY_txt.zip
-        2: "2_Trim",    # EPH_usu_2_Trim_YYYY_txt.zip
-        3: "3_Trim",    # EPH_usu_3_Trim_YYYY_txt.zip
-        4: "4_Trim"     # EPH_usu_4_Trim_YYYY_txt.zip
-    }
 
-    # Mapeo alternativo: numérico a abreviado con 'er/do/er/to'
-    trim_alt_map = {
-        1: "1erTrim",   # EPH_usu_1erTrim_YYYY_txt.zip
-        2: "2doTrim",   # EPH_usu_2doTrim_YYYY_txt.zip
-        3: "3erTrim",   # EPH_usu_3erTrim_YYYY_txt.zip
-        4: "4toTrim"    # EPH_usu_4toTrim_YYYY_txt.zip
-    }
+def print_download_summary(stats, wall_time):
+    """Imprime el throughput de cada descarga y el total de la corrida."""
+    if not stats:
+        return
 
-    trim_alt_alt_map = {
-        1: "1er_Trim",   # EPH_usu_1erTrim_YYYY_txt.zip
-        2: "2do_Trim",   # EPH_usu_2doTrim_YYYY_txt.zip
-        3: "3er_Trim",   # EPH_usu_3erTrim_YYYY_txt.zip
-        4: "4to_Trim"    # EPH_usu_4toTrim_YYYY_txt.zip
+    print("--- Resumen de descargas ---")
+    for s in sorted(stats, key=lambda s: s['archivo']):
+        mb = s['bytes'] / 1e6
+        speed = mb / s['segundos'] if s['segundos'] > 0 else float('inf')
+        resumed = " (reanudado)" if s['reanudado'] else ""
+        print(
+            f"{s['archivo']}: {mb:.2f} MB en {s['segundos']:.2f} s ({speed:.2f} MB/s){resumed}")
+
+    total_mb = sum(s['bytes'] for s in stats) / 1e6
+    transfer_time = sum(s['segundos'] for s in stats)
+    print(
+        f"Total: {total_mb:.2f} MB en {wall_time:.2f} s de reloj "
+        f"({transfer_time:.2f} s sumando cada transferencia)")
+
+
+def build_link_index(html):
+    """
+    Construye un dict {(año, trimestre): href} con todos los links de microdatos
+    de la página. Si un periodo aparece más de una vez, se conserva el primero.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    index = {}
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        if EPH_LINK_PATH not in href:
+            continue
+        match = LINK_PATTERN.search(href)
+        if match:
+            period = (int(match.group('year')), int(match.group('trim')))
+            index.setdefault(period, href)
+    return index
+
+
+def _load_listing_cache(cache_path, base_url):
+    """Lee el índice cacheado; devuelve None si no existe o corresponde a otra URL."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Advertencia: no se pudo leer la caché del listado ({e}).")
+        return None
+    if cache.get('url') != base_url:
+        return None
+    cache['links'] = {tuple(map(int, key.split('-'))): href
+                      for key, href in cache.get('links', {}).items()}
+    return cache
+
+
+def _save_listing_cache(cache_path, base_url, response, index):
+    """Guarda el índice y los validadores HTTP de la respuesta (escritura atómica)."""
+    cache = {
+        'url': base_url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'links': {f"{year}-{trim}": href for (year, trim), href in sorted(index.items())},
     }
+    tmp_path = cache_path + PARTIAL_SUFFIX
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, cache_path)
 
-    # 1. Patrón Estandarizado (e.g., _2_Trim_2020_txt.zip)
-    pattern_std = f"_{trim_map.get(trim)}_{year}_txt.zip"
-
-    # 2. Patrón Alternativo (e.g., _2doTrim_2016_txt.zip)
-    pattern_alt = f"_{trim_alt_map.get(trim)}_{year}_txt.zip"
 
-    pattern_alt_alt = f"_{trim_alt_alt_map.get(trim)}_{year}_txt.zip"
+def fetch_link_index(session, base_url, cache_path):
+    """
+    Devuelve el índice {(año, trimestre): href} de la página de microdatos.
 
-    # Retorna todos los posibles finales de la URL para este periodo
-    return [pattern_std, pattern_alt, pattern_alt_alt]
+    Hace un GET condicional (If-None-Match / If-Modified-Since) con los validadores
+    guardados: si el servidor responde 304 se reutiliza el índice en caché sin
+    descargar ni parsear la página. Devuelve None si no hay página ni caché.
+    """
+    cache = _load_listing_cache(cache_path, base_url)
 
+    headers = {}
+    if cache:
+        if cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        if cache.get('last_modified'):
+            headers['If-Modified-Since'] = cache['last_modified']
 
-def scrape_and_download(start_year=2016, end_year=2025):
-    """Busca, filtra y descarga los microdatos de EPH del INDEC."""
+    try:
+        with etapa('http', archivo='listado') as e:
+            response = session.get(base_url, timeout=15, headers=headers)
+            e.bytes = len(response.content)
+        if response.status_code == 304 and cache:
+            print("Listado sin cambios desde la última corrida (304). Usando caché.")
+            return cache['links']
+        response.raise_for_status()  # Verificar que la petición fue exitosa (código 200)
+    except requests.exceptions.RequestException as e:
+        print(f"Error al acceder a la URL base {base_url}: {e}")
+        if cache:
+            print("Usando el índice de la caché local.")
+            return cache['links']
+        return None
+
+    index = build_link_index(response.text)
+    _save_listing_cache(cache_path, base_url, response, index)
+    return index
+
+
+def scrape_and_download(start_year=2016, end_year=2025, workers=MAX_WORKERS,
+                        base_url=BASE_URL, target_dir=TARGET_DIR):
+    """
+    Busca, filtra y descarga los microdatos de EPH del INDEC.
+
+    Las descargas se ejecutan en un pool de 'workers' hilos que comparten una
+    única sesión HTTP. 'base_url' y 'target_dir' permiten apuntar el scraper a
+    un servidor local de prueba.
+    """
     print(f"--- Inicializando Scraper EPH ({start_year}-{end_year}) ---")
 
     # 1. Preparación del Entorno
-    if not os.path.exists(TARGET_DIR):
-        os.makedirs(TARGET_DIR)
-        print(f"Directorio de destino creado: {TARGET_DIR}")
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+        print(f"Directorio de destino creado: {target_dir}")
 
     # Generar la lista de períodos a buscar
     target_periods = generate_eph_periods(start_year, end_year)
+    session = create_session(workers)
 
-    # 2. Petición y Parseo
-    try:
-        response = requests.get(BASE_URL, timeout=15)
-        response.raise_for_status()  # Verificar que la petición fue exitosa (código 200)
-    except requests.exceptions.RequestException as e:
-        print(f"Error al acceder a la URL base {BASE_URL}: {e}")
+    # 2. Petición (condicional) y Parseo del listado
+    cache_path = os.path.join(target_dir, LISTING_CACHE_FILENAME)
+    link_index = fetch_link_index(session, base_url, cache_path)
+    if link_index is None:
+        session.close()
         return
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    all_links = soup.find_all('a')
-    downloaded_count = 0
+    manifest_path = os.path.join(target_dir, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+    pending = []
 
-    # 3. Filtrado y Descarga
+    # 3. Búsqueda de cada periodo en el índice
     for year, trim in target_periods:
-        # Generar el patrón de nombre de archivo esperado para el periodo actual
-        # Ejemplo de patrón: EPH_usu_1_Trim_2025_txt.zip
-        expected_filename_part = get_possible_patterns(trim, year)
-
-        found_link = None
-
-        for link in all_links:
-            href = link.get('href', '')
-
-            # Criterios de filtrado:
-            # a) El enlace debe apuntar al formato zip de txt
-            # b) El enlace debe contener el año y trimestre que buscamos
-            # c) El enlace debe empezar con el patrón conocido (opcional pero bueno para seguridad)
-            if any(href.endswith(p) for p in expected_filename_part):
-                if ("/ftp/cuadros/menusuperior/eph/" in href):
-
-                    # Se encontró el link exacto para el periodo
-                    found_link = href
-                    break
+        found_link = link_index.get((year, trim))
 
         if found_link:
             # Construir la URL completa y la ruta de guardado
             standardized_filename = f"EPH_T{trim}_{year}_txt.zip"
-            full_url = urljoin(BASE_URL, found_link)
-            filepath = os.path.join(TARGET_DIR, standardized_filename)
+            full_url = urljoin(base_url, found_link)
+            filepath = os.path.join(target_dir, standardized_filename)
 
-            if not os.path.exists(filepath):
-                if download_file(full_url, filepath):
-                    downloaded_count += 1
-            else:
+            if is_download_current(manifest, standardized_filename, filepath, full_url):
                 print(f"{standardized_filename} ya existe. Saltando descarga.")
+            else:
+                pending.append((full_url, filepath))
         else:
             print(
                 f"Advertencia: No se encontró el archivo TXT para el T{trim}/{year}.")
 
-    print(f"--- Finalizado. Archivos descargados: {downloaded_count} ---")
+    # 4. Descarga concurrente
+    stats = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(download_file, url, path, session): (url, path)
+                   for url, path in pending}
+        for future in as_completed(futures):
+            url, path = futures[future]
+            try:
+                result = future.result()
+                if not result:
+                    continue
+                if not zipfile.is_zipfile(path):
+                    # Se descarta para que la próxima corrida lo vuelva a bajar
+                    print(f"Advertencia: {result['archivo']} no es un ZIP válido.")
+                    os.remove(path)
+                    continue
+                record_file(manifest, 'raw', result['archivo'], path, url=url)
+            except (requests.exceptions.RequestException, OSError) as e:
+                # Un archivo con problemas (disco, permisos) no corta el resto de las descargas
+                print(f"Error al guardar {os.path.basename(path)}: {e}")
+                continue
+            stats.append(result)
+    session.close()
+    save_manifest(manifest, manifest_path)
+
+    print_download_summary(stats, time.perf_counter() - start)
+    print(f"--- Finalizado. Archivos descargados: {len(stats)} ---")
 
 
 if __name__ == '__main__':
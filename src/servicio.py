@@ -0,0 +1,341 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+import panel
+from utils import SANITIZED_DIR, START_YEAR, END_YEAR, AGLOMERADOS_INTERES
+from evolucion_media import grupos_de_edad
+
+# --- Configuración ---
+# Servicio HTTP local de indicadores: carga el panel (ver panel.py) una sola vez y
+# guarda en una caché LRU las tablas ya calculadas, con clave (indicador,
+# aglomerados, rango de periodos, apertura). Cada cierto intervalo revisa el almacén
+# sanitizado; si cambió, rearma el panel, lo vuelve a abrir y vacía la caché.
+#   GET /indicadores                     indicadores y aperturas disponibles
+#   GET /indicador/{nombre}?aglomerados=31,32&desde=2019-1&hasta=2020-4
+#                          &apertura=sexo&formato=json|csv
+#   GET /estado                          panel cargado y uso de la caché
+HOST = '127.0.0.1'
+PUERTO = 8765
+CACHE_MAX_ENTRADAS = 128
+# Segundos entre revisiones del almacén sanitizado
+INTERVALO_RECARGA = 5.0
+
+INDICADORES = {
+    'tasas_laborales': panel.tasas_empleo,
+    'media_ingreso_real': panel.media_ingreso_real,
+    'media_ipcf_real': panel.media_ipcf_real,
+}
+# Aperturas (claves extra de agrupación); por ahora solo las admiten las tasas laborales
+APERTURAS = {
+    'sexo': 'CH04',
+    'edad': grupos_de_edad,
+    'nivel_educativo': 'NIVEL_ED',
+}
+INDICADORES_CON_APERTURA = ('tasas_laborales',)
+
+RESPUESTAS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+              405: 'Method Not Allowed', 500: 'Internal Server Error',
+              503: 'Service Unavailable'}
+
+
+class ErrorConsulta(Exception):
+    """Consulta inválida: se responde con 'estado' y el mensaje."""
+
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def firma_almacen(sanitized_dir=SANITIZED_DIR):
+    """
+    Firma barata del almacén sanitizado: ruta, tamaño y mtime de cada partición. Si
+    cambia, algún trimestre se volvió a sanitizar.
+    """
+    firma = []
+    for raiz, _, archivos in os.walk(sanitized_dir):
+        for nombre in archivos:
+            if nombre.endswith('.tmp'):
+                continue
+            try:
+                stat = os.stat(os.path.join(raiz, nombre))
+            except FileNotFoundError:
+                # Partición reemplazada mientras se recorría el almacén
+                continue
+            firma.append((os.path.relpath(os.path.join(raiz, nombre), sanitized_dir),
+                          stat.st_size, stat.st_mtime_ns))
+    return hash(tuple(sorted(firma)))
+
+
+def _periodo(texto, nombre):
+    """Convierte 'AAAA-T' en (año, trimestre)."""
+    try:
+        ano, trim = (int(v) for v in texto.split('-'))
+    except ValueError:
+        raise ErrorConsulta(f"'{nombre}' debe tener la forma AAAA-T (p. ej. 2020-1).")
+    if trim not in (1, 2, 3, 4):
+        raise ErrorConsulta(f"Trimestre inválido en '{nombre}': {trim}.")
+    return ano, trim
+
+
+def clave_consulta(nombre, parametros):
+    """
+    Normaliza una consulta en la clave de la caché:
+    (indicador, aglomerados, desde, hasta, apertura).
+    """
+    if nombre not in INDICADORES:
+        raise ErrorConsulta(f"Indicador desconocido: {nombre}.", 404)
+
+    aglomerados = parametros.get('aglomerados')
+    if aglomerados:
+        try:
+            aglomerados = tuple(sorted({int(a) for a in aglomerados.split(',') if a}))
+        except ValueError:
+            raise ErrorConsulta("'aglomerados' debe ser una lista de códigos separados por coma.")
+    else:
+        aglomerados = tuple(sorted(AGLOMERADOS_INTERES))
+
+    desde = _periodo(parametros['desde'], 'desde') if parametros.get('desde') else None
+    hasta = _periodo(parametros['hasta'], 'hasta') if parametros.get('hasta') else None
+
+    apertura = parametros.get('apertura') or None
+    if apertura is not None:
+        if apertura not in APERTURAS:
+            raise ErrorConsulta(f"Apertura desconocida: {apertura}. "
+                                f"Opciones: {', '.join(APERTURAS)}.")
+        if nombre not in INDICADORES_CON_APERTURA:
+            raise ErrorConsulta(f"El indicador {nombre} no admite aperturas.")
+    return nombre, aglomerados, desde, hasta, apertura
+
+
+class ServicioIndicadores:
+    """Panel abierto, caché LRU de tablas calculadas y recarga ante cambios del almacén."""
+
+    def __init__(self, years=None, panel_dir=panel.PANEL_DIR, max_entradas=CACHE_MAX_ENTRADAS):
+        self.years = years
+        self.panel_dir = panel_dir
+        self.max_entradas = max_entradas
+        self.panel = None
+        self.firma = None
+        self.version = 0
+        self.cargado = None
+        self._cache = OrderedDict()
+        self._en_curso = {}
+        self._aciertos = 0
+        self._fallos = 0
+        self._lock = threading.Lock()
+
+    # --- Panel ---
+
+    def cargar_panel(self):
+        """
+        Rearma el panel si el almacén cambió, lo abre y vacía la caché. Las versiones
+        anteriores del panel se borran después de soltar sus memmaps; si una consulta
+        en curso todavía usa alguna, se borra en la próxima recarga.
+        """
+        firma = firma_almacen()
+        kwargs = {'years': self.years} if self.years is not None else {}
+        if panel.construir_panel(panel_dir=self.panel_dir, limpiar=False, **kwargs) is None:
+            return False
+        datos = panel.abrir_panel(self.panel_dir)
+        if datos is None:
+            return False
+        with self._lock:
+            anterior, self.panel = self.panel, datos
+            self.firma = firma
+            self.version += 1
+            self.cargado = time.time()
+            self._cache.clear()
+        del anterior
+        panel.limpiar_versiones(self.panel_dir)
+        print(f"--- Panel v{self.version} cargado: {len(datos)} filas ---")
+        return True
+
+    # --- Indicadores ---
+
+    def calcular(self, clave):
+        """Calcula la tabla de una consulta sobre el panel actual."""
+        nombre, aglomerados, desde, hasta, apertura = clave
+        datos = self.panel
+        if datos is None:
+            raise ErrorConsulta("El panel todavía no está cargado.", 503)
+
+        periodos = None
+        if desde is not None or hasta is not None:
+            periodos = [(ano, trim) for ano, trim, *_ in datos.meta['tramos']
+                        if (desde is None or (ano, trim) >= desde)
+                        and (hasta is None or (ano, trim) <= hasta)]
+        seleccion = datos.seleccionar(aglomerados=aglomerados, periodos=periodos)
+        if len(seleccion) == 0:
+            raise ErrorConsulta("No hay datos para los aglomerados y periodos pedidos.", 404)
+
+        if apertura is not None:
+            return INDICADORES[nombre](seleccion, claves_extra=[APERTURAS[apertura]])
+        return INDICADORES[nombre](seleccion)
+
+    async def obtener(self, clave):
+        """
+        Tabla de la consulta desde la caché LRU o calculada en un hilo (sin bloquear
+        el bucle). Consultas iguales simultáneas esperan el mismo cálculo.
+        """
+        with self._lock:
+            if clave in self._cache:
+                self._cache.move_to_end(clave)
+                self._aciertos += 1
+                return self._cache[clave]
+            self._fallos += 1
+            version = self.version
+
+        futuro = self._en_curso.get(clave)
+        if futuro is None:
+            futuro = asyncio.get_running_loop().run_in_executor(None, self.calcular, clave)
+            self._en_curso[clave] = futuro
+            try:
+                tabla = await futuro
+            finally:
+                del self._en_curso[clave]
+            with self._lock:
+                # Si el panel se recargó mientras se calculaba, la tabla no se guarda
+                if version == self.version:
+                    self._cache[clave] = tabla
+                    if len(self._cache) > self.max_entradas:
+                        self._cache.popitem(last=False)
+            return tabla
+        return await futuro
+
+    def estado(self):
+        with self._lock:
+            periodos = sorted({(ano, trim) for ano, trim, *_ in self.panel.meta['tramos']}) \
+                if self.panel is not None else []
+            return {
+                'version_panel': self.version,
+                'filas': len(self.panel) if self.panel is not None else 0,
+                'cargado': self.cargado,
+                'periodos': [f"{ano}-{trim}" for ano, trim in periodos],
+                'cache': {'entradas': len(self._cache), 'max_entradas': self.max_entradas,
+                          'aciertos': self._aciertos, 'fallos': self._fallos},
+            }
+
+    async def vigilar_almacen(self, intervalo=INTERVALO_RECARGA):
+        """
+        Revisa el almacén cada 'intervalo' segundos y recarga el panel si cambió. Se
+        espera a que la firma se repita en dos revisiones seguidas, así no se recarga
+        en medio de una sanitización.
+        """
+        loop = asyncio.get_running_loop()
+        anterior = self.firma
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                firma = await loop.run_in_executor(None, firma_almacen)
+                if firma != self.firma and firma == anterior:
+                    print("--- Cambió el almacén sanitizado: recargando el panel ---")
+                    await loop.run_in_executor(None, self.cargar_panel)
+                anterior = firma
+            except Exception as e:
+                print(f"ERROR al recargar el panel: {e}")
+
+    # --- HTTP ---
+
+    async def responder(self, metodo, ruta):
+        """Devuelve (estado, tipo de contenido, cuerpo) de una solicitud."""
+        if metodo != 'GET':
+            raise ErrorConsulta("Solo se admite GET.", 405)
+        partes = urlsplit(ruta)
+        parametros = {k: v[-1] for k, v in parse_qs(partes.query).items()}
+        segmentos = [s for s in partes.path.split('/') if s]
+
+        if segmentos == ['indicadores']:
+            cuerpo = {'indicadores': list(INDICADORES), 'aperturas': list(APERTURAS),
+                      'indicadores_con_apertura': list(INDICADORES_CON_APERTURA)}
+            return 200, 'application/json', json.dumps(cuerpo)
+        if segmentos == ['estado']:
+            return 200, 'application/json', json.dumps(self.estado())
+        if len(segmentos) != 2 or segmentos[0] != 'indicador':
+            raise ErrorConsulta(f"Ruta desconocida: {partes.path}.", 404)
+
+        formato = parametros.get('formato', 'json')
+        if formato not in ('json', 'csv'):
+            raise ErrorConsulta("'formato' debe ser json o csv.")
+        tabla = await self.obtener(clave_consulta(segmentos[1], parametros))
+        if formato == 'csv':
+            return 200, 'text/csv; charset=utf-8', tabla.to_csv(index=False)
+        return 200, 'application/json', tabla.to_json(orient='records')
+
+    async def atender(self, reader, writer):
+        """Atiende una conexión HTTP/1.1 (una solicitud por conexión)."""
+        inicio = time.perf_counter()
+        metodo, ruta = '-', '-'
+        try:
+            linea = (await reader.readline()).decode('latin-1').split()
+            # Los encabezados no se usan, pero hay que consumirlos
+            while (await reader.readline()).strip():
+                pass
+            if len(linea) < 2:
+                raise ErrorConsulta("Solicitud mal formada.")
+            metodo, ruta = linea[0], linea[1]
+            estado, tipo, cuerpo = await self.responder(metodo, ruta)
+        except ErrorConsulta as e:
+            estado, tipo, cuerpo = e.estado, 'application/json', json.dumps({'error': str(e)})
+        except Exception as e:
+            print(f"ERROR al atender {ruta}: {e}")
+            estado, tipo, cuerpo = 500, 'application/json', json.dumps({'error': str(e)})
+
+        datos = cuerpo.encode('utf-8')
+        encabezado = (f"HTTP/1.1 {estado} {RESPUESTAS[estado]}\r\n"
+                      f"Content-Type: {tipo}\r\n"
+                      f"Content-Length: {len(datos)}\r\n"
+                      "Connection: close\r\n\r\n")
+        try:
+            writer.write(encabezado.encode('latin-1') + datos)
+            await writer.drain()
+        finally:
+            writer.close()
+        print(f"{metodo} {ruta} {estado} ({(time.perf_counter() - inicio) * 1000:.1f} ms)")
+
+
+async def _servir(servicio, host, puerto, intervalo):
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, servicio.cargar_panel):
+        print("ERROR: No se pudo cargar el panel. Sanitice los datos antes de iniciar el servicio.")
+        return
+    servidor = await asyncio.start_server(servicio.atender, host, puerto)
+    vigilancia = asyncio.create_task(servicio.vigilar_almacen(intervalo))
+    print(f"--- Servicio de indicadores en http://{host}:{puerto} ---")
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        vigilancia.cancel()
+
+
+def servir(host=HOST, puerto=PUERTO, years=None, intervalo=INTERVALO_RECARGA,
+           max_entradas=CACHE_MAX_ENTRADAS):
+    """Inicia el servicio hasta que se interrumpa con Ctrl+C."""
+    servicio = ServicioIndicadores(years=years, max_entradas=max_entradas)
+    try:
+        asyncio.run(_servir(servicio, host, puerto, intervalo))
+    except KeyboardInterrupt:
+        print("--- Servicio detenido ---")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Servicio HTTP local de indicadores EPH con caché en memoria.")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PUERTO)
+    parser.add_argument('--start-year', type=int, default=START_YEAR)
+    parser.add_argument('--end-year', type=int, default=END_YEAR)
+    parser.add_argument('--interval', type=float, default=INTERVALO_RECARGA,
+                        help="Segundos entre revisiones del almacén sanitizado.")
+    parser.add_argument('--cache-size', type=int, default=CACHE_MAX_ENTRADAS,
+                        help="Tablas calculadas que se guardan en memoria.")
+    args = parser.parse_args()
+
+    servir(host=args.host, puerto=args.port, years=range(args.start_year, args.end_year + 1),
+           intervalo=args.interval, max_entradas=args.cache_size)
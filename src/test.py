@@ -1,33 +1,22 @@
-import pandas as pd
-import os
+from utils import load_sanitized_eph_data
+from varianza_bootstrap import tasas_empleo_bootstrap, CLAVES_HOGAR
 
 # --- Configuración ---
-SANITIZED_DIR = './data/data_sanitized'
-AGLOMERADOS_INTERES = [31, 32]  # Asumimos que incluiste CABA (01)
-AGLOMERADOS_STR = "_".join(map(str, AGLOMERADOS_INTERES))
-
 # Definimos el periodo y el aglomerado de interés
 TARGET_YEAR = 2020
 TARGET_TRIMESTER = 1
 CABA_CODE = 32  # Código de Aglomerado para CABA
+TASA_INDEC = 53.00  # Tasa de Empleo de mujeres en CABA según el informe de prensa
 
 
 def load_caba_2020_t1_data():
-    """Carga el archivo CSV filtrado para el T1/2020."""
-    filename = f"EPH_T{TARGET_TRIMESTER}_{TARGET_YEAR}_AGLOS_{AGLOMERADOS_STR}.csv"
-    filepath = os.path.join(SANITIZED_DIR, filename)
-
-    if os.path.exists(filepath):
-        try:
-            df = pd.read_csv(filepath, low_memory=False)
-            return df
-        except Exception as e:
-            print(f"Error al cargar el archivo: {e}")
-            return None
-    else:
-        print(
-            f"ERROR: Archivo no encontrado. Asegúrese de que {filename} existe en {SANITIZED_DIR}.")
-        return None
+    """Carga solo las filas de CABA del T1/2020 y las columnas necesarias, ya tipadas."""
+    return load_sanitized_eph_data(
+        columns=['ANO4', 'TRIMESTRE', 'AGLOMERADO', 'PONDERA', 'CH04', 'CH06', 'ESTADO']
+        + CLAVES_HOGAR,
+        years=[TARGET_YEAR],
+        trimesters=[TARGET_TRIMESTER],
+        aglomerados=[CABA_CODE])
 
 
 def calculate_employment_rate_caba_women():
@@ -37,12 +26,7 @@ def calculate_employment_rate_caba_women():
     if df is None:
         return None
 
-    # Aseguramos que las columnas clave sean numéricas (para sumar)
-    # y manejamos posibles errores de tipo introducidos al guardar en CSV
-    df['PONDERA'] = pd.to_numeric(df['PONDERA'], errors='coerce')
-    df['CH04'] = pd.to_numeric(df['CH04'], errors='coerce')
-    df['ESTADO'] = pd.to_numeric(df['ESTADO'], errors='coerce')
-    df['AGLOMERADO'] = pd.to_numeric(df['AGLOMERADO'], errors='coerce')
+    # Las columnas clave ya vienen numéricas (EPH_SCHEMA), no hace falta convertirlas
 
     # --- A. Filtrado de la Población de Referencia ---
 
@@ -78,14 +62,25 @@ def calculate_employment_rate_caba_women():
             f"Población Total de Mujeres (estimada): {poblacion_total_mujeres:,.0f}")
         print(
             f"Tasa de Empleo (TE) Mujeres CABA T1/2020: **{tasa_empleo:.2f}%**")
+
+        # Error muestral con réplicas bootstrap (hogares remuestreados en el aglomerado)
+        df_ic = tasas_empleo_bootstrap(df, aglomerado=CABA_CODE, claves_extra=['CH04'])
+        ic = df_ic[df_ic['CH04'] == 2].iloc[0]
+        print(
+            f"Error estándar (bootstrap): {ic['Tasa_Empleo_EE']:.2f} puntos")
+        print(
+            f"Intervalo de confianza 95%: [{ic['Tasa_Empleo_LI']:.2f}%, {ic['Tasa_Empleo_LS']:.2f}%]")
         print(
-            f"Tasa de Empleo (TE) Mujeres CABA T1/2020 segun informe de prensa del INDEC: {53.00}%")
+            f"Tasa de Empleo (TE) Mujeres CABA T1/2020 segun informe de prensa del INDEC: {TASA_INDEC}%")
+        dentro = ic['Tasa_Empleo_LI'] <= TASA_INDEC <= ic['Tasa_Empleo_LS']
         print(
-            f"Margen de error: **{abs(53.00 - tasa_empleo):.5f}%**")
+            f"Diferencia con el INDEC: {TASA_INDEC - tasa_empleo:+.2f} puntos "
+            f"({'dentro' if dentro else 'fuera'} del intervalo de confianza)")
         return tasa_empleo
     else:
         print("ERROR: La Población Total de Mujeres en CABA es cero. Verifique los códigos de aglomerado/sexo.")
         return 0
 
 
-calculate_employment_rate_caba_women()
+if __name__ == '__main__':
+    calculate_employment_rate_caba_women()
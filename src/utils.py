@@ -1,27 +1,36 @@
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
+import threading
+from types import MappingProxyType
+import pyarrow as pa
+import pyarrow.parquet as pq
 from itertools import product
+from concurrent.futures import ThreadPoolExecutor
+
+from schema import EPH_SCHEMA, apply_eph_schema, concat_eph
+from instrumentacion import etapa
 
 
 # --- Configuración ---
-# Directorio donde se encuentran los archivos CSV filtrados
+# Almacén de datos sanitizados: el sanitizador guarda cada trimestre nacional completo,
+# particionado por base, año, trimestre y aglomerado:
+#   {SANITIZED_DIR}/{base}/ANO4={año}/TRIMESTRE={trim}/AGLOMERADO={código}/datos.parquet
+# (o datos.csv). La carga abre solo las particiones pedidas.
 SANITIZED_DIR = './data/data_sanitized'
+BASES_EPH = ('personas', 'hogar')
+ARCHIVO_PARTICION = 'datos'
 # Definimos el rango de años que ya hemos procesado
 START_YEAR = 2016
 END_YEAR = 2025
 
-# Los mismos códigos usados para nombrar los archivos (deben coincidir)
+# Aglomerados del informe: los que se cargan por defecto (único lugar donde se definen)
 AGLOMERADOS_INTERES = [31, 32]
 # 32 CABA
 # 31 USUHAIA
-AGLOMERADOS_STR = "_".join(map(str, AGLOMERADOS_INTERES))
-# Nombre de archivo estandarizado: EPH_T{trim}_YYYY_AGLOS_{codes}.csv
-
-# Configuración inicial de visualización
-sns.set_style("whitegrid")
-plt.rcParams['figure.figsize'] = (12, 7)
+# Si existen ambos formatos para una partición se prefiere Parquet (ya viene tipado)
+SANITIZED_FORMATS = ('parquet', 'csv')
+# Hilos para leer particiones en paralelo (la lectura de Parquet/CSV libera el GIL)
+LOAD_WORKERS = min(8, os.cpu_count() or 1)
 
 
 TRIMESTRES_POR_MES = {
@@ -30,55 +39,196 @@ TRIMESTRES_POR_MES = {
     3: ["jul", "aug", "sep"],
     4: ["oct", "nov", "dec"],
 }
+# Índice inverso mes -> trimestre para asignar trimestres de forma vectorizada
+MES_A_TRIMESTRE = {mes: trimestre
+                   for trimestre, meses in TRIMESTRES_POR_MES.items() for mes in meses}
+
+# --- IPC y deflactores ---
+IPC_FILEPATH = './data/ipc.csv'
+# Periodo base (año, trimestre) de los deflactores: los ingresos quedan a precios de ese trimestre
+BASE_DEFLACTOR = (2025, 1)
+
+# Caché de proceso de get_tabla_deflactores: {(ruta, base): (firma_del_archivo, tabla)}
+_deflactores_cache = {}
+_deflactores_lock = threading.Lock()
+
+
+def read_sanitized_table(filepath, columns=None, aglomerados=None):
+    """
+    Lee un archivo sanitizado (Parquet o CSV) como tabla Arrow tipada según EPH_SCHEMA.
+
+    'columns' limita las columnas leídas (las que el archivo no tenga se ignoran) y
+    'aglomerados' filtra las filas por AGLOMERADO. En Parquet ambos se resuelven en
+    la lectura (proyección de columnas y filtro sobre los row groups); en CSV se usa
+    usecols y el filtro se aplica después de leer.
+    """
+    if filepath.endswith('.parquet'):
+        # Parquet conserva los tipos declarados al sanitizar
+        if columns is not None:
+            available = set(pq.read_schema(filepath).names)
+            columns = [c for c in columns if c in available]
+        filters = [('AGLOMERADO', 'in', list(aglomerados))] if aglomerados else None
+        return pq.read_table(filepath, columns=columns, filters=filters)
+
+    usecols = None
+    if columns is not None:
+        wanted = set(columns) | ({'AGLOMERADO'} if aglomerados else set())
+        usecols = wanted.__contains__
+
+    df = pd.read_csv(filepath, usecols=usecols, low_memory=False)
+    if aglomerados:
+        df = df[pd.to_numeric(df['AGLOMERADO'], errors='coerce').isin(aglomerados)]
+    if columns is not None:
+        df = df[[c for c in columns if c in df.columns]]
+    return pa.Table.from_pandas(apply_eph_schema(df), preserve_index=False)
+
+
+def eph_column_order(names, columns=None):
+    """
+    Orden estable de columnas del DataFrame cargado: el de 'columns' si se pidió;
+    si no, primero las de EPH_SCHEMA en el orden declarado y después el resto
+    en orden alfabético.
+    """
+    if columns is not None:
+        return [c for c in columns if c in names]
+    declared = [c for c in EPH_SCHEMA if c in names]
+    return declared + sorted(set(names) - set(declared))
+
+
+def directorio_trimestre(year, trim, base='personas', sanitized_dir=SANITIZED_DIR):
+    """Directorio de las particiones por aglomerado de un trimestre y una base."""
+    return os.path.join(sanitized_dir, base, f"ANO4={year}", f"TRIMESTRE={trim}")
+
+
+def clave_particion(filepath, sanitized_dir=SANITIZED_DIR):
+    """Clave de un archivo del almacén en el manifiesto: su ruta relativa con '/'."""
+    return os.path.relpath(filepath, sanitized_dir).replace(os.sep, '/')
+
+
+def aglomerados_del_trimestre(year, trim, base='personas'):
+    """Códigos de aglomerado con partición en el trimestre (lista vacía si no hay)."""
+    directorio = directorio_trimestre(year, trim, base)
+    if not os.path.isdir(directorio):
+        return []
+    return sorted(int(nombre.split('=', 1)[1]) for nombre in os.listdir(directorio)
+                  if nombre.startswith('AGLOMERADO='))
 
 
-def load_sanitized_eph_data():
+def find_sanitized_files(year, trim, base='personas', aglomerados=None):
     """
-    Carga todos los archivos CSV sanitizados del directorio en un único DataFrame.
+    Devuelve las rutas de las particiones del trimestre para los 'aglomerados'
+    pedidos (por defecto AGLOMERADOS_INTERES) que existan, en orden de código.
     """
-    all_data = []
+    aglomerados = AGLOMERADOS_INTERES if aglomerados is None else aglomerados
+    directorio = directorio_trimestre(year, trim, base)
+    filepaths = []
+    for aglomerado in sorted(set(aglomerados)):
+        for extension in SANITIZED_FORMATS:
+            filepath = os.path.join(directorio, f"AGLOMERADO={aglomerado}",
+                                    f"{ARCHIVO_PARTICION}.{extension}")
+            if os.path.exists(filepath):
+                filepaths.append(filepath)
+                break
+    return filepaths
 
+
+def load_sanitized_eph_data(columns=None, years=None, trimesters=None, aglomerados=None,
+                            workers=LOAD_WORKERS, periodos=None, base='personas'):
+    """
+    Carga los archivos sanitizados del directorio en un único DataFrame.
+
+    Los filtros son opcionales y deciden qué particiones se abren: 'years' y
+    'trimesters' (por defecto START_YEAR-END_YEAR, trimestres 1 a 4) y 'aglomerados'
+    (por defecto AGLOMERADOS_INTERES); 'columns' lee solo esas columnas. 'periodos'
+    (lista de (año, trimestre)) reemplaza a years/trimesters cuando se necesitan
+    trimestres sueltos. 'base' elige la base de personas (por defecto) o la de hogares.
+
+    Las particiones se leen en paralelo con 'workers' hilos como tablas Arrow; se
+    concatenan sin copiar y se convierten una sola vez a pandas liberando cada
+    columna Arrow al convertirla, así no conviven la copia por trimestre y la final.
+
+    El resultado tiene filas en orden (año, trimestre, aglomerado), columnas en el
+    orden de eph_column_order y los tipos de EPH_SCHEMA (int8/int16 para códigos, int32 para
+    ponderadores, float64 para ingresos, category para códigos de texto).
+
+    Una partición que no se puede leer se informa y se omite; sus trimestres quedan
+    en df.attrs['periodos_fallidos'] (ver periodos_fallidos) para que quien guarde
+    resultados no los tome como completos.
+    """
     print(f"--- Iniciando Carga Masiva desde: {SANITIZED_DIR} ---")
 
-    years = range(START_YEAR, END_YEAR + 1)
-    trimesters = [1, 2, 3, 4]
-    loaded_count = 0
-
-    for year, trim in product(years, trimesters):
-        # 1. Construir el nombre de archivo estandarizado
-        filename = f"EPH_T{trim}_{year}_AGLOS_31_32.csv"
-        filepath = os.path.join(SANITIZED_DIR, filename)
-
-        # 2. Verificar la existencia y cargar
-        if os.path.exists(filepath):
-            try:
-                # El archivo es un CSV limpio, la carga es simple y rápida
-                df = pd.read_csv(filepath, low_memory=False)
-                all_data.append(df)
-                loaded_count += 1
-                # print(f"Cargado: {filename}")
-            except Exception as e:
-                print(f"ERROR al cargar {filename}: {e}")
-        # else:
-            # print(f"Saltando: {filename} no encontrado.")
-
-    if not all_data:
+    years = range(START_YEAR, END_YEAR + 1) if years is None else years
+    trimesters = [1, 2, 3, 4] if trimesters is None else trimesters
+
+    # 1. Buscar las particiones de los trimestres y aglomerados pedidos
+    if periodos is None:
+        periodos = product(years, trimesters)
+    particiones = [(year, trim, f) for year, trim in periodos
+                   for f in find_sanitized_files(year, trim, base, aglomerados)]
+    fallidos = set()
+
+    def read(particion):
+        year, trim, filepath = particion
+        try:
+            with etapa('load', archivo=clave_particion(filepath)) as e:
+                table = read_sanitized_table(filepath, columns)
+                e.filas, e.bytes = table.num_rows, table.nbytes
+            return table
+        except Exception as e:
+            print(f"ERROR al cargar {clave_particion(filepath)}: {e}")
+            fallidos.add((year, trim))
+            return None
+
+    # 2. Leer en paralelo (map conserva el orden de las particiones)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        tables = [t for t in executor.map(read, particiones) if t is not None]
+    loaded_count = len(tables)
+
+    if not tables:
         print("ADVERTENCIA: No se encontró ningún archivo para cargar. Asegúrese de que el sanitizador se haya ejecutado.")
         return None
 
-    # 3. Concatenar todos los DataFrames
-    final_df = pd.concat(all_data, ignore_index=True)
+    # 3. Concatenar en Arrow (sin copia) y convertir una sola vez a pandas
+    names = set().union(*(t.column_names for t in tables))
+    order = eph_column_order(names, columns)
+    with etapa('concat', particiones=loaded_count) as e:
+        try:
+            table = pa.concat_tables(
+                [t.select([c for c in order if c in t.column_names]) for t in tables],
+                promote_options='permissive')
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Tipos incompatibles entre trimestres en columnas fuera del esquema
+            final_df = concat_eph([t.to_pandas() for t in tables])[order]
+        else:
+            tables.clear()
+            e.bytes = table.nbytes
+            final_df = table.to_pandas(self_destruct=True, split_blocks=True)
+            del table
+        e.filas = len(final_df)
+
+    final_df.attrs['periodos_fallidos'] = sorted(fallidos)
+    if fallidos:
+        print(f"ADVERTENCIA: {len(particiones) - loaded_count} particiones no se pudieron "
+              f"cargar; quedan incompletos {len(fallidos)} trimestres.")
     print(
-        f"--- Carga Finalizada. {loaded_count} trimestres cargados. Total de filas: {len(final_df)} ---")
+        f"--- Carga Finalizada. {loaded_count} particiones cargadas. Total de filas: {len(final_df)} ---")
 
     return final_df
 
 
-def cargar_df_ipc():
+def periodos_fallidos(*dfs):
+    """
+    Trimestres (año, trimestre) con alguna partición que no se pudo leer en las
+    cargas 'dfs' de load_sanitized_eph_data (se ignoran los None).
+    """
+    return sorted({tuple(p) for df in dfs if df is not None
+                   for p in df.attrs.get('periodos_fallidos', [])})
+
+
+def cargar_df_ipc(ipc_filepath=IPC_FILEPATH):
     """
     Carga el DataFrame del IPC desde el archivo CSV.
     """
-    ipc_filepath = './data/ipc.csv'
     if os.path.exists(ipc_filepath):
         try:
             df_ipc = pd.read_csv(ipc_filepath)
@@ -91,11 +241,11 @@ def cargar_df_ipc():
         return None
 
 
-def calcular_ipc_trimestral():
+def calcular_ipc_trimestral(ipc_filepath=IPC_FILEPATH):
     """
     Calcula el IPC trimestral a partir del DataFrame del IPC mensual.
     """
-    df_ipc = cargar_df_ipc()
+    df_ipc = cargar_df_ipc(ipc_filepath)
     if df_ipc is None:
         return None
 
@@ -103,18 +253,56 @@ def calcular_ipc_trimestral():
     df_ipc['ANIO'] = pd.to_numeric(df_ipc['ANIO'], errors='coerce')
     df_ipc['INDICE'] = pd.to_numeric(df_ipc['INDICE'], errors='coerce')
 
-    # Crear una columna de Trimestre basada en el Mes
-    df_ipc['TRIMESTRE'] = df_ipc['MES'].apply(get_trimestre)
+    # Crear una columna de Trimestre basada en el Mes (lookup vectorizado)
+    df_ipc['TRIMESTRE'] = df_ipc['MES'].str.strip().str.lower().map(MES_A_TRIMESTRE)
 
     # Agrupar por Año y Trimestre, y calcular el IPC promedio
     df_ipc_trimestral = df_ipc.groupby(
         ['ANIO', 'TRIMESTRE'], as_index=False)['INDICE'].mean()
+    df_ipc_trimestral['TRIMESTRE'] = df_ipc_trimestral['TRIMESTRE'].astype(int)
 
     return df_ipc_trimestral
 
 
+def get_tabla_deflactores(base=BASE_DEFLACTOR, ipc_filepath=IPC_FILEPATH):
+    """
+    Devuelve los deflactores trimestrales normalizados al periodo 'base' como un
+    mapeo de solo lectura {(año, trimestre): deflactor}.
+
+    La tabla se calcula una vez por proceso y se comparte entre módulos; se
+    recalcula solo si cambia el archivo del IPC (mtime o tamaño) o el periodo base.
+    Devuelve None si no hay IPC o si falta el periodo base.
+    """
+    if not os.path.exists(ipc_filepath):
+        print(f"ERROR: Archivo IPC no encontrado en {ipc_filepath}.")
+        return None
+
+    stat = os.stat(ipc_filepath)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (os.path.abspath(ipc_filepath), tuple(base))
+
+    with _deflactores_lock:
+        cached = _deflactores_cache.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        df_ipc = calcular_ipc_trimestral(ipc_filepath)
+        if df_ipc is None:
+            return None
+
+        indices = dict(zip(zip(df_ipc['ANIO'].astype(int), df_ipc['TRIMESTRE']),
+                           df_ipc['INDICE']))
+        base_ipc = indices.get(tuple(base))
+        if not base_ipc:
+            print(
+                f"ERROR: El IPC no tiene datos para el periodo base T{base[1]}/{base[0]}.")
+            return None
+
+        tabla = MappingProxyType({periodo: indice / base_ipc
+                                  for periodo, indice in indices.items()})
+        _deflactores_cache[key] = (signature, tabla)
+        return tabla
+
+
 def get_trimestre(mes):
-    for trimestre, meses in TRIMESTRES_POR_MES.items():
-        if mes.lower() in meses:
-            return trimestre
-    return None
+    return MES_A_TRIMESTRE.get(mes.lower())
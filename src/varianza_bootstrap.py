@@ -0,0 +1,269 @@
+import pandas as pd
+import numpy as np
+
+from utils import load_sanitized_eph_data
+from evolucion_media import COLUMNAS_TASAS, ponderadores_poblaciones
+from media_ingresos import COLUMNAS_INGRESOS, deflacionar_ingresos
+from estadisticas_ponderadas import CLAVES_GRUPO, CUANTILES_DECILES
+from hogares import CLAVES_HOGAR
+
+# --- Configuración ---
+# Estimación de errores muestrales con réplicas bootstrap: en cada estrato
+# (Año, Trimestre, Aglomerado) se remuestrean hogares con reposición (bootstrap
+# reescalado de Rao-Wu: n_h - 1 sorteos entre n_h hogares) y el ponderador de cada
+# persona (PONDERA, PONDIIO) se multiplica por el factor de réplica de su hogar.
+CLAVES_ESTRATO = CLAVES_GRUPO
+REPLICAS = 500
+NIVEL_CONFIANZA = 0.95
+# Semilla base: el factor de cada estrato depende solo de la semilla y del estrato, así
+# todas las funciones usan las mismas réplicas sobre el mismo DataFrame
+SEMILLA = 2016
+
+POBLACIONES = ['Total_PTR', 'Poblacion_Activa', 'Poblacion_Ocupada', 'Poblacion_Desocupada']
+TASAS = ['Tasa_Empleo', 'Tasa_Actividad', 'Tasa_Desocupacion']
+ESTADISTICAS_INGRESO = (['Media', 'Mediana'] + [f'Decil_{k}' for k in range(1, 10)] +
+                        ['Gini'] + [f'Participacion_D{k}' for k in range(1, 11)])
+
+
+def factores_replica(n_hogares, replicas, rng):
+    """
+    Matriz (hogares x réplicas + 1) de factores de réplica de un estrato. La columna 0
+    es la muestra completa (factor 1); en las demás cada hogar vale
+    (veces sorteado) * n_h / (n_h - 1), de modo que el total ponderado esperado no cambia.
+    """
+    factores = np.ones((n_hogares, replicas + 1))
+    if n_hogares > 1:
+        # Sorteos de todas las réplicas juntos; bincount cuenta las veces de cada hogar
+        sorteos = rng.integers(0, n_hogares, size=(replicas, n_hogares - 1))
+        sorteos += (np.arange(replicas) * n_hogares)[:, None]
+        veces = np.bincount(sorteos.ravel(), minlength=replicas * n_hogares)
+        factores[:, 1:] = veces.reshape(replicas, n_hogares).T * (n_hogares / (n_hogares - 1))
+    return factores
+
+
+def iterar_estratos(df, replicas=REPLICAS, semilla=SEMILLA):
+    """
+    Recorre los estratos (Año, Trimestre, Aglomerado) de df. Para cada uno devuelve
+    (clave del estrato, posiciones de sus filas, código de hogar de cada fila dentro
+    del estrato, matriz de factores de réplica por hogar).
+    """
+    codusu = df['CODUSU'].to_numpy()
+    nro_hogar = df['NRO_HOGAR'].to_numpy()
+    estratos = df.groupby(CLAVES_ESTRATO, sort=True, observed=True).indices
+
+    for clave, filas in estratos.items():
+        # Hogares ordenados por (CODUSU, NRO_HOGAR): el sorteo no depende del orden de df
+        hogar, hogares = pd.MultiIndex.from_arrays(
+            [codusu[filas], nro_hogar[filas]]).factorize(sort=True)
+        rng = np.random.default_rng([semilla, *(int(c) for c in clave)])
+        yield clave, filas, hogar, factores_replica(len(hogares), replicas, rng)
+
+
+def pesos_replica(df, ponderador='PONDERA', replicas=REPLICAS, semilla=SEMILLA):
+    """
+    Ponderadores de réplica de 'ponderador' como matriz (filas x réplicas), en el
+    orden de df. Ocupa filas * réplicas * 8 bytes: pensado para subconjuntos; las
+    funciones de intervalos trabajan estrato por estrato.
+    """
+    pesos = np.zeros((len(df), replicas))
+    ponderador = df[ponderador].to_numpy(dtype=np.float64)
+    for _, filas, hogar, factores in iterar_estratos(df, replicas, semilla):
+        pesos[filas] = ponderador[filas, None] * factores[hogar, 1:]
+    return pesos
+
+
+def resumir_replicas(replicas, nivel=NIVEL_CONFIANZA):
+    """
+    A partir de una matriz (grupos x réplicas + 1), con la estimación en la columna 0,
+    devuelve (estimación, error estándar, límite inferior, límite superior). Los
+    límites son los percentiles bootstrap de nivel 'nivel'.
+    """
+    alfa = (1 - nivel) / 2
+    estimacion = replicas[:, 0]
+    error_estandar = np.std(replicas[:, 1:], axis=1, ddof=1)
+    inferior, superior = np.percentile(replicas[:, 1:], [100 * alfa, 100 * (1 - alfa)], axis=1)
+    return estimacion, error_estandar, inferior, superior
+
+
+def agregar_intervalos(df_resultado, nombre, replicas, nivel=NIVEL_CONFIANZA):
+    """Agrega a df_resultado las columnas nombre, nombre_EE, nombre_LI y nombre_LS."""
+    estimacion, error_estandar, inferior, superior = resumir_replicas(replicas, nivel)
+    df_resultado[nombre] = estimacion
+    df_resultado[f'{nombre}_EE'] = error_estandar
+    df_resultado[f'{nombre}_LI'] = inferior
+    df_resultado[f'{nombre}_LS'] = superior
+
+
+def tasas_empleo_bootstrap(df, aglomerado=None, claves_extra=None, replicas=REPLICAS,
+                           nivel=NIVEL_CONFIANZA, semilla=SEMILLA):
+    """
+    TE, TA y TD por Año, Trimestre y Aglomerado (y 'claves_extra', como en
+    calcular_tasa_empleo_por_aglomerado) con error estándar e intervalo de confianza.
+
+    Requiere además CODUSU y NRO_HOGAR. En cada estrato se suman las poblaciones por
+    hogar y grupo, y las de todas las réplicas salen de un único producto matricial
+    (réplicas x hogares) @ (hogares x grupos*poblaciones).
+    """
+    pesos = ponderadores_poblaciones(aglomerado, df)[POBLACIONES].to_numpy(dtype=np.float64)
+
+    # Código de apertura de cada fila (0 si no hay aperturas; -1 si falta el valor)
+    claves_extra = list(claves_extra or [])
+    nombres_extra = [c if isinstance(c, str) else c.name for c in claves_extra]
+    if claves_extra:
+        grupo, aperturas = pd.MultiIndex.from_arrays(
+            [df[c] if isinstance(c, str) else c for c in claves_extra],
+            names=nombres_extra).factorize(sort=True)
+        n_grupos = len(aperturas)
+    else:
+        grupo, aperturas, n_grupos = np.zeros(len(df), dtype=np.int64), None, 1
+
+    claves, totales = [], []
+    for clave, filas, hogar, factores in iterar_estratos(df, replicas, semilla):
+        validas = grupo[filas] >= 0
+        celda = hogar[validas] * n_grupos + grupo[filas][validas]
+
+        # Poblaciones por (hogar, grupo): matriz hogares x (grupos * poblaciones)
+        por_hogar = np.column_stack([
+            np.bincount(celda, weights=pesos[filas[validas], k],
+                        minlength=factores.shape[0] * n_grupos)
+            for k in range(len(POBLACIONES))]).reshape(factores.shape[0], -1)
+
+        # Todas las réplicas a la vez: (réplicas + 1) x (grupos * poblaciones)
+        total = factores.T @ por_hogar
+        totales.append(total.reshape(replicas + 1, n_grupos, len(POBLACIONES)))
+        claves.append(clave)
+
+    if not totales:
+        return pd.DataFrame(columns=CLAVES_ESTRATO + nombres_extra + TASAS)
+
+    # grupos x poblaciones x réplicas
+    totales = np.concatenate(totales, axis=1).transpose(1, 2, 0)
+    ptr, activa, ocupada, desocupada = (totales[:, k] for k in range(len(POBLACIONES)))
+
+    df_resultado = pd.DataFrame(np.repeat(claves, n_grupos, axis=0), columns=CLAVES_ESTRATO)
+    if aperturas is not None:
+        df_extra = aperturas.to_frame(index=False, name=nombres_extra)
+        for nombre in nombres_extra:
+            df_resultado[nombre] = np.tile(df_extra[nombre].to_numpy(), len(claves))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tasas = {
+            'Tasa_Empleo': ocupada / ptr * 100,
+            'Tasa_Actividad': activa / ptr * 100,
+            # Sin población activa la TD es 0, como en calcular_tasa_empleo_por_aglomerado
+            'Tasa_Desocupacion': np.where(activa > 0, desocupada / activa * 100, 0.0),
+        }
+
+    # Solo los grupos con población de referencia en la muestra completa
+    con_ptr = ptr[:, 0] > 0
+    df_resultado = df_resultado[con_ptr].reset_index(drop=True)
+    for nombre in POBLACIONES:
+        df_resultado[nombre] = totales[con_ptr, POBLACIONES.index(nombre), 0]
+    for nombre, valores in tasas.items():
+        agregar_intervalos(df_resultado, nombre, valores[con_ptr], nivel)
+
+    df_resultado['PERIODO'] = df_resultado['ANO4'] + (df_resultado['TRIMESTRE'] - 1) / 4
+    return df_resultado
+
+
+def estadisticas_replicas(valores, pesos):
+    """
+    Estadísticas de ingreso de un grupo para todas las réplicas juntas. 'valores' son
+    los ingresos ordenados (n) y 'pesos' la matriz (n x réplicas) de ponderadores.
+    Mismas definiciones que estadisticas_ponderadas. Devuelve {estadística: arreglo}.
+    """
+    peso_total = pesos.sum(axis=0)
+    peso_acumulado = np.cumsum(pesos, axis=0)
+    ingreso = valores[:, None] * pesos
+    ingreso_total = ingreso.sum(axis=0)
+
+    resultado = {'Media': ingreso_total / peso_total}
+
+    # Cuantiles: primer valor cuyo peso acumulado alcanza q * peso total (por columna)
+    ultimo = len(valores) - 1
+    for k, q in enumerate(CUANTILES_DECILES, start=1):
+        posicion = (peso_acumulado < q * peso_total).sum(axis=0)
+        resultado[f'Decil_{k}'] = valores[np.minimum(posicion, ultimo)]
+    resultado['Mediana'] = resultado['Decil_5']
+
+    # Gini por el área bajo la curva de Lorenz
+    ingreso_acumulado = np.cumsum(ingreso, axis=0)
+    area = (pesos * (2 * ingreso_acumulado - ingreso)).sum(axis=0)
+    resultado['Gini'] = 1 - area / (peso_total * ingreso_total)
+
+    # Participación de cada decil de población en el ingreso
+    decil = np.clip(np.ceil(peso_acumulado / peso_total * 10 - 1e-9), 1, 10)
+    for k in range(1, 11):
+        resultado[f'Participacion_D{k}'] = \
+            np.where(decil == k, ingreso, 0).sum(axis=0) / ingreso_total * 100
+
+    return resultado
+
+
+def estadisticas_ingreso_bootstrap(df, columna='P21_REAL', ponderador='PONDIIO',
+                                   replicas=REPLICAS, nivel=NIVEL_CONFIANZA,
+                                   semilla=SEMILLA, solo_positivos=True):
+    """
+    Media, mediana, deciles, Gini y participación por decil de 'columna' por Año,
+    Trimestre y Aglomerado (como estadisticas_ingreso), con error estándar e
+    intervalo de confianza. Requiere además CODUSU y NRO_HOGAR.
+
+    Cada estrato se ordena una vez por ingreso y todas las réplicas se calculan sobre
+    la matriz (perceptores x réplicas) de ponderadores.
+    """
+    valores = df[columna].to_numpy(dtype=np.float64)
+    ponderadores = df[ponderador].to_numpy(dtype=np.float64)
+    validos = ~np.isnan(valores) & (ponderadores > 0)
+    if solo_positivos:
+        validos &= valores > 0
+
+    claves, por_estrato = [], []
+    for clave, filas, hogar, factores in iterar_estratos(df, replicas, semilla):
+        en_grupo = validos[filas]
+        if not en_grupo.any():
+            continue
+        filas, hogar = filas[en_grupo], hogar[en_grupo]
+        orden = np.argsort(valores[filas], kind='stable')
+        filas, hogar = filas[orden], hogar[orden]
+
+        pesos = ponderadores[filas, None] * factores[hogar]
+        por_estrato.append(estadisticas_replicas(valores[filas], pesos))
+        claves.append(clave)
+
+    df_resultado = pd.DataFrame(claves, columns=CLAVES_ESTRATO)
+    if not claves:
+        return df_resultado
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for nombre in ESTADISTICAS_INGRESO:
+            valores_replicas = np.vstack([e[nombre] for e in por_estrato])
+            agregar_intervalos(df_resultado, nombre, valores_replicas, nivel)
+    return df_resultado
+
+
+def intervalos_tasas_empleo(years=None, trimesters=None, aglomerados=None,
+                            claves_extra=None, replicas=REPLICAS, nivel=NIVEL_CONFIANZA):
+    """
+    Carga los trimestres pedidos y devuelve tasas_empleo_bootstrap sobre ellos.
+    'claves_extra' son nombres de columna (p. ej. ['CH04']).
+    """
+    columnas = COLUMNAS_TASAS + CLAVES_HOGAR + [c for c in (claves_extra or [])
+                                                if c not in COLUMNAS_TASAS]
+    df = load_sanitized_eph_data(columns=columnas, years=years, trimesters=trimesters,
+                                 aglomerados=aglomerados)
+    if df is None:
+        return None
+    return tasas_empleo_bootstrap(df, claves_extra=claves_extra, replicas=replicas,
+                                  nivel=nivel)
+
+
+def intervalos_ingreso_real(years=None, trimesters=None, aglomerados=None,
+                            replicas=REPLICAS, nivel=NIVEL_CONFIANZA):
+    """Carga y deflaciona los trimestres pedidos y devuelve estadisticas_ingreso_bootstrap."""
+    df = load_sanitized_eph_data(columns=COLUMNAS_INGRESOS + CLAVES_HOGAR, years=years,
+                                 trimesters=trimesters, aglomerados=aglomerados)
+    if df is None:
+        return None
+    df_defl = deflacionar_ingresos(df)
+    if df_defl is None:
+        return None
+    return estadisticas_ingreso_bootstrap(df_defl, replicas=replicas, nivel=nivel)
@@ -0,0 +1,118 @@
+import math
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from estadisticas_ponderadas import CUANTILES_DECILES, estadisticas_ingreso
+
+
+def referencia(valores, pesos, solo_positivos=True):
+    """Versión directa (un bucle sobre los datos ordenados) de estadisticas_ingreso para un grupo."""
+    datos = sorted((v, w) for v, w in zip(valores, pesos)
+                   if not math.isnan(v) and w > 0 and (v > 0 or not solo_positivos))
+    peso_total = sum(w for _, w in datos)
+    ingreso_total = sum(v * w for v, w in datos)
+
+    acumulados = []
+    acumulado = 0
+    for _, w in datos:
+        acumulado += w
+        acumulados.append(acumulado)
+
+    # Cuantil q: el primer valor cuyo peso acumulado alcanza q * peso total
+    deciles = []
+    for q in CUANTILES_DECILES:
+        objetivo = Fraction(q).limit_denominator(10) * Fraction(peso_total)
+        deciles.append(next(v for (v, _), a in zip(datos, acumulados) if a >= objetivo))
+
+    # Gini como diferencia media absoluta entre todos los pares
+    diferencias = sum(wi * wj * abs(vi - vj) for vi, wi in datos for vj, wj in datos)
+    gini = diferencias / (2 * peso_total * ingreso_total)
+
+    # Cada observación va al decil donde termina su peso acumulado
+    por_decil = [0.0] * 10
+    for (v, w), a in zip(datos, acumulados):
+        decil = min(max(math.ceil(Fraction(a) * 10 / Fraction(peso_total)), 1), 10)
+        por_decil[decil - 1] += v * w
+
+    return {
+        'Poblacion': peso_total,
+        'Media': ingreso_total / peso_total,
+        'Mediana': deciles[4],
+        **{f'Decil_{k + 1}': d for k, d in enumerate(deciles)},
+        'Gini': gini,
+        **{f'Participacion_D{k + 1}': p / ingreso_total * 100 for k, p in enumerate(por_decil)},
+    }
+
+
+def comparar(df, esperado_por_grupo, claves=('ANO4', 'TRIMESTRE', 'AGLOMERADO')):
+    resultado = estadisticas_ingreso(df, columna='P21_REAL', ponderador='PONDIIO')
+    assert len(resultado) == len(esperado_por_grupo)
+    for fila in resultado.itertuples(index=False):
+        esperado = esperado_por_grupo[tuple(getattr(fila, c) for c in claves)]
+        for indicador, valor in esperado.items():
+            assert getattr(fila, indicador) == pytest.approx(valor, rel=1e-9, abs=1e-9), indicador
+
+
+def datos(valores, pesos, aglomerado=32):
+    return pd.DataFrame({'ANO4': 2023, 'TRIMESTRE': 1, 'AGLOMERADO': aglomerado,
+                         'P21_REAL': np.asarray(valores, dtype=float),
+                         'PONDIIO': np.asarray(pesos, dtype=float)})
+
+
+def test_varios_grupos_contra_referencia():
+    rng = np.random.default_rng(7)
+    partes = []
+    esperado = {}
+    for aglomerado in (2, 13, 32):
+        n = int(rng.integers(50, 300))
+        valores = np.round(rng.lognormal(12, 0.8, n))
+        pesos = rng.integers(1, 3000, n).astype(float)
+        partes.append(datos(valores, pesos, aglomerado))
+        esperado[(2023, 1, aglomerado)] = referencia(valores, pesos)
+    # Filas mezcladas: el orden de entrada no debe importar
+    df = pd.concat(partes, ignore_index=True).sample(frac=1, random_state=1)
+    comparar(df, esperado)
+
+
+def test_empates_y_cortes_exactos():
+    # Pesos iguales y valores repetidos: los cortes caen justo sobre un peso acumulado
+    valores = [100, 100, 200, 200, 200, 300, 300, 400, 500, 500]
+    pesos = [1] * 10
+    comparar(datos(valores, pesos), {(2023, 1, 32): referencia(valores, pesos)})
+
+
+def test_cortes_exactos_con_valores_distintos():
+    # 0.3 * 10 no da exactamente 3 en punto flotante; el decil 3 debe ser el tercer valor
+    valores = list(range(1, 11))
+    pesos = [1] * 10
+    esperado = referencia(valores, pesos)
+    assert [esperado[f'Decil_{k}'] for k in range(1, 10)] == list(range(1, 10))
+    comparar(datos(valores, pesos), {(2023, 1, 32): esperado})
+
+
+def test_pesos_cero_y_nan_se_excluyen():
+    valores = [np.nan, 50, 100, 150, 0, -9, 200, 250]
+    pesos = [10, 0, 5, np.nan, 7, 3, 5, 10]
+    esperado = referencia(valores, [0 if np.isnan(w) else w for w in pesos])
+    assert esperado['Poblacion'] == 20
+    comparar(datos(valores, pesos), {(2023, 1, 32): esperado})
+
+
+def test_una_observacion():
+    resultado = estadisticas_ingreso(datos([1234.0], [10]))
+    fila = resultado.iloc[0]
+    assert fila['Media'] == fila['Mediana'] == fila['Decil_1'] == fila['Decil_9'] == 1234.0
+    assert fila['Gini'] == pytest.approx(0.0)
+    assert fila['Participacion_D10'] == pytest.approx(100.0)
+    assert fila[[f'Participacion_D{k}' for k in range(1, 10)]].sum() == 0
+
+
+def test_grupo_sin_observaciones_validas_no_aparece():
+    df = pd.concat([datos([100, 200], [1, 1], aglomerado=2),
+                    datos([np.nan, -9, 0], [1, 1, 1], aglomerado=3)], ignore_index=True)
+    resultado = estadisticas_ingreso(df)
+    assert resultado['AGLOMERADO'].tolist() == [2]
+    assert estadisticas_ingreso(datos([np.nan], [1])).empty
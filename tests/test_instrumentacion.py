@@ -0,0 +1,42 @@
+import pstats
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import instrumentacion
+from instrumentacion import ENV_PERFILADOR, ENV_PERFILAR, etapa, guardar_perfil
+
+
+@pytest.fixture
+def perfilar_load(monkeypatch):
+    monkeypatch.setenv(ENV_PERFILAR, 'load')
+    monkeypatch.setenv(ENV_PERFILADOR, 'cprofile')
+    instrumentacion._configurar_desde_entorno()
+    yield
+    monkeypatch.undo()
+    instrumentacion._configurar_desde_entorno()
+
+
+def trabajo():
+    return sum(range(10000))
+
+
+def test_perfila_la_etapa_en_los_hilos_de_un_pool(perfilar_load, tmp_path):
+    # Las etapas no se superponen (desde Python 3.12 cProfile admite un solo perfil
+    # activo a la vez), pero cada una corre en un hilo del pool
+    turno = threading.Lock()
+    hilos = set()
+
+    def leer(i):
+        with turno, etapa('load', archivo=i):
+            hilos.add(threading.get_ident())
+            return trabajo()
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(leer, range(8)))
+
+    path = guardar_perfil(str(tmp_path))
+    llamadas = {funcion[2]: datos[1] for funcion, datos in pstats.Stats(path).stats.items()}
+    assert llamadas['trabajo'] == 8
+    assert threading.main_thread().ident not in hilos
@@ -0,0 +1,105 @@
+import glob
+import os
+import tracemalloc
+import zipfile
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from datos_sinteticos import generar_trimestre
+from sanitize import BASES, get_data_file_name_from_zip, sanitize_member
+
+
+@pytest.fixture(scope='module')
+def zip_sintetico(tmp_path_factory):
+    """ZIP sintético chico (unas 2.500 personas) con las bases de personas y hogares."""
+    zip_path, _ = generar_trimestre(2019, 1, escala=0.05,
+                                    data_dir=str(tmp_path_factory.mktemp('raw')))
+    return zip_path
+
+
+def particiones(directorio):
+    return sorted(os.path.relpath(p, directorio)
+                  for p in glob.glob(os.path.join(directorio, '*', 'datos.*')))
+
+
+def comparar_particiones(streaming, completo):
+    assert particiones(streaming) == particiones(completo)
+    for particion in particiones(streaming):
+        esquema_streaming = pq.read_schema(os.path.join(streaming, particion))
+        esquema_completo = pq.read_schema(os.path.join(completo, particion))
+        assert esquema_streaming.equals(esquema_completo, check_metadata=False), particion
+
+        df_streaming = pd.read_parquet(os.path.join(streaming, particion))
+        df_completo = pd.read_parquet(os.path.join(completo, particion))
+        pd.testing.assert_series_equal(df_streaming.dtypes, df_completo.dtypes)
+        pd.testing.assert_frame_equal(df_streaming, df_completo)
+
+
+@pytest.mark.parametrize('base', list(BASES))
+def test_streaming_y_carga_completa_escriben_lo_mismo(zip_sintetico, tmp_path, base):
+    interno = get_data_file_name_from_zip(zip_sintetico, base)
+    streaming = str(tmp_path / 'streaming')
+    completo = str(tmp_path / 'completo')
+
+    # Bloques chicos para que cada aglomerado reciba filas de varios bloques
+    filas_streaming = sanitize_member(zip_sintetico, interno, streaming, 'parquet', chunksize=500)
+    filas_completo = sanitize_member(zip_sintetico, interno, completo, 'parquet', chunksize=None)
+
+    assert filas_streaming == filas_completo
+    comparar_particiones(streaming, completo)
+
+
+def test_streaming_usa_menos_memoria_que_la_carga_completa(zip_sintetico, tmp_path):
+    interno = get_data_file_name_from_zip(zip_sintetico, 'personas')
+
+    def pico(directorio, chunksize):
+        tracemalloc.start()
+        try:
+            assert sanitize_member(zip_sintetico, interno, str(tmp_path / directorio),
+                                   'parquet', chunksize=chunksize) is not None
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # Unas 2.400 personas: cinco bloques de 500 filas
+    pico_streaming = pico('streaming', 500)
+    pico_completo = pico('completo', None)
+    assert pico_streaming < 0.8 * pico_completo, (pico_streaming, pico_completo)
+
+
+def test_streaming_con_texto_despues_de_bloques_vacios(tmp_path):
+    # PP04B_ESP (fuera del esquema) viene vacía en los primeros bloques y con texto en
+    # el último; NIVEL_ED (entero del esquema) trae texto recién en el último bloque
+    filas = ['CODUSU;ANO4;TRIMESTRE;AGLOMERADO;PONDERA;PP04B_ESP;NIVEL_ED']
+    for i in range(20):
+        texto = 'ABC' if i >= 15 else ''
+        filas.append(f"C{i};2019;1;{32 if i % 2 else 33};100;{texto};{'X' if i >= 15 else 3}")
+    zip_path = str(tmp_path / 'EPH_usu_1_Trim_2019_txt.zip')
+    with zipfile.ZipFile(zip_path, 'w') as z:
+        z.writestr('usu_individual_T119.txt', '\n'.join(filas).encode('latin1'))
+
+    streaming = str(tmp_path / 'streaming')
+    completo = str(tmp_path / 'completo')
+    filas_streaming = sanitize_member(zip_path, 'usu_individual_T119.txt', streaming, 'parquet',
+                                      chunksize=5)
+    filas_completo = sanitize_member(zip_path, 'usu_individual_T119.txt', completo, 'parquet',
+                                     chunksize=None)
+
+    assert filas_streaming == filas_completo == (20, {32: 10, 33: 10})
+    comparar_particiones(streaming, completo)
+    df = pd.read_parquet(os.path.join(streaming, 'AGLOMERADO=32', 'datos.parquet'))
+    assert df['PP04B_ESP'].dtype == object
+    assert df['PP04B_ESP'].iloc[-1] == 'ABC'
+    assert df['NIVEL_ED'].dtype == 'float64'
+
+
+def test_streaming_tipa_columnas_fuera_del_esquema(zip_sintetico, tmp_path):
+    interno = get_data_file_name_from_zip(zip_sintetico, 'personas')
+    sanitize_member(zip_sintetico, interno, str(tmp_path), 'parquet', chunksize=500)
+
+    df = pd.read_parquet(glob.glob(str(tmp_path / '*' / 'datos.parquet'))[0])
+    for columna in ('P47T', 'CH03', 'CH07', 'PP04A', 'DECOCUR', 'DECIFR', 'DECCFR', 'H15'):
+        assert df[columna].dtype == 'float64', columna
+    assert df['CODUSU'].dtype == object
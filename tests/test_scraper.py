@@ -0,0 +1,115 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scraper import PARTIAL_META_SUFFIX, PARTIAL_SUFFIX, download_file
+
+CONTENIDO = bytes(range(256)) * 40
+ETAG = '"v2"'
+
+
+class ServidorEPH(BaseHTTPRequestHandler):
+    """Servidor de prueba con un único archivo. 'modo' define cómo responde a un Range."""
+    modo = 'normal'
+    pedidos = []
+
+    def do_GET(self):
+        rango = self.headers.get('Range')
+        type(self).pedidos.append((rango, self.headers.get('If-Range')))
+
+        if rango and self.modo == 'normal' and self.headers.get('If-Range') == ETAG:
+            inicio = int(rango[len('bytes='):-1])
+            self.responder(206, CONTENIDO[inicio:], f'bytes {inicio}-{len(CONTENIDO) - 1}')
+        elif (rango and self.modo == 'rango_malo') or self.modo == 'siempre_206':
+            # Un rango distinto del pedido: solo los primeros 500 bytes
+            self.responder(206, CONTENIDO[:500], f'bytes 0-499/{len(CONTENIDO)}')
+        else:
+            self.responder(200, CONTENIDO)
+
+    def responder(self, codigo, cuerpo, content_range=None):
+        self.send_response(codigo)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ServidorEPH)
+    hilo = threading.Thread(target=httpd.serve_forever, daemon=True)
+    hilo.start()
+    ServidorEPH.modo = 'normal'
+    ServidorEPH.pedidos = []
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/EPH_usu_1_Trim_2019_txt.zip'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def dejar_parcial(target, url, contenido, validador):
+    """Simula una descarga interrumpida: el parcial y su validador."""
+    with open(target + PARTIAL_SUFFIX, 'wb') as f:
+        f.write(contenido)
+    with open(target + PARTIAL_META_SUFFIX, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'validador': validador}, f)
+
+
+def leer(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_reanuda_un_parcial(servidor, tmp_path):
+    target = str(tmp_path / 'eph.zip')
+    dejar_parcial(target, servidor, CONTENIDO[:1000], ETAG)
+
+    stats = download_file(servidor, target)
+
+    assert stats['reanudado']
+    assert stats['bytes'] == len(CONTENIDO) - 1000
+    assert ServidorEPH.pedidos == [('bytes=1000-', ETAG)]
+    assert leer(target) == CONTENIDO
+    assert not os.path.exists(target + PARTIAL_SUFFIX)
+    assert not os.path.exists(target + PARTIAL_META_SUFFIX)
+
+
+def test_if_range_distinto_descarga_completo(servidor, tmp_path):
+    target = str(tmp_path / 'eph.zip')
+    # El parcial es de una versión anterior: el servidor responde 200 con el archivo nuevo
+    dejar_parcial(target, servidor, b'x' * 1000, '"v1"')
+
+    stats = download_file(servidor, target)
+
+    assert not stats['reanudado']
+    assert ServidorEPH.pedidos == [('bytes=1000-', '"v1"')]
+    assert leer(target) == CONTENIDO
+
+
+def test_206_de_otro_rango_reintenta_sin_range(servidor, tmp_path):
+    target = str(tmp_path / 'eph.zip')
+    ServidorEPH.modo = 'rango_malo'
+    dejar_parcial(target, servidor, CONTENIDO[:1000], ETAG)
+
+    stats = download_file(servidor, target)
+
+    assert not stats['reanudado']
+    assert ServidorEPH.pedidos == [('bytes=1000-', ETAG), (None, None)]
+    assert leer(target) == CONTENIDO
+
+
+def test_206_sin_pedir_rango_no_deja_un_archivo_truncado(servidor, tmp_path):
+    target = str(tmp_path / 'eph.zip')
+    ServidorEPH.modo = 'siempre_206'
+    dejar_parcial(target, servidor, CONTENIDO[:1000], ETAG)
+
+    assert download_file(servidor, target) is None
+    assert len(ServidorEPH.pedidos) == 2
+    assert not os.path.exists(target)